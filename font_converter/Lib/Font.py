@@ -1,21 +1,135 @@
 import os
+from typing import Dict, Iterable, List, Tuple
 
 from fontTools.pens.recordingPen import DecomposingRecordingPen
 from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.subset import Options, Subsetter
 from fontTools.ttLib.tables._f_v_a_r import NamedInstance
 from fontTools.ttLib.ttFont import TTFont, registerCustomTableClass
 
+from font_converter.Lib.archives import InMemoryFile, open_input
+from font_converter.Lib.coordinates import HAVE_NUMPY, decompose_glyph
+from font_converter.Lib.layout import optimize_layout
 from font_converter.Lib.tables.name import TableName
 
 registerCustomTableClass("name", "font_converter.Lib.tables.name", "TableName")
 
+# Tables recalculated from the other tables when the font is saved, that must always be compiled
+_RECALCULATED_TABLES = {"head", "hhea", "vhea", "maxp"}
+
+# Tables whose compiled data depends on other tables: if one of the keys is modified, its values are compiled too
+_DEPENDENT_TABLES = {"cmap": ("OS/2",), "glyf": ("loca",)}
+
+# Tables that don't reference glyph IDs, and can be written as they are even if the glyph order changed
+_GLYPH_INDEPENDENT_TABLES = {
+    "name",
+    "STAT",
+    "fvar",
+    "avar",
+    "MVAR",
+    "meta",
+    "gasp",
+    "CPAL",
+    "FFTM",
+    "PCLT",
+    "DSIG",
+    "cvt ",
+    "fpgm",
+    "prep",
+}
+
 
 class Font(TTFont):
-    def __init__(self, file, recalcTimestamp=False):
-        super().__init__(file=file, recalcTimestamp=recalcTimestamp)
+    def __init__(self, file, recalcTimestamp=False, fontNumber=-1):
+        super().__init__(
+            file=open_input(file) if isinstance(file, InMemoryFile) else file,
+            recalcTimestamp=recalcTimestamp,
+            fontNumber=fontNumber,
+        )
 
         self.file = file
         self.name_table: TableName = self["name"]
+        # Set by subset(): all the tables may have been changed by the Subsetter
+        self._is_subset = False
+        # Set by optimize_layout(): the layout tables that were replaced by their optimized version
+        self._optimized_tables = set()
+
+    def release_unmodified_tables(self, modified_tables: Iterable[str] = (), glyph_order_changed=False) -> List[str]:
+        """
+        Unloads the tables that were decompiled but not modified, so that save() writes their original data as it is
+        instead of compiling them again. This is faster for big layout tables, and guarantees that they are preserved
+        bit for bit. Tables recalculated on save (head, hhea, vhea, maxp) are always compiled.
+
+        Call it right before saving: unloaded tables are decompiled again from the original data if they are accessed.
+
+        :param modified_tables: The tags of the tables that were modified
+        :param glyph_order_changed: If True, only the tables that don't reference glyph IDs are unloaded
+        :return: The tags of the unloaded tables.
+        """
+        if self.reader is None or self._is_subset:
+            return []
+        modified_tables = set(modified_tables) | self._optimized_tables
+        for tag in list(modified_tables):
+            modified_tables.update(_DEPENDENT_TABLES.get(tag, ()))
+
+        released_tables = []
+        for tag in list(self.tables):
+            if tag in modified_tables or tag in _RECALCULATED_TABLES or tag not in self.reader:
+                continue
+            if glyph_order_changed and tag not in _GLYPH_INDEPENDENT_TABLES:
+                continue
+            del self.tables[tag]
+            released_tables.append(tag)
+        return released_tables
+
+    def subset(self, unicodes: Iterable[int] = None, layout_features: Iterable[str] = None) -> int:
+        """
+        Removes the glyphs that can't be reached from the given Unicode code points, following the substitutions of
+        the given layout features (GSUB closure) and the components of composite glyphs. Everything else is kept:
+        tables, hinting, glyph names, name records, and the .notdef glyph.
+
+        Call it before converting outlines or instancing, so that only the glyphs that are kept are processed.
+
+        :param unicodes: The code points to keep. If None, all the code points in the cmap table are kept, which is
+            useful to remove the glyphs only reachable from the layout features that are not kept
+        :param layout_features: The tags of the layout features to keep. If None, all features are kept
+        :return: The number of glyphs removed.
+        """
+        if unicodes is None:
+            unicodes = self.getBestCmap().keys()
+        options = Options()
+        options.drop_tables = []
+        options.passthrough_tables = True
+        options.layout_features = ["*"] if layout_features is None else list(layout_features)
+        options.name_IDs = ["*"]
+        options.name_legacy = True
+        options.name_languages = ["*"]
+        options.notdef_glyph = True
+        options.notdef_outline = True
+        options.glyph_names = True
+        options.legacy_cmap = True
+        options.symbol_cmap = True
+        options.legacy_kern = True
+
+        num_glyphs = len(self.getGlyphOrder())
+        subsetter = Subsetter(options=options)
+        subsetter.populate(unicodes=unicodes)
+        subsetter.subset(self)
+        self._is_subset = True
+        return num_glyphs - len(self.getGlyphOrder())
+
+    def optimize_layout(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Reduces the size of the GDEF, GSUB and GPOS tables without changing how text is shaped: unreachable lookups and
+        unused features are removed, class kerning is compacted and identical subtables are shared. See
+        layout.optimize_layout.
+
+        :return: The size in bytes of each layout table in the font file and after optimization, as a {tag:
+            (size_before, size_after)} dictionary.
+        """
+        report = optimize_layout(self)
+        self._optimized_tables.update(tag for tag in report if tag in self.tables)
+        return report
 
     @property
     def is_cff(self) -> bool:
@@ -54,6 +168,7 @@ class Font(TTFont):
             return
         glyph_set = self.getGlyphSet()
         glyf_table = self["glyf"]
+        h_metrics = self["hmtx"].metrics
         dr_pen = DecomposingRecordingPen(glyph_set)
         tt_pen = TTGlyphPen(None)
 
@@ -62,6 +177,13 @@ class Font(TTFont):
             if not glyph.isComposite():
                 continue
 
+            # Glyphs the NumPy backend can't decompose fall back to the pens
+            if HAVE_NUMPY:
+                decomposed = decompose_glyph(glyf_table, h_metrics, glyph)
+                if decomposed is not None:
+                    glyf_table[glyph_name] = decomposed
+                    continue
+
             dr_pen.value = []
             tt_pen.init()
 
@@ -78,31 +200,46 @@ class Font(TTFont):
 
         :return: A list of integers.
         """
-        ui_name_ids = []
         if "GSUB" not in self.keys():
             return []
-        else:
-            for record in self["GSUB"].table.FeatureList.FeatureRecord:
-                if record.Feature.FeatureParams is not None:
-                    ui_name_ids.append(record.Feature.FeatureParams.UINameID)
-        return sorted(set(ui_name_ids))
+        return sorted({feature_params.UINameID for feature_params in self._get_ui_feature_params()})
 
     def reorder_ui_name_ids(self):
         """
-        Takes the IDs of the UI names in the name table and reorders them to start at 256
+        Takes the IDs of the UI names in the name table and reorders them to start at 256. IDs used by other name
+        records are skipped. Name records and GSUB features are renumbered in a single pass each.
         """
 
         if "GSUB" not in self:
             return
         ui_name_ids = self.get_ui_name_ids()
-        for count, value in enumerate(ui_name_ids, start=256):
-            for n in self["name"].names:
-                if n.nameID == value:
-                    n.nameID = count
+        other_name_ids = {n.nameID for n in self["name"].names}.difference(ui_name_ids)
+
+        name_ids_map = {}
+        new_name_id = 256
+        for name_id in ui_name_ids:
+            while new_name_id in other_name_ids:
+                new_name_id += 1
+            if name_id != new_name_id:
+                name_ids_map[name_id] = new_name_id
+            new_name_id += 1
+
+        if not name_ids_map:
+            return
+        self["name"].renumber_names(name_ids_map)
+        for feature_params in self._get_ui_feature_params():
+            feature_params.UINameID = name_ids_map.get(feature_params.UINameID, feature_params.UINameID)
+
+    def _get_ui_feature_params(self) -> list:
+        # Only stylistic set features ('ss01'-'ss20') have a UINameID. The same FeatureParams object can be shared by
+        # several features.
+        feature_params = {}
+        if self["GSUB"].table.FeatureList is not None:
             for record in self["GSUB"].table.FeatureList.FeatureRecord:
-                if record.Feature.FeatureParams:
-                    if record.Feature.FeatureParams.UINameID == value:
-                        record.Feature.FeatureParams.UINameID = count
+                params = record.Feature.FeatureParams
+                if params is not None and hasattr(params, "UINameID"):
+                    feature_params[id(params)] = params
+        return list(feature_params.values())
 
     def get_axes(self) -> list:
         return [axis for axis in self["fvar"].axes if axis.flags == 0]
@@ -0,0 +1,485 @@
+from collections import deque
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from fontTools.ttLib import TTCollection, TTLibError
+from fontTools.varLib.instancer import instantiateVariableFont, OverlapMode
+
+from font_converter.Lib.Font import Font
+from font_converter.Lib.converters import otf_to_ttf
+from font_converter.Lib.converters.subroutinizer import Subroutinizer
+from font_converter.Lib.converters.ttf_to_otf import TrueTypeToCFF
+
+TARGETS = ("otf", "ttf", "sfnt", "woff", "woff2", "static")
+
+_EXTENSIONS = {
+    b"OTTO": ".otf",
+    b"\x00\x01\x00\x00": ".ttf",
+    b"true": ".ttf",
+    b"wOFF": ".woff",
+    b"wOF2": ".woff2",
+    b"ttcf": ".ttc",
+}
+
+_FLAVORS = {b"wOFF": "woff", b"wOF2": "woff2"}
+
+
+def load_font(data: bytes, font_number: int = -1, recalc_timestamp=False) -> Font:
+    """
+    Loads a font from a bytes object. Font collections are supported: use font_number to select the font to load.
+
+    :param data: The font data
+    :param font_number: The index of the font in a collection. Ignored if data is not a collection
+    :param recalc_timestamp: If True, head.modified is set to current time when the font is saved
+    :return: A Font object.
+    """
+    return Font(BytesIO(data), recalcTimestamp=recalc_timestamp, fontNumber=font_number)
+
+
+def save_font(font: Font, reorder_tables=True) -> bytes:
+    """
+    Compiles a font and returns its data.
+
+    :param font: The font to compile
+    :param reorder_tables: If True, tables are sorted by tag in the output
+    :return: The font data.
+    """
+    buf = BytesIO()
+    font.save(buf, reorderTables=reorder_tables)
+    return buf.getvalue()
+
+
+def get_extension(data: bytes) -> str:
+    """
+    Returns the file extension matching the format of the given font data.
+
+    :param data: The font data
+    :return: The extension (".ttf", ".otf", ".woff", ".woff2" or ".ttc").
+    """
+    try:
+        return _EXTENSIONS[data[:4]]
+    except KeyError:
+        raise TTLibError("Not a TrueType or OpenType font (bad sfntVersion)")
+
+
+def get_flavor(data: bytes) -> Optional[str]:
+    """
+    Returns the flavor of the given font data: "woff" or "woff2" for web fonts, None for SFNT fonts and collections.
+
+    :param data: The font data, or at least its first 4 bytes
+    :return: The flavor.
+    """
+    return _FLAVORS.get(data[:4])
+
+
+def get_font_count(data: bytes) -> int:
+    """
+    Returns the number of fonts in the given data: 1 for single fonts, the number of fonts for collections.
+
+    :param data: The font data
+    :return: The number of fonts.
+    """
+    if data[:4] != b"ttcf":
+        return 1
+    return len(TTCollection(BytesIO(data)).fonts)
+
+
+def to_otf(
+    font: Font,
+    tolerance=1.0,
+    safe=False,
+    purge_glyphs=True,
+    subroutinize=True,
+    stats: dict = None,
+    max_tolerance: float = None,
+    unicodes: Iterable[int] = None,
+    layout_features: Iterable[str] = None,
+    optimize_layout=False,
+) -> bytes:
+    """
+    Converts a TrueType font to CFF format. Web fonts keep their flavor.
+
+    :param font: The TrueType font to convert
+    :param tolerance: Conversion tolerance (0-2.5), as a ratio of 1/1000 of unitsPerEm
+    :param safe: If True, the font is round-tripped through T2CharStringPen and Cu2QuPen before conversion
+    :param purge_glyphs: If True, 'NULL' and 'CR' glyphs are removed from the output font
+    :param subroutinize: If True, the output CFF table is subroutinized
+    :param stats: If given, the conversion counters (glyphs simplified with pathops, glyphs that didn't need it,
+        glyphs whose outline was reused from an identical glyph and charstring bytes saved by the tolerance search) are
+        added to this dictionary
+    :param max_tolerance: If greater than tolerance, each glyph is converted with the tolerance between tolerance and
+        max_tolerance (0-2.5, as a ratio of 1/1000 of unitsPerEm) that produces the smallest charstring
+    :param unicodes: If given, the font is subset to the glyphs reachable from these code points before conversion
+        (see Font.subset)
+    :param layout_features: If given, the font is subset to the glyphs reachable through these layout features before
+        conversion (see Font.subset)
+    :param optimize_layout: If True, the GDEF, GSUB and GPOS tables are losslessly optimized (see
+        Font.optimize_layout), and their sizes before and after optimization are added to stats
+    :return: The converted font data.
+    """
+    font, tolerance, max_tolerance = _get_otf_source(
+        font,
+        tolerance=tolerance,
+        safe=safe,
+        purge_glyphs=purge_glyphs,
+        max_tolerance=max_tolerance,
+        unicodes=unicodes,
+        layout_features=layout_features,
+        optimize_layout=optimize_layout,
+        stats=stats,
+    )
+    buf = BytesIO()
+    converter = TrueTypeToCFF(font=font, output_file=buf)
+    converter.run(
+        charstrings_source="qu2cu",
+        tolerance=tolerance,
+        subroutinize=subroutinize,
+        purge_glyphs=purge_glyphs,
+        max_tolerance=max_tolerance,
+    )
+    _add_stats(stats, converter.stats)
+    return buf.getvalue()
+
+
+def submit_otf(
+    font: Font,
+    subroutinizer: Subroutinizer,
+    tolerance=1.0,
+    safe=False,
+    purge_glyphs=True,
+    subroutinize=True,
+    stats: dict = None,
+    max_tolerance: float = None,
+    unicodes: Iterable[int] = None,
+    layout_features: Iterable[str] = None,
+    optimize_layout=False,
+) -> Future:
+    """
+    Converts a TrueType font to CFF format like to_otf, but leaves subroutinization to the given subroutinizer, so
+    that the caller can convert the outlines of the next font while the current one is being subroutinized.
+
+    :param font: The TrueType font to convert
+    :param subroutinizer: The subroutinizer to submit the converted font to
+    :param tolerance: See to_otf
+    :param safe: See to_otf
+    :param purge_glyphs: See to_otf
+    :param subroutinize: See to_otf
+    :param stats: See to_otf
+    :param max_tolerance: See to_otf
+    :param unicodes: See to_otf
+    :param layout_features: See to_otf
+    :param optimize_layout: See to_otf
+    :return: A future that resolves to the converted font data.
+    """
+    font, tolerance, max_tolerance = _get_otf_source(
+        font,
+        tolerance=tolerance,
+        safe=safe,
+        purge_glyphs=purge_glyphs,
+        max_tolerance=max_tolerance,
+        unicodes=unicodes,
+        layout_features=layout_features,
+        optimize_layout=optimize_layout,
+        stats=stats,
+    )
+    buf = BytesIO()
+    future = Future()
+    converter = TrueTypeToCFF(font=font, output_file=buf)
+    subroutinizer_future = converter.run(
+        charstrings_source="qu2cu",
+        tolerance=tolerance,
+        subroutinize=subroutinize,
+        purge_glyphs=purge_glyphs,
+        subroutinizer=subroutinizer,
+        max_tolerance=max_tolerance,
+    )
+    _add_stats(stats, converter.stats)
+    if subroutinizer_future is None:
+        future.set_result(buf.getvalue())
+        return future
+
+    def _set_result(f: Future):
+        if f.exception() is not None:
+            future.set_exception(f.exception())
+        else:
+            future.set_result(buf.getvalue())
+
+    subroutinizer_future.add_done_callback(_set_result)
+    return future
+
+
+def _subset(font: Font, unicodes: Iterable[int] = None, layout_features: Iterable[str] = None):
+    if unicodes is not None or layout_features is not None:
+        font.subset(unicodes=unicodes, layout_features=layout_features)
+
+
+def optimize_layout_tables(font: Font, stats: dict = None) -> Dict[str, Tuple[int, int]]:
+    """
+    Losslessly optimizes the GDEF, GSUB and GPOS tables of a font (see Font.optimize_layout).
+
+    :param font: The font
+    :param stats: If given, the size of each layout table in the font file and after optimization is added to this
+        dictionary, as "<tag>_size_before" and "<tag>_size_after"
+    :return: The size in bytes of each layout table in the font file and after optimization, as a {tag: (size_before,
+        size_after)} dictionary.
+    """
+    report = font.optimize_layout()
+    for tag, (size_before, size_after) in report.items():
+        _add_stats(stats, {f"{tag}_size_before": size_before, f"{tag}_size_after": size_after})
+    return report
+
+
+def _add_stats(stats: dict, converter_stats: dict):
+    if stats is not None:
+        for key, value in converter_stats.items():
+            stats[key] = stats.get(key, 0) + value
+
+
+def _get_otf_source(
+    font: Font,
+    tolerance: float,
+    safe: bool,
+    purge_glyphs: bool,
+    max_tolerance: float = None,
+    unicodes: Iterable[int] = None,
+    layout_features: Iterable[str] = None,
+    optimize_layout=False,
+    stats: dict = None,
+) -> Tuple[Font, float, Optional[float]]:
+    if not font.is_true_type:
+        raise TTLibError("Not a TrueType font")
+
+    _subset(font, unicodes=unicodes, layout_features=layout_features)
+
+    # Set tolerance as a ratio of unitsPerEm
+    tolerance = tolerance / 1000 * font["head"].unitsPerEm
+    if max_tolerance is not None:
+        max_tolerance = max_tolerance / 1000 * font["head"].unitsPerEm
+
+    if safe:
+        # Create a temporary OTF file with T2CharStringPen...
+        buf = BytesIO()
+        TrueTypeToCFF(font, output_file=buf).run(charstrings_source="t2", purge_glyphs=purge_glyphs, subroutinize=False)
+
+        # ... and convert it back to a temporary TTF file that will be used for conversion
+        temp_otf = Font(BytesIO(buf.getvalue()), recalcTimestamp=font.recalcTimestamp)
+        otf_to_ttf.otf_2_ttf(temp_otf, post_format=2.0, max_err=1.0, reverse_direction=True)
+        font = Font(BytesIO(save_font(temp_otf)), recalcTimestamp=font.recalcTimestamp)
+
+    if optimize_layout:
+        optimize_layout_tables(font, stats=stats)
+
+    return font, tolerance, max_tolerance
+
+
+def to_ttf(
+    font: Font,
+    max_err=otf_to_ttf.MAX_ERR,
+    post_format=otf_to_ttf.POST_FORMAT,
+    reverse_direction=True,
+    stats: dict = None,
+    unicodes: Iterable[int] = None,
+    layout_features: Iterable[str] = None,
+    optimize_layout=False,
+) -> bytes:
+    """
+    Converts a CFF font to TrueType format. Web fonts keep their flavor.
+
+    :param font: The CFF font to convert
+    :param max_err: The maximum approximation error, measured in UPEM
+    :param post_format: The format of the output 'post' table
+    :param reverse_direction: If True, contours direction is reversed
+    :param stats: If given, the number of glyphs whose outline was reused from an identical glyph is added to this
+        dictionary
+    :param unicodes: See to_otf
+    :param layout_features: See to_otf
+    :param optimize_layout: See to_otf
+    :return: The converted font data.
+    """
+    _subset(font, unicodes=unicodes, layout_features=layout_features)
+    if optimize_layout:
+        optimize_layout_tables(font, stats=stats)
+    otf_to_ttf.otf_2_ttf(
+        font, post_format=post_format, max_err=max_err, reverse_direction=reverse_direction, stats=stats
+    )
+    return save_font(font)
+
+
+def to_sfnt(font: Font) -> bytes:
+    """
+    Converts a web font, or a font extracted from a collection, to a SFNT font (TTF or OTF).
+
+    :param font: The font to convert
+    :return: The converted font data.
+    """
+    font.flavor = None
+    font.release_unmodified_tables()
+    return save_font(font, reorder_tables=False)
+
+
+def to_web(font: Font, flavor: str, optimize_layout=False, stats: dict = None) -> bytes:
+    """
+    Converts a SFNT font to a web font.
+
+    :param font: The font to convert
+    :param flavor: The flavor of the output font ("woff" or "woff2")
+    :param optimize_layout: See to_otf. The font is modified in place: when exporting several flavors, optimize it
+        once with optimize_layout_tables instead
+    :param stats: If given, the sizes of the layout tables before and after optimization are added to this dictionary
+    :return: The converted font data.
+    """
+    if optimize_layout:
+        optimize_layout_tables(font, stats=stats)
+    font.flavor = flavor
+    font.release_unmodified_tables()
+    return save_font(font, reorder_tables=False)
+
+
+def change_flavor(data: bytes, flavor: Optional[str]) -> bytes:
+    """
+    Stores font data in another container (SFNT, WOFF or WOFF2) without changing its tables.
+
+    :param data: The font data
+    :param flavor: The flavor of the output font: None for a SFNT font, "woff" or "woff2"
+    :return: The font data in the new container, or the same data if it already has this flavor.
+    """
+    if get_flavor(data) == flavor:
+        return data
+    font = load_font(data)
+    return to_sfnt(font) if flavor is None else to_web(font, flavor)
+
+
+def to_static(
+    font: Font,
+    coordinates: dict,
+    cleanup=True,
+    update_name_table=False,
+    unicodes: Iterable[int] = None,
+    layout_features: Iterable[str] = None,
+    optimize_layout=False,
+    stats: dict = None,
+) -> bytes:
+    """
+    Exports a static instance from a variable font.
+
+    :param font: The variable font
+    :param coordinates: The instance coordinates, as a {axis_tag: value} dictionary
+    :param cleanup: If True, STAT table is dropped and axis nameIDs are deleted from name table
+    :param update_name_table: If True, tries to update the instance's name table from STAT Axis Values
+    :param unicodes: If given, the variable font is subset before instancing (see to_otf). The font is modified in
+        place: when exporting several instances, subset it once with Font.subset instead
+    :param layout_features: See to_otf
+    :param optimize_layout: If True, the layout tables of the static instance are losslessly optimized (see to_otf)
+    :param stats: If given, the sizes of the layout tables before and after optimization are added to this dictionary
+    :return: The static instance data.
+    """
+    if not font.is_variable:
+        raise TTLibError("Not a variable font")
+
+    _subset(font, unicodes=unicodes, layout_features=layout_features)
+
+    name_ids_to_delete = font.get_var_name_ids_to_delete() if cleanup else []
+
+    # Cannot update name table if there is no STAT table or if there are no STAT Axis Values.
+    if "STAT" not in font or getattr(font["STAT"].table, "AxisValueArray", None) is None:
+        update_name_table = False
+
+    static_font: Font = instantiateVariableFont(
+        varfont=font,
+        axisLimits=coordinates,
+        inplace=False,
+        optimize=True,
+        overlap=OverlapMode.REMOVE_AND_IGNORE_ERRORS,
+        updateFontNames=update_name_table,
+    )
+
+    if cleanup:
+        static_font.name_table.del_names(name_ids=name_ids_to_delete)
+        if "STAT" in static_font:
+            del static_font["STAT"]
+        static_font.reorder_ui_name_ids()
+
+    if optimize_layout:
+        optimize_layout_tables(static_font, stats=stats)
+
+    return save_font(static_font)
+
+
+def convert(data: bytes, target: str, font_number: int = 0, recalc_timestamp=False, **options) -> bytes:
+    """
+    Converts a font and returns the converted font data, without any filesystem round-trip.
+
+    Targets:
+
+    - "otf": TrueType to CFF (options: tolerance, max_tolerance, safe, purge_glyphs, subroutinize, unicodes,
+      layout_features, optimize_layout)
+    - "ttf": CFF to TrueType (options: max_err, post_format, reverse_direction, unicodes, layout_features,
+      optimize_layout)
+    - "sfnt": web font or collection member to TTF/OTF
+    - "woff", "woff2": SFNT font to web font (options: optimize_layout)
+    - "static": variable font to static instance (options: coordinates, cleanup, update_name_table, unicodes,
+      layout_features, optimize_layout)
+
+    :param data: The source font data. If it's a font collection, font_number selects the font to convert
+    :param target: The conversion target
+    :param font_number: The index of the font to convert in a collection
+    :param recalc_timestamp: If True, head.modified is set to current time
+    :param options: Target specific options
+    :return: The converted font data.
+    """
+    _check_target(target)
+    font = load_font(data, font_number=font_number, recalc_timestamp=recalc_timestamp)
+    try:
+        if target == "otf":
+            return to_otf(font, **options)
+        if target == "ttf":
+            return to_ttf(font, **options)
+        if target == "sfnt":
+            return to_sfnt(font, **options)
+        if target in ("woff", "woff2"):
+            return to_web(font, flavor=target, **options)
+        if target == "static":
+            return to_static(font, **options)
+    finally:
+        font.close()
+
+
+def convert_many(items: Iterable[bytes], target: str, **options) -> Iterator[bytes]:
+    """
+    Lazily converts several fonts with the same target and options. Converted fonts are yielded in input order.
+
+    When converting to "otf" with subroutinization, the external subroutinizer runs in background while the outlines of
+    the next fonts are converted.
+
+    :param items: An iterable of font data
+    :param target: The conversion target (see convert)
+    :param options: Options passed to convert
+    :return: An iterator of converted font data.
+    """
+    _check_target(target)
+    if target == "otf" and options.get("subroutinize", True):
+        yield from _convert_many_otf(items, **options)
+        return
+
+    for data in items:
+        yield convert(data, target, **options)
+
+
+def _convert_many_otf(
+    items: Iterable[bytes], font_number: int = 0, recalc_timestamp=False, **options
+) -> Iterator[bytes]:
+    with Subroutinizer() as subroutinizer:
+        pending = deque()
+        for data in items:
+            font = load_font(data, font_number=font_number, recalc_timestamp=recalc_timestamp)
+            pending.append(submit_otf(font, subroutinizer, **options))
+            while pending and (pending[0].done() or len(pending) > subroutinizer.max_workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _check_target(target: str):
+    if target not in TARGETS:
+        raise ValueError(f"Invalid target: {target} (valid targets: {', '.join(TARGETS)})")
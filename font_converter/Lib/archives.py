@@ -0,0 +1,194 @@
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterator, Optional
+
+ZIP_EXTENSIONS = (".zip",)
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Web fonts are already compressed: they are stored as they are in zip archives
+_STORED_EXTENSIONS = (".woff", ".woff2")
+
+
+class InMemoryFile(str):
+    """
+    An input file whose content has already been read. It's the path of the file, so that it can be used like any other
+    input file path, and it keeps the file's content in memory: open_input reads it from there.
+    """
+
+    def __new__(cls, path: str, data: bytes):
+        file = super().__new__(cls, path)
+        file.data = data
+        return file
+
+    def __getnewargs__(self):
+        return str(self), self.data
+
+
+class ArchiveMember(InMemoryFile):
+    """
+    A font read from a zip or tar archive. It's the path the member would have if the archive were a folder (e.g.
+    "fonts.zip/Family/Font-Regular.ttf"), so that it can be used like any other input file path, and it keeps the
+    member's content in memory.
+    """
+
+    def __new__(cls, archive: str, name: str, data: bytes):
+        member = super().__new__(cls, os.path.join(archive, *name.split("/")), data)
+        member.archive = archive
+        member.name = name
+        return member
+
+    def __getnewargs__(self):
+        return self.archive, self.name, self.data
+
+
+def is_archive(path: str) -> bool:
+    """
+    Returns True if the path is a zip or tar archive, judging by its extension.
+    """
+    return os.path.isfile(path) and path.lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS)
+
+
+def open_input(file: str) -> BinaryIO:
+    """
+    Opens an input file for reading in binary mode. Archive members and other files already read are read from memory.
+    """
+    if isinstance(file, InMemoryFile):
+        return BytesIO(file.data)
+    return open(file, "rb")
+
+
+def iter_archive(archive: str, accept: Callable[[str], bool] = None) -> Iterator[ArchiveMember]:
+    """
+    Yields the files in a zip or tar archive, in archive order, without extracting them. Tar archives (compressed or
+    not) are read as a stream, so only the current member is held in memory.
+
+    Members with absolute paths or paths pointing outside the archive root are skipped.
+
+    :param archive: The archive file
+    :param accept: A function that takes the path of a member, with forward slashes, and returns False if the member
+        must be skipped. Skipped members are not read
+    :return: An iterator of archive members.
+    """
+    if archive.lower().endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                name = _normalize_member_name(info.filename)
+                if info.is_dir() or name is None or (accept is not None and not accept(name)):
+                    continue
+                yield ArchiveMember(archive, name, zf.read(info))
+    else:
+        with tarfile.open(archive, "r|*") as tf:
+            for info in tf:
+                name = _normalize_member_name(info.name)
+                if not info.isfile() or name is None or (accept is not None and not accept(name)):
+                    continue
+                yield ArchiveMember(archive, name, tf.extractfile(info).read())
+
+
+def _normalize_member_name(name: str) -> Optional[str]:
+    name = posixpath.normpath(name.replace("\\", "/"))
+    if name.startswith(("/", "../")) or name in (".", ".."):
+        return None
+    return name
+
+
+class ArchiveWriter(object):
+    """
+    Writes output files into a zip or tar archive as they are produced, without writing them to disk first. The
+    archive format is chosen from the extension: .zip, or .tar optionally compressed (.tar.gz, .tgz, .tar.bz2, .tbz2,
+    .tar.xz, .txz). Tar archives are written as a stream.
+
+    Usage:
+
+    with ArchiveWriter("fonts.zip") as writer:
+        writer.write("Family/Font-Regular.woff2", data)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._names = set()
+        lower_path = path.lower()
+        if lower_path.endswith(ZIP_EXTENSIONS):
+            self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+            self._tar = None
+        elif lower_path.endswith(TAR_EXTENSIONS):
+            if lower_path.endswith((".gz", ".tgz")):
+                mode = "w|gz"
+            elif lower_path.endswith("bz2"):
+                mode = "w|bz2"
+            elif lower_path.endswith("xz"):
+                mode = "w|xz"
+            else:
+                mode = "w|"
+            self._tar = tarfile.open(path, mode)
+            self._zip = None
+        else:
+            raise ValueError(
+                f"Unsupported archive format: {os.path.basename(path)}. Use one of "
+                f"{', '.join(ZIP_EXTENSIONS + TAR_EXTENSIONS)}"
+            )
+
+    def write(self, name: str, data: bytes) -> str:
+        """
+        Adds a file to the archive. Since members can't be replaced, a number is appended to the name if a member
+        with the same name was already written, as makeOutputFileName does for existing files (Font#1.ttf).
+
+        :param name: The path of the member in the archive, with forward slashes
+        :param data: The content of the file
+        :return: The name of the member actually written.
+        """
+        name = self.reserve_name(name)
+        self.add(name, data)
+        return name
+
+    def reserve_name(self, name: str) -> str:
+        """
+        Returns the name a file would be written with (see write), and reserves it, so that the file can be added
+        later with add.
+        """
+        name = self._get_unique_name(name)
+        self._names.add(name)
+        return name
+
+    def add(self, name: str, data: bytes) -> None:
+        """
+        Adds a file to the archive, with a name returned by reserve_name.
+        """
+        if self._zip is not None:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            if name.lower().endswith(_STORED_EXTENSIONS):
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            self._zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._tar.addfile(info, BytesIO(data))
+
+    def _get_unique_name(self, name: str) -> str:
+        if name not in self._names:
+            return name
+        base, ext = posixpath.splitext(name)
+        n = 1
+        while f"{base}#{n}{ext}" in self._names:
+            n += 1
+        return f"{base}#{n}{ext}"
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable
+
+from font_converter.Lib.api import convert
+
+
+class AsyncConverter(object):
+    """
+    Asyncio façade over the conversion API. Conversions run in a managed process pool, so the event loop is never
+    blocked by CPU-heavy work.
+
+    At most max_in_flight conversions are submitted to the pool at any time: further requests wait for a free slot,
+    which applies backpressure to the callers. Cancelling a request (or hitting its timeout) withdraws it from the pool
+    if it hasn't started yet; a conversion that is already running can't be interrupted, and keeps its slot until the
+    worker is done with it.
+
+    Usage:
+
+    async with AsyncConverter(max_workers=4, max_in_flight=8) as converter:
+        otf_data = await converter.convert(ttf_data, "otf", timeout=30, tolerance=1)
+    """
+
+    def __init__(self, max_workers: int = None, max_in_flight: int = None):
+        """
+        :param max_workers: The number of worker processes. Defaults to the number of CPUs
+        :param max_in_flight: The maximum number of conversions queued or running in the pool. Defaults to twice the
+            number of workers
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        if self.max_in_flight < 1:
+            raise ValueError("max_in_flight must be greater than 0")
+
+        self._executor = None
+        self._slots = None
+        self._in_flight = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The number of conversions currently queued or running in the pool.
+        """
+        return self._in_flight
+
+    async def convert(self, data: bytes, target: str, timeout: float = None, **options) -> bytes:
+        """
+        Converts a font in the process pool. See font_converter.Lib.api.convert for targets and options.
+
+        :param data: The source font data
+        :param target: The conversion target
+        :param timeout: The maximum time in seconds to wait for the conversion, including the time spent waiting for
+            a free slot. If exceeded, asyncio.TimeoutError is raised
+        :param options: Options passed to convert
+        :return: The converted font data.
+        """
+        return await asyncio.wait_for(self._submit(data, target, **options), timeout)
+
+    async def convert_many(
+        self, items: Iterable[bytes], target: str, timeout: float = None, **options
+    ) -> AsyncIterator[bytes]:
+        """
+        Converts several fonts concurrently and yields the results in input order. Items are read from the iterable
+        only when there is room for them in the pool, so large batches are not loaded in memory at once.
+
+        :param items: An iterable of font data
+        :param target: The conversion target
+        :param timeout: Per-request timeout, see convert
+        :param options: Options passed to convert
+        :return: An async iterator of converted font data.
+        """
+        pending = deque()
+        try:
+            for data in items:
+                if len(pending) >= self.max_in_flight:
+                    yield await pending.popleft()
+                pending.append(asyncio.ensure_future(self.convert(data, target, timeout=timeout, **options)))
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def close(self):
+        """
+        Shuts down the process pool, waiting for running conversions to finish.
+        """
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    async def _submit(self, data: bytes, target: str, **options) -> bytes:
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        await self._slots.acquire()
+        self._in_flight += 1
+        try:
+            future = self._executor.submit(convert, data, target, **options)
+        except BaseException:
+            self._release()
+            raise
+
+        # The slot is released when the worker is done, not when the caller stops waiting, so that timed out or
+        # cancelled conversions that are still running keep counting against max_in_flight.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._slots.release()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from font_converter.Lib.archives import open_input
+
+DONE = "done"
+FAILED = "failed"
+
+
+class Checkpoint(object):
+    """
+    Records the progress of a batch conversion, so that an interrupted run can be resumed.
+
+    Each converted or failed input file is appended as a JSON line to the checkpoint file, with the SHA-256 of its
+    content and the output files, and the line is flushed to disk before the next file is processed. Appending a line
+    is atomic for all practical purposes: if the process dies while writing, the truncated last line is ignored when the
+    checkpoint is loaded again.
+
+    A file is done when its last record is successful, its content hash didn't change and its output files still exist.
+    Failed and unrecorded files are converted again.
+
+    The same checkpoint file can be shared by several commands: records are kept per command.
+    """
+
+    def __init__(self, path: Optional[str], command: str):
+        """
+        :param path: The checkpoint file. If None, the checkpoint is disabled: no file is done and nothing is recorded
+        :param command: The name of the command whose progress is recorded
+        """
+        self.path = path
+        self.command = command
+        self._records: Dict[str, dict] = {}
+        self._hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._truncated = False
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def is_done(self, file: str) -> bool:
+        """
+        Returns True if the file was already converted successfully and its outputs are still there.
+
+        :param file: The input file
+        """
+        if not self.enabled:
+            return False
+        file = os.path.abspath(file)
+        # The hash of the content is computed now and kept for set_done/set_failed, so that what is recorded is the
+        # content that was checked and converted, even if the file changes in the meantime.
+        self._hashes.pop(file, None)
+        sha256 = self._get_hash(file)
+        record = self._records.get(file)
+        if record is None or record["status"] != DONE:
+            return False
+        if not all(os.path.exists(output_file) for output_file in record["outputs"]):
+            return False
+        return record["sha256"] == sha256
+
+    def set_done(self, file: str, output_files: List[str]) -> None:
+        """
+        Records that a file has been converted.
+
+        :param file: The input file
+        :param output_files: The files written for this input
+        """
+        self._append(file, DONE, outputs=[os.path.abspath(f) for f in output_files])
+
+    def set_failed(self, file: str, error) -> None:
+        """
+        Records that the conversion of a file failed. The file will be converted again on the next run.
+
+        :param file: The input file
+        :param error: The exception or error message
+        """
+        self._append(file, FAILED, error=str(error))
+
+    def _append(self, file: str, status: str, **fields) -> None:
+        if not self.enabled:
+            return
+        record = dict(
+            command=self.command,
+            input=os.path.abspath(file),
+            sha256=self._get_hash(file),
+            status=status,
+            outputs=[],
+        )
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._truncated:
+                # Don't append the record to a line truncated by a crash
+                line = "\n" + line
+                self._truncated = False
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._records[record["input"]] = record
+
+    def _get_hash(self, file: str) -> Optional[str]:
+        file = os.path.abspath(file)
+        if file not in self._hashes:
+            try:
+                self._hashes[file] = _sha256(file)
+            except OSError:
+                return None
+        return self._hashes[file]
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                self._truncated = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line truncated by a crash
+                    continue
+                if isinstance(record, dict) and record.get("command") == self.command:
+                    self._records[record["input"]] = record
+
+
+def _sha256(file: str) -> str:
+    sha256 = hashlib.sha256()
+    with open_input(file) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
@@ -1,8 +1,23 @@
 import os
 import sys
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, Union
 
 from font_converter.Lib.Font import Font
-from font_converter.Lib.click_tools import no_valid_fonts_message, generic_error_message
+from font_converter.Lib.archives import ArchiveMember, ArchiveWriter, TAR_EXTENSIONS, ZIP_EXTENSIONS, is_archive
+from font_converter.Lib.checkpoint import Checkpoint
+from font_converter.Lib.click_tools import (
+    no_valid_fonts_message,
+    generic_error_message,
+    generic_info_message,
+    generic_warning_message,
+)
+from font_converter.Lib.files import iter_files, prefetch_files
+from font_converter.Lib.job_queue import JobQueue, QueueJob
+from font_converter.Lib.watcher import Watcher
 
 
 def check_input_path(
@@ -12,21 +27,39 @@ def check_input_path(
     allow_cff=True,
     allow_static=True,
     allow_variable=True,
-):
-    files = get_fonts_list(
+    allow_empty=False,
+    recursive=False,
+    include: tuple = None,
+    exclude: tuple = None,
+    prefetch: int = 0,
+) -> Iterator[str]:
+    """
+    Returns an iterator of the valid font files in input_path. Files are found and checked lazily, so that conversion
+    can start as soon as the first font is found. If there are no valid fonts, exits.
+
+    See iter_fonts for the parameters.
+    """
+    files = iter_fonts(
         input_path,
         allow_extensions=allow_extensions,
         allow_ttf=allow_ttf,
         allow_cff=allow_cff,
         allow_static=allow_static,
         allow_variable=allow_variable,
+        recursive=recursive,
+        include=include,
+        exclude=exclude,
+        prefetch=prefetch,
     )
 
-    if not len(files) > 0:
-        no_valid_fonts_message(input_path)
-        sys.exit()
+    first_file = next(files, None)
+    if first_file is None:
+        if not allow_empty:
+            no_valid_fonts_message(input_path)
+            sys.exit()
+        return iter([])
 
-    return files
+    return chain([first_file], files)
 
 
 def check_output_dir(input_path, output_path: None):
@@ -54,6 +87,97 @@ def check_output_dir(input_path, output_path: None):
     return output_dir
 
 
+def check_output_archive(output_archive: str = None, watch=False, checkpoint_file: str = None):
+    """
+    Checks that the output archive has a supported format and can be used with the other options. If not, exits.
+
+    :param output_archive: The output archive, if any
+    :param watch: True if the command runs in watch mode
+    :param checkpoint_file: The checkpoint file, if any
+    """
+    if output_archive is None:
+        return
+    if not output_archive.lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS):
+        generic_error_message(
+            f"Unsupported archive format: {os.path.basename(output_archive)}. Use one of "
+            f"{', '.join(ZIP_EXTENSIONS + TAR_EXTENSIONS)}"
+        )
+        sys.exit()
+    # The archive is written again from scratch on each run, and closed when the input files are converted
+    if watch:
+        generic_error_message("--output-archive can't be used with --watch")
+        sys.exit()
+    if checkpoint_file is not None:
+        generic_error_message("--output-archive can't be used with --checkpoint")
+        sys.exit()
+
+
+def check_queue_dir(
+    queue_dir: str = None,
+    input_path: str = None,
+    output_archive: str = None,
+    watch=False,
+    checkpoint_file: str = None,
+    workers=1,
+):
+    """
+    Checks that the queue spool directory can be used with the other options. If not, exits.
+
+    :param queue_dir: The spool directory of the job queue, if any
+    :param input_path: The input file or folder
+    :param output_archive: The output archive, if any
+    :param watch: True if the command runs in watch mode
+    :param checkpoint_file: The checkpoint file, if any
+    :param workers: The number of fonts converted in parallel
+    """
+    if queue_dir is None:
+        return
+    # Jobs are shared with workers on other hosts, that must be able to read the input files and write the outputs
+    if is_archive(input_path):
+        generic_error_message("--queue can't be used with archive inputs")
+        sys.exit()
+    if output_archive is not None:
+        generic_error_message("--queue can't be used with --output-archive")
+        sys.exit()
+    if watch:
+        generic_error_message("--queue can't be used with --watch")
+        sys.exit()
+    # The queue keeps its own status records
+    if checkpoint_file is not None:
+        generic_error_message("--queue can't be used with --checkpoint")
+        sys.exit()
+    if workers > 1:
+        generic_error_message("--queue can't be used with --workers: start several workers instead")
+        sys.exit()
+    try:
+        os.makedirs(queue_dir, exist_ok=True)
+    except OSError as e:
+        generic_error_message(f"Error: {e}")
+        sys.exit()
+
+
+def get_subset_unicodes(unicodes: list = None, text_file: str = None) -> Optional[list]:
+    """
+    Returns the code points to subset the fonts to: the given code points plus the characters of the text file. If
+    the text file can't be read, exits.
+
+    :param unicodes: The code points given with --unicodes, if any
+    :param text_file: The text file given with --text-file, if any
+    :return: A sorted list of code points, or None if the fonts must not be subset by code points.
+    """
+    if unicodes is None and text_file is None:
+        return None
+    subset_unicodes = set(unicodes or [])
+    if text_file is not None:
+        try:
+            with open(text_file, encoding="utf-8") as f:
+                subset_unicodes.update(ord(c) for c in f.read() if c not in "\r\n")
+        except (OSError, UnicodeDecodeError) as e:
+            generic_error_message(f"Error: {e}")
+            sys.exit()
+    return sorted(subset_unicodes)
+
+
 def get_fonts_list(
     input_path: str,
     allow_extensions: list = None,
@@ -61,9 +185,45 @@ def get_fonts_list(
     allow_cff=True,
     allow_static=True,
     allow_variable=True,
+    recursive=False,
+    include: tuple = None,
+    exclude: tuple = None,
 ) -> list:
     """
-    Takes a path to a file or a folder, and returns a list of all valid font files that match the criteria
+    Takes a path to a file or a folder, and returns a list of all valid font files that match the criteria. See
+    iter_fonts for the parameters.
+
+    :return: A list of font files that meet the criteria of the function.
+    """
+    return list(
+        iter_fonts(
+            input_path,
+            allow_extensions=allow_extensions,
+            allow_ttf=allow_ttf,
+            allow_cff=allow_cff,
+            allow_static=allow_static,
+            allow_variable=allow_variable,
+            recursive=recursive,
+            include=include,
+            exclude=exclude,
+        )
+    )
+
+
+def iter_fonts(
+    input_path: str,
+    allow_extensions: list = None,
+    allow_ttf=True,
+    allow_cff=True,
+    allow_static=True,
+    allow_variable=True,
+    recursive=False,
+    include: tuple = None,
+    exclude: tuple = None,
+    prefetch: int = 0,
+) -> Iterator[str]:
+    """
+    Takes a path to a file or a folder, and yields the valid font files that match the criteria as they are found
 
     :param input_path: The path to the font file or folder
     :type input_path: str
@@ -75,54 +235,213 @@ def get_fonts_list(
     :param allow_static: If True, only static fonts will be returned, defaults to True (optional). If False, static
         fonts are not added to the list
     :param allow_variable: True/False, defaults to True (optional). If False, variable fonts are not added to the list
-    :return: A list of font files that meet the criteria of the function.
+    :param recursive: If True, subfolders of input_path are searched too
+    :param include: Glob patterns of the files to search. If None, all files are searched. See iter_files
+    :param exclude: Glob patterns of the files and folders to skip. See iter_files
+    :param prefetch: The size in bytes of the buffer where files are read ahead, in a background thread. Files are
+        yielded as InMemoryFile paths. If 0, files are not read ahead. See prefetch_files
+    :return: An iterator of font files that meet the criteria of the function.
     """
+    return filter_fonts(
+        prefetch_files(iter_files(input_path, recursive=recursive, include=include, exclude=exclude), prefetch),
+        allow_extensions=allow_extensions,
+        allow_ttf=allow_ttf,
+        allow_cff=allow_cff,
+        allow_static=allow_static,
+        allow_variable=allow_variable,
+    )
 
-    files = []
-    files_to_remove = []
-
-    if os.path.isfile(input_path):
-        files = [input_path]
 
-    if os.path.isdir(input_path):
-        files = [os.path.join(input_path, file) for file in os.listdir(input_path)]
+def filter_fonts(
+    files: Iterable[str],
+    allow_extensions: list = None,
+    allow_ttf=True,
+    allow_cff=True,
+    allow_static=True,
+    allow_variable=True,
+) -> Iterator[str]:
+    """
+    Yields the valid font files of an iterable that match the criteria. See iter_fonts for the parameters.
 
+    :param files: The files to filter
+    :return: An iterator of font files that meet the criteria of the function.
+    """
     for file in files:
         try:
             font = Font(file)
             if allow_extensions is not None:
                 if font.get_real_extension() not in allow_extensions:
-                    files_to_remove.append(file)
                     continue
 
             if allow_ttf is False:
                 if font.is_true_type:
-                    files_to_remove.append(file)
                     continue
 
             if allow_cff is False:
                 if font.is_cff is True:
-                    files_to_remove.append(file)
                     continue
 
             if allow_variable is False:
                 if font.is_variable:
-                    files_to_remove.append(file)
                     continue
 
             if allow_static is False:
                 if font.is_static:
-                    files_to_remove.append(file)
                     continue
 
             del font
 
         except:
-            files_to_remove.append(file)
+            continue
+
+        yield file
+
+
+def match_converted_fonts(
+    source_path: str, converted_path: str, recursive=False, include: tuple = None, exclude: tuple = None
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Yields the fonts found in source_path, each with its conversion found in converted_path. If both paths are files,
+    they are paired. Otherwise, fonts are matched by their path relative to the folders and their name without font
+    extensions: the conversion of Family/Font.ttf is Family/Font.otf, Family/Font.woff2, Family/Font.otf.woff2...
+
+    Zip and tar archives are searched like folders: their fonts are yielded as ArchiveMember paths, to be read with
+    open_input.
+
+    :param source_path: The source font file, folder or archive
+    :param converted_path: The converted font file, folder or archive
+    :param recursive: If True, subfolders are searched too
+    :param include: Glob patterns of the source files to search. See iter_files
+    :param exclude: Glob patterns of the source files and folders to skip. See iter_files
+    :return: An iterator of (source file, converted file) tuples. The converted file is None if it wasn't found.
+    """
+    source_files = iter_fonts(source_path, recursive=recursive, include=include, exclude=exclude)
+    if _is_font_file(converted_path):
+        if _is_font_file(source_path):
+            yield from ((file, converted_path) for file in source_files)
+            return
+        converted_files = {_get_font_key(converted_path, os.path.dirname(converted_path)): converted_path}
+    else:
+        converted_files = {}
+        for file in iter_fonts(converted_path, recursive=recursive):
+            converted_files.setdefault(_get_font_key(file, converted_path), file)
+
+    source_dir = os.path.dirname(source_path) if _is_font_file(source_path) else source_path
+    for file in source_files:
+        yield file, converted_files.get(_get_font_key(file, source_dir))
 
-    files = [f for f in files if f not in files_to_remove]
 
-    return files
+def _is_font_file(path: str) -> bool:
+    # Archives are searched like folders
+    return os.path.isfile(path) and not is_archive(path)
+
+
+def _get_font_key(file: str, folder: str) -> str:
+    # The path relative to the folder, without font extensions
+    key = os.path.relpath(file, folder)
+    while True:
+        base, ext = os.path.splitext(key)
+        if ext.lower() not in (".ttf", ".otf", ".woff", ".woff2"):
+            return os.path.normcase(key)
+        key = base
+
+
+def map_in_threads(
+    func: Callable[[str], Any], files: Iterable[str], threads=1
+) -> Iterator[Tuple[str, Any, Optional[Exception]]]:
+    """
+    Calls func for each file in a thread pool, and yields the results in input order, so that the caller can save the
+    output files and print progress messages from a single thread, in the same order as a sequential run.
+
+    Files are read from the iterable as threads become free: at most 2 * threads files are in progress or waiting to be
+    yielded. Exceptions raised by func are yielded, not raised.
+
+    :param func: The function that converts a file. It must not share mutable state with the caller
+    :param files: The files to convert
+    :param threads: The number of threads. With 1 thread, files are converted in the calling thread
+    :return: An iterator of (file, result, exception) tuples. Either result or exception is None.
+    """
+    if threads <= 1:
+        for file in files:
+            try:
+                result = func(file)
+            except Exception as e:
+                yield file, None, e
+            else:
+                yield file, result, None
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for file in files:
+            pending.append((file, executor.submit(func, file)))
+            if len(pending) >= 2 * threads:
+                yield _get_future_result(*pending.popleft())
+        while pending:
+            yield _get_future_result(*pending.popleft())
+
+
+def _get_future_result(file: str, future: Future) -> Tuple[str, Any, Optional[Exception]]:
+    try:
+        return file, future.result(), None
+    except Exception as e:
+        return file, None, e
+
+
+def watch_input_path(
+    input_path: str,
+    callback: Callable[[list], None],
+    files: Iterable[str] = None,
+    file_filter: Callable[[list], Iterable[str]] = None,
+    debounce: float = 1.0,
+    poll=False,
+    recursive=False,
+    include: tuple = None,
+    exclude: tuple = None,
+):
+    """
+    Watches a file or a folder and calls callback with the files that are added or changed, until the user interrupts
+    the process with Ctrl+C.
+
+    The watch starts before the first batch is converted: the files added or changed while it's converted are converted
+    next.
+
+    :param input_path: The path to the font file or folder to watch
+    :param callback: The function that converts a list of files
+    :param files: The first batch of files, passed to callback once the watch has started
+    :param file_filter: A function that takes the list of changed files and returns the ones to convert. If None, all
+        changed files are passed to callback
+    :param debounce: Seconds without further writes to wait before converting changed files
+    :param poll: If True, the folder is polled instead of using inotify
+    :param recursive: If True, subfolders are watched too
+    :param include: Glob patterns of the files to watch (see iter_files)
+    :param exclude: Glob patterns of the files and folders not to watch (see iter_files)
+    """
+    watcher = Watcher(input_path, debounce=debounce, poll=poll, recursive=recursive, include=include, exclude=exclude)
+    try:
+        watcher.start()
+        if files is not None:
+            callback(files)
+    except BaseException:
+        watcher.close()
+        raise
+
+    print()
+    generic_info_message(
+        f"Watching {input_path} for changes ({'inotify' if watcher.uses_inotify else 'polling'}). Press Ctrl+C to stop"
+    )
+    try:
+        for changed_files in watcher.watch():
+            if is_archive(input_path):
+                # The archive itself changed: convert all of its members again
+                changed_files = list(iter_files(input_path, include=include, exclude=exclude))
+            files = changed_files if file_filter is None else list(file_filter(changed_files))
+            if files:
+                callback(files)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 def get_output_dir(fallback_path: str, path: str = None) -> str:
@@ -143,3 +462,246 @@ def get_output_dir(fallback_path: str, path: str = None) -> str:
             return os.path.dirname(fallback_path)
         else:
             return fallback_path
+
+
+def get_file_output_dir(file: str, input_path: str, output_dir: str) -> str:
+    """
+    Returns the directory where the output of a file found in input_path is saved: output_dir, plus the path of the
+    file's folder relative to input_path, so that the structure of the input folder (or archive) is preserved. The
+    directory is created by OutputWriter when a file is saved to it.
+
+    :param file: The input file
+    :param input_path: The input file, folder or archive
+    :param output_dir: The output directory
+    :return: The output directory of the file.
+    """
+    if not os.path.isdir(input_path) and not isinstance(file, ArchiveMember):
+        return output_dir
+    relative_dir = os.path.relpath(os.path.dirname(file), input_path)
+    if relative_dir == os.curdir:
+        return output_dir
+    return os.path.join(output_dir, relative_dir)
+
+
+class OutputWriter(object):
+    """
+    Saves the output files of a command: to disk, or into a zip or tar archive if output_archive is given. In that
+    case the files are streamed into the archive as they are converted, and the path of each output file relative to
+    output_dir is used as its name in the archive.
+
+    Files are saved atomically: they are written to a temporary file in the output folder, which is then renamed, so
+    that an interrupted run never leaves an incomplete font behind.
+
+    With a buffer size, files are saved in a background thread while the next fonts are converted: write returns as
+    soon as the file is queued, unless the files waiting to be saved already fill the buffer. Files that can't be saved
+    are reported by flush, which waits until all the queued files are saved. The callbacks of write tell when a file is
+    actually saved: use them (or OutputRecord) to record it in a checkpoint.
+
+    Usage:
+
+    with OutputWriter(output_dir, output_archive) as writer:
+        saved_file = writer.write(output_file, data)
+    """
+
+    def __init__(self, output_dir: str, output_archive: str = None, buffer_size: int = 0):
+        """
+        :param output_dir: The output directory
+        :param output_archive: The archive to write. If None, files are written to disk
+        :param buffer_size: The memory that the files waiting to be saved may use, in bytes. If 0, files are saved by
+            write
+        """
+        self.output_dir = output_dir
+        self.archive = None if output_archive is None else ArchiveWriter(output_archive)
+        self.buffer_size = buffer_size
+        # A single thread, so that files are saved (and added to archives) in the order they are written
+        self._executor = ThreadPoolExecutor(max_workers=1) if buffer_size > 0 else None
+        # Files waiting to be saved: (output file, size, future, on_saved, on_failed)
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._failed_writes = 0
+
+    def write(
+        self,
+        output_file: str,
+        data: bytes,
+        on_saved: Callable[[str], None] = None,
+        on_failed: Callable[[Exception], None] = None,
+    ) -> str:
+        """
+        Saves a file, or queues it to be saved in the background.
+
+        The callbacks are called on the calling thread: by write itself, or for files saved in the background, by a
+        later write or by flush.
+
+        :param output_file: The path of the output file, in output_dir
+        :param data: The content of the file
+        :param on_saved: Called with the path of the saved file once it's saved
+        :param on_failed: Called with the error if a file saved in the background can't be saved. Without buffer, write
+            raises the error instead
+        :return: The path of the saved file. For archives, it's the path the member would have if the archive were a
+            folder.
+        """
+        if self.archive is not None:
+            name = os.path.relpath(output_file, self.output_dir).replace(os.sep, "/")
+            name = self.archive.reserve_name(name)
+            saved_file = os.path.join(self.archive.path, *name.split("/"))
+            self._submit(saved_file, len(data), on_saved, on_failed, self.archive.add, name, data)
+            return saved_file
+
+        self._submit(output_file, len(data), on_saved, on_failed, _write_file, output_file, data)
+        return output_file
+
+    def flush(self) -> int:
+        """
+        Waits until all the queued files are saved, and prints an error for each file that couldn't be saved.
+
+        :return: The number of files that couldn't be saved since the last flush.
+        """
+        while self._pending:
+            self._wait_oldest()
+        failed_writes, self._failed_writes = self._failed_writes, 0
+        return failed_writes
+
+    def _submit(
+        self,
+        output_file: str,
+        size: int,
+        on_saved: Optional[Callable[[str], None]],
+        on_failed: Optional[Callable[[Exception], None]],
+        func: Callable,
+        *args,
+    ):
+        if self._executor is None:
+            func(*args)
+            if on_saved is not None:
+                on_saved(output_file)
+            return
+        while self._pending and (self._pending[0][2].done() or self._pending_bytes + size > self.buffer_size):
+            self._wait_oldest()
+        self._pending.append((output_file, size, self._executor.submit(func, *args), on_saved, on_failed))
+        self._pending_bytes += size
+
+    def _wait_oldest(self):
+        output_file, size, future, on_saved, on_failed = self._pending.popleft()
+        self._pending_bytes -= size
+        try:
+            future.result()
+        except Exception as e:
+            self._failed_writes += 1
+            generic_error_message(f"Failed to save {output_file}: {e}")
+            if on_failed is not None:
+                on_failed(e)
+            return
+        if on_saved is not None:
+            on_saved(output_file)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+            if self.archive is not None:
+                self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class OutputRecord(object):
+    """
+    Records an input file in a checkpoint, or a job in a job queue, once all its output files are saved: as done, or as
+    failed if one of them can't be saved. With a background writer, the file is recorded when the writer has saved its
+    outputs, so that an interrupted run never records a file as done before its outputs exist.
+
+    Usage:
+
+    record = OutputRecord(file, checkpoint, writer)
+    for output_file, data in outputs:
+        record.write(output_file, data)
+    record.close()
+    """
+
+    def __init__(
+        self,
+        file: Union[str, QueueJob],
+        checkpoint: Union[Checkpoint, JobQueue],
+        writer: OutputWriter,
+        on_done: Callable[[], None] = None,
+    ):
+        """
+        :param file: The input file, or its job if checkpoint is a job queue
+        :param checkpoint: The checkpoint, or the job queue, where the file is recorded
+        :param writer: The writer of the output files
+        :param on_done: Called once the file is recorded as done. Its errors are printed
+        """
+        self.file = file
+        self.checkpoint = checkpoint
+        self.writer = writer
+        self.on_done = on_done
+        self.output_files = []
+        # True if the job was reclaimed by another worker, and nothing was recorded
+        self.lost = False
+        self._pending_files = 0
+        self._closed = False
+        self._failed = False
+
+    def write(self, output_file: str, data: bytes) -> str:
+        """
+        Saves an output file of the input file with the writer. See OutputWriter.write.
+        """
+        self._pending_files += 1
+        output_file = self.writer.write(output_file, data, on_saved=self._on_saved, on_failed=self._on_failed)
+        self.output_files.append(output_file)
+        return output_file
+
+    def close(self) -> None:
+        """
+        Tells that all the output files are written: the input file is recorded once they are saved.
+        """
+        self._closed = True
+        self._finish()
+
+    def _on_saved(self, output_file: str):
+        self._pending_files -= 1
+        self._finish()
+
+    def _on_failed(self, error: Exception):
+        if not self._failed:
+            self._failed = True
+            self.checkpoint.set_failed(self.file, error)
+
+    def _finish(self):
+        if not self._closed or self._pending_files > 0 or self._failed:
+            return
+        # Job queues return False if the job was reclaimed by another worker
+        if self.checkpoint.set_done(self.file, self.output_files) is False:
+            self.lost = True
+            file = self.file.file if isinstance(self.file, QueueJob) else self.file
+            generic_warning_message(f"{os.path.basename(file)} was claimed by another worker (lease expired)")
+        elif self.on_done is not None:
+            try:
+                self.on_done()
+            except Exception as e:
+                generic_error_message(e)
+
+
+def _write_file(output_file: str, data: bytes):
+    output_dir = os.path.dirname(output_file)
+    os.makedirs(output_dir, exist_ok=True)
+    # O_EXCL with a random name: concurrent writers never share a temporary file, and the umask applies as for open()
+    temp_file = os.path.join(output_dir, f".{os.path.basename(output_file)}.{uuid.uuid4().hex[:8]}.tmp")
+    fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
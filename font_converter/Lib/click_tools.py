@@ -1,6 +1,14 @@
 import os
+import re
+import threading
 
 import click
+from fontTools.subset import parse_unicodes
+
+from font_converter.Lib.verifier import MAX_AREA_RATIO, MAX_DEVIATION
+
+# Serializes the messages printed by concurrent threads, so that lines are never interleaved
+_output_lock = threading.Lock()
 
 
 def add_options(options):
@@ -41,6 +49,14 @@ def add_common_options():
             help="Specify the directory where output files are to be saved. If output_dir doesn't exist, will "
             "be created. If not specified, files are saved to the same folder.",
         ),
+        click.option(
+            "--output-archive",
+            "outputArchive",
+            type=click.Path(dir_okay=False, resolve_path=True),
+            default=None,
+            help="Write the output files into this zip or tar archive (.zip, .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz) "
+            "instead of saving them to disk. Their paths relative to the output directory are kept in the archive.",
+        ),
         click.option(
             "--recalc-timestamp",
             "recalcTimestamp",
@@ -53,14 +69,323 @@ def add_common_options():
             "--no-overwrite",
             "overWrite",
             is_flag=True,
+            flag_value=False,
             default=True,
             help="Overwrite existing output files or save them to a new file (numbers are appended at the end "
             "of file name). By default, files are overwritten.",
         ),
+        click.option(
+            "-r",
+            "--recursive",
+            is_flag=True,
+            default=False,
+            help="Also process the fonts in the subfolders of INPUT_PATH. The folder structure is preserved in the "
+            "output directory.",
+        ),
+        click.option(
+            "--include",
+            multiple=True,
+            help="Only process files whose name or relative path matches this glob pattern (e.g. '*.ttf'). Can be "
+            "repeated.",
+        ),
+        click.option(
+            "--exclude",
+            multiple=True,
+            help="Skip files and folders whose name or relative path matches this glob pattern (e.g. 'drafts'). Can "
+            "be repeated.",
+        ),
+        click.option(
+            "--checkpoint",
+            "checkpointFile",
+            type=click.Path(dir_okay=False, resolve_path=True),
+            default=None,
+            help="Record the converted files in this file as the batch progresses. When the command is run again with "
+            "the same checkpoint, files that were already converted and didn't change are skipped.",
+        ),
+        click.option(
+            "--io-buffer",
+            "ioBuffer",
+            callback=_parse_memory_size,
+            default="64M",
+            show_default=True,
+            help="Memory used to read the next input files ahead, and to save the output files in the background, "
+            "while fonts are converted, e.g. '64M'. 0 reads and saves each file when it's converted.",
+        ),
     ]
     return add_options(_common_options)
 
 
+def add_watch_options():
+    _watch_options = [
+        click.option(
+            "--watch",
+            is_flag=True,
+            default=False,
+            help="After converting the input files, keep watching the input path and convert the files that are "
+            "added or changed, until Ctrl+C is pressed.",
+        ),
+        click.option(
+            "--debounce",
+            type=click.FloatRange(min=0),
+            default=1.0,
+            show_default=True,
+            help="With --watch, seconds without further writes to wait before converting changed files.",
+        ),
+        click.option(
+            "--poll",
+            is_flag=True,
+            default=False,
+            help="With --watch, poll the input path instead of using inotify. Use it for network shares, where "
+            "inotify doesn't report changes made by other machines.",
+        ),
+    ]
+    return add_options(_watch_options)
+
+
+def add_parallel_options():
+    _parallel_options = [
+        click.option(
+            "-j",
+            "--workers",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Number of fonts converted in parallel, each in its own process.",
+        ),
+        click.option(
+            "--memory-budget",
+            "memoryBudget",
+            callback=_parse_memory_size,
+            default=None,
+            help="With --workers, the memory that the fonts converted at the same time may use, e.g. '4G' or '512M'. "
+            "The memory needed by each font is estimated from its tables. By default, the memory currently "
+            "available is used.",
+        ),
+        click.option(
+            "--font-timeout",
+            "fontTimeout",
+            type=click.FloatRange(min=0, min_open=True),
+            default=None,
+            help="Maximum time in seconds to convert a font. A font that takes longer is reported as failed, its "
+            "worker process is killed and the batch goes on. Fonts are converted in worker processes, even without "
+            "--workers.",
+        ),
+        click.option(
+            "--glyph-timeout",
+            "glyphTimeout",
+            type=click.FloatRange(min=0, min_open=True),
+            default=None,
+            help="Maximum time in seconds to convert a glyph. The font of a glyph that takes longer is reported as "
+            "failed, with the name of the glyph. Fonts are converted in worker processes, even without --workers.",
+        ),
+    ]
+    return add_options(_parallel_options)
+
+
+def add_thread_options():
+    _thread_options = [
+        click.option(
+            "--threads",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Number of fonts converted in parallel, in threads of the same process. Progress is printed in input "
+            "order.",
+        ),
+    ]
+    return add_options(_thread_options)
+
+
+def add_queue_options():
+    _queue_options = [
+        click.option(
+            "--queue",
+            "queueDir",
+            type=click.Path(file_okay=False, resolve_path=True),
+            default=None,
+            help="Run as a worker of a job queue kept in this spool directory, shared by any number of workers on one "
+            "or many hosts (e.g. on an NFS volume). Each worker enqueues the fonts found in INPUT_PATH, then converts "
+            "the pending jobs until the queue is empty.",
+        ),
+        click.option(
+            "--lease-timeout",
+            "leaseTimeout",
+            type=click.FloatRange(min=1),
+            default=60.0,
+            show_default=True,
+            help="With --queue, seconds without heartbeats after which the jobs of a worker are considered lost and "
+            "are converted by other workers.",
+        ),
+    ]
+    return add_options(_queue_options)
+
+
+def add_subset_options():
+    _subset_options = [
+        click.option(
+            "--unicodes",
+            multiple=True,
+            callback=_parse_unicodes,
+            help="Subset the fonts before converting them: keep only the glyphs reachable from these code points, "
+            "following layout substitutions. Hex values and ranges, comma or space separated (e.g. "
+            "'U+0020-007E,U+00A0-00FF'). Can be repeated.",
+        ),
+        click.option(
+            "--text-file",
+            "textFile",
+            type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+            default=None,
+            help="Subset the fonts before converting them: keep only the glyphs needed to render the characters of "
+            "this UTF-8 text file. Can be combined with --unicodes.",
+        ),
+        click.option(
+            "--layout-features",
+            "layoutFeatures",
+            multiple=True,
+            callback=_parse_layout_features,
+            help="Subset the fonts before converting them: keep only these layout features, comma separated (e.g. "
+            "'kern,liga,calt'), and remove the glyphs only reachable from the others. Can be repeated. By default, all "
+            "features are kept.",
+        ),
+    ]
+    return add_options(_subset_options)
+
+
+def add_layout_options():
+    _layout_options = [
+        click.option(
+            "--optimize-layout",
+            "optimizeLayout",
+            is_flag=True,
+            default=False,
+            help="Losslessly reduce the size of the GDEF, GSUB and GPOS tables of the output fonts: remove unreachable "
+            "lookups and unused features, compact class kerning and share identical subtables. The size of each table "
+            "before and after optimization is reported.",
+        ),
+    ]
+    return add_options(_layout_options)
+
+
+def add_dedup_options():
+    _dedup_options = [
+        click.option(
+            "--no-dedup",
+            "dedup",
+            is_flag=True,
+            flag_value=False,
+            default=True,
+            help="Convert every input file, even if it contains the same font as another input file in a different "
+            "container (e.g. Font.ttf and Font.woff2). By default, each font is converted once and the outputs of its "
+            "duplicates are made from the same result.",
+        ),
+    ]
+    return add_options(_dedup_options)
+
+
+def add_verify_options(verify_flag=True):
+    _verify_options = [
+        click.option(
+            "--max-deviation",
+            "maxDeviation",
+            type=click.FloatRange(min=0),
+            default=MAX_DEVIATION,
+            show_default=True,
+            help="Maximum distance between the source and the converted outline of a glyph, in 1/1000 of unitsPerEm.",
+        ),
+        click.option(
+            "--max-area",
+            "maxArea",
+            type=click.FloatRange(min=0),
+            default=MAX_AREA_RATIO,
+            show_default=True,
+            help="Maximum area covered by only one of the source and the converted outline of a glyph (XOR), as a "
+            "ratio of the area of the source glyph.",
+        ),
+    ]
+    if verify_flag:
+        _verify_options.insert(
+            0,
+            click.option(
+                "--verify",
+                is_flag=True,
+                help="Compare the outlines of each converted font with the source font, and treat the conversion as "
+                "failed (the output is not saved) if a glyph differs more than --max-deviation or --max-area.",
+            ),
+        )
+    return add_options(_verify_options)
+
+
+def add_sweep_options():
+    _sweep_options = [
+        click.option(
+            "--tolerances",
+            callback=_parse_float_list,
+            default="0.25,0.5,1,1.5,2,2.5",
+            show_default=True,
+            help="The ttf2otf tolerances to try on TrueType fonts, comma separated, in 1/1000 of unitsPerEm.",
+        ),
+        click.option(
+            "--max-errors",
+            "maxErrors",
+            callback=_parse_float_list,
+            default="0.25,0.5,1,2",
+            show_default=True,
+            help="The otf2ttf maximum approximation errors to try on CFF fonts, comma separated, in font units.",
+        ),
+        click.option(
+            "--subroutinize",
+            type=click.Choice(["both", "on", "off"]),
+            default="both",
+            show_default=True,
+            help="Convert TrueType fonts with subroutinization, without it, or both.",
+        ),
+        click.option(
+            "--no-verify",
+            "verify",
+            is_flag=True,
+            flag_value=False,
+            default=True,
+            help="Don't measure the deviation of the converted outlines from the source outlines. Faster.",
+        ),
+    ]
+    return add_options(_sweep_options)
+
+
+def _parse_float_list(ctx, param, value):
+    try:
+        values = [float(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is not a valid list of numbers. Use e.g. '0.5,1,2'.")
+    if not values or any(v < 0 for v in values):
+        raise click.BadParameter(f"'{value}' is not a valid list of positive numbers. Use e.g. '0.5,1,2'.")
+    return values
+
+
+def _parse_unicodes(ctx, param, value):
+    if not value:
+        return None
+    try:
+        return parse_unicodes(",".join(value))
+    except ValueError:
+        raise click.BadParameter(f"'{' '.join(value)}' is not a valid list of code points. Use e.g. 'U+0020-007E'.")
+
+
+def _parse_layout_features(ctx, param, value):
+    if not value:
+        return None
+    return [tag.strip() for tags in value for tag in tags.split(",") if tag.strip()]
+
+
+def _parse_memory_size(ctx, param, value):
+    if value is None:
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?", value.strip(), re.IGNORECASE)
+    if not match:
+        raise click.BadParameter(f"'{value}' is not a valid memory size. Use a number of bytes, or e.g. '4G', '512M'.")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
+
+
 def select_instance_coordinates(axes: list) -> dict:
     click.secho("\nSelect coordinates:")
     selected_coordinates = {}
@@ -82,31 +407,36 @@ def no_valid_fonts_message(input_path):
         message = f"No valid font files found in {input_path}"
     else:
         message = f"{input_path} is not a valid font file"
-    click.secho(f"[{click.style('FAIL', fg='red')}] {message}")
+    _echo(f"[{click.style('FAIL', fg='red')}] {message}")
 
 
 def file_not_exists_message(file):
-    click.secho(
+    _echo(
         f"[{click.style('WARN', fg='yellow')}] {os.path.basename(file)} "
         f"{click.style('file does not exist', fg='yellow')}"
     )
 
 
 def file_saved_message(file):
-    click.secho(f"[{click.style('DONE', fg='green')}] {file} {click.style('saved', fg='green')}")
+    _echo(f"[{click.style('DONE', fg='green')}] {file} {click.style('saved', fg='green')}")
 
 
 def generic_success_message(success_message):
-    click.secho(f"[{click.style('PASS', fg='green')}] {success_message}")
+    _echo(f"[{click.style('PASS', fg='green')}] {success_message}")
 
 
 def generic_info_message(info_message, nl=True):
-    click.secho(f"[{click.style('INFO', fg='cyan')}] {info_message}", nl=nl)
+    _echo(f"[{click.style('INFO', fg='cyan')}] {info_message}", nl=nl)
 
 
 def generic_error_message(error_message):
-    click.secho(f"[{click.style('FAIL', fg='red')}] {error_message}")
+    _echo(f"[{click.style('FAIL', fg='red')}] {error_message}")
 
 
 def generic_warning_message(warning_message):
-    click.secho(f"[{click.style('WARN', fg='yellow')}] {warning_message}")
+    _echo(f"[{click.style('WARN', fg='yellow')}] {warning_message}")
+
+
+def _echo(message: str, nl=True):
+    with _output_lock:
+        click.secho(message, nl=nl)
@@ -1,14 +1,17 @@
 import logging
 
-from fontTools import configLogger
 from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.recordingPen import RecordingPen
 from fontTools.pens.ttGlyphPen import TTGlyphPen
 from fontTools.ttLib import TTLibError, newTable
 
 from font_converter.Lib.Font import Font
+from font_converter.Lib.coordinates import recalc_bounds
+from font_converter.Lib.timeouts import glyph_time_limit
 
-log = logging.getLogger()
-configLogger(logger=log)
+# Logging is configured by the application: configuring the root logger here would affect all the threads and modules
+# that import this one
+log = logging.getLogger(__name__)
 
 # default approximation error, measured in UPEM
 MAX_ERR = 1.0
@@ -21,14 +24,26 @@ POST_FORMAT = 2.0
 REVERSE_DIRECTION = True
 
 
-def glyphs_to_quadratic(glyphs, max_err=MAX_ERR, reverse_direction=REVERSE_DIRECTION):
+def glyphs_to_quadratic(glyphs, max_err=MAX_ERR, reverse_direction=REVERSE_DIRECTION, stats=None):
     quadGlyphs = {}
+    # Quadratic outlines by source outline: glyphs with the same outline are converted only once
+    quadOutlines = {}
     for gname in glyphs.keys():
-        glyph = glyphs[gname]
-        ttPen = TTGlyphPen(glyphs)
-        cu2quPen = Cu2QuPen(ttPen, max_err, reverse_direction=reverse_direction)
-        glyph.draw(cu2quPen)
-        quadGlyphs[gname] = ttPen.glyph()
+        with glyph_time_limit(gname):
+            glyph = glyphs[gname]
+            recPen = RecordingPen()
+            glyph.draw(recPen)
+            outline = tuple(recPen.value)
+            quadPen = quadOutlines.get(outline)
+            if quadPen is None:
+                quadPen = quadOutlines[outline] = RecordingPen()
+                cu2quPen = Cu2QuPen(quadPen, max_err, reverse_direction=reverse_direction)
+                recPen.replay(cu2quPen)
+            elif stats is not None:
+                stats["deduplicated_glyphs"] = stats.get("deduplicated_glyphs", 0) + 1
+            ttPen = TTGlyphPen(glyphs)
+            quadPen.replay(ttPen)
+            quadGlyphs[gname] = ttPen.glyph()
     return quadGlyphs
 
 
@@ -53,7 +68,9 @@ def otf_2_ttf(ttFont: Font, post_format=POST_FORMAT, **kwargs):
     del ttFont["CFF "]
     if "VORG" in ttFont:
         del ttFont["VORG"]
-    glyf.compile(ttFont)
+    # The bounds are needed to update hmtx and maxp. The glyf table itself is compiled when the font is saved
+    if ttFont.recalcBBoxes:
+        recalc_bounds(glyf, glyphOrder)
     update_hmtx(ttFont, glyf)
 
     ttFont["maxp"] = maxp = newTable("maxp")
@@ -81,6 +98,9 @@ def otf_2_ttf(ttFont: Font, post_format=POST_FORMAT, **kwargs):
 
     ttFont.sfntVersion = "\000\001\000\000"
 
+    # The other tables are written as they were in the source font, without compiling them again
+    ttFont.release_unmodified_tables(modified_tables=("loca", "glyf", "hmtx", "maxp", "post"))
+
 
 def run(input_file, output_file, recalc_timestamp=False):
     font = Font(input_file, recalcTimestamp=recalc_timestamp)
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import cffsubr
+from fontTools.ttLib import TTFont, newTable
+
+# The function of cffsubr that subroutinizes raw CFF table data is private: if a cffsubr release removes it, whole fonts
+# are subroutinized with the public cffsubr.subroutinize
+_tx_subroutinize = getattr(cffsubr, "_tx_subroutinize", None)
+
+
+def compile_cff_table(font: TTFont) -> bytes:
+    """
+    Compiles the font's CFF table alone, without compiling the rest of the font.
+
+    :param font: A CFF-flavored font
+    :return: The raw 'CFF ' table data.
+    """
+    # Ensure the glyph order is decompiled before the CFF table is replaced
+    _ = font.getGlyphOrder()
+    return font["CFF "].compile(font)
+
+
+def replace_cff_table(font: TTFont, data: bytes) -> None:
+    """
+    Replaces the font's CFF table with the given raw table data.
+
+    :param font: A CFF-flavored font
+    :param data: The raw 'CFF ' table data
+    """
+    cff_table = newTable("CFF ")
+    cff_table.decompile(data, font)
+    font["CFF "] = cff_table
+
+
+def subroutinize(font: TTFont) -> None:
+    """
+    Subroutinizes the font's CFF table in place. Unlike cffsubr.subroutinize, only the CFF table data is passed to the
+    external subroutinizer, so the rest of the font is neither compiled nor parsed again.
+
+    :param font: A CFF-flavored font
+    """
+    if _tx_subroutinize is None:
+        cffsubr.subroutinize(font)
+        return
+    replace_cff_table(font, _tx_subroutinize(compile_cff_table(font)))
+
+
+class Subroutinizer(object):
+    """
+    Runs the external CFF subroutinizer in background threads.
+
+    The tx process runs outside the interpreter, so while a font is being subroutinized the calling thread is free to
+    convert the outlines of the next font in the batch. The CFF table is compiled in the calling thread when a font is
+    submitted; the font must not be modified until its future is done.
+    """
+
+    def __init__(self, max_workers: int = None):
+        """
+        :param max_workers: The maximum number of concurrent tx processes. Defaults to the number of CPUs
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def submit(self, font: TTFont, output_file=None) -> Future:
+        """
+        Schedules the subroutinization of a font's CFF table, and optionally saves the font when done.
+
+        :param font: A CFF-flavored font
+        :param output_file: A path or a file object where the font is saved after subroutinization. If None, the font
+            is modified in place but not saved
+        :return: A future that resolves to the subroutinized font.
+        """
+        data = compile_cff_table(font) if _tx_subroutinize is not None else None
+        return self._executor.submit(self._subroutinize, font, data, output_file)
+
+    def subroutinize_family(self, fonts: list) -> list:
+        """
+        Subroutinizes several fonts concurrently, modifying them in place.
+
+        The bundled tx can't reliably subroutinize several fonts in a single invocation, so one process per font is
+        spawned, up to max_workers at a time.
+
+        :param fonts: A list of CFF-flavored fonts
+        :return: The list of subroutinized fonts.
+        """
+        futures = [self.submit(font) for font in fonts]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    @staticmethod
+    def _subroutinize(font: TTFont, data: Optional[bytes], output_file) -> TTFont:
+        if data is None:
+            cffsubr.subroutinize(font)
+        else:
+            replace_cff_table(font, _tx_subroutinize(data))
+        if output_file is not None:
+            font.save(output_file)
+        return font
@@ -1,20 +1,56 @@
-import cffsubr
+from concurrent.futures import Future
+from typing import List, Optional
+
 import pathops
+from fontTools.misc.psCharStrings import T2CharString
 from fontTools.fontBuilder import FontBuilder
+from fontTools.misc.roundTools import otRound
 from fontTools.pens.qu2cuPen import Qu2CuPen
+from fontTools.pens.recordingPen import RecordingPen
 from fontTools.pens.t2CharStringPen import T2CharStringPen
 from fontTools.subset import Subsetter
+from fontTools.ttLib import TTLibError
 
 from font_converter.Lib.Font import Font
-from font_converter.Lib.click_tools import generic_error_message, generic_warning_message
+from font_converter.Lib.click_tools import generic_warning_message
+from font_converter.Lib.converters.subroutinizer import Subroutinizer, subroutinize as subroutinize_cff
+from font_converter.Lib.glyph_remover import GlyphRemover
+from font_converter.Lib.outlines import needs_overlap_removal
+from font_converter.Lib.timeouts import glyph_time_limit
 
 
 class TrueTypeToCFF(object):
     def __init__(self, font: Font, output_file):
         self.font = font
         self.output_file = output_file
+        self.stats = dict(simplified_glyphs=0, skipped_glyphs=0, deduplicated_glyphs=0)
+        self.glyph_order_changed = False
+
+    # Number of tolerances tried for each glyph when searching the one that produces the smallest charstring
+    TOLERANCE_SEARCH_STEPS = 5
+
+    def run(
+        self,
+        charstrings_source="qu2cu",
+        tolerance=1,
+        purge_glyphs=True,
+        subroutinize=True,
+        subroutinizer: Subroutinizer = None,
+        max_tolerance: float = None,
+    ) -> Optional[Future]:
+        """
+        Converts the font to CFF and saves it to self.output_file.
 
-    def run(self, charstrings_source="qu2cu", tolerance=1, purge_glyphs=True, subroutinize=True):
+        :param charstrings_source: "qu2cu" to convert outlines with Qu2CuPen, "t2" to use T2CharStringPen
+        :param tolerance: Qu2CuPen tolerance, in font units
+        :param purge_glyphs: If True, 'NULL' and 'CR' glyphs are removed
+        :param subroutinize: If True, the CFF table is subroutinized
+        :param subroutinizer: If given, subroutinization and saving are delegated to it and run in background
+        :param max_tolerance: If greater than tolerance, each glyph is converted with the tolerance between tolerance
+            and max_tolerance (in font units) that produces the smallest charstring. See get_qu2u_charstrings
+        :return: None, or a future that is done when the font has been subroutinized and saved if a subroutinizer was
+            given.
+        """
         if purge_glyphs:
             self.purge_glyphs()
 
@@ -23,21 +59,23 @@ class TrueTypeToCFF(object):
         if charstrings_source == "qu2cu":
             self.font.decomponentize()
             try:
-                charstrings = self.get_qu2u_charstrings(tolerance=tolerance, all_cubic=True)
+                charstrings = self.get_qu2u_charstrings(
+                    tolerance=tolerance, all_cubic=True, max_tolerance=max_tolerance
+                )
             except NotImplementedError:
                 generic_warning_message("all_cubic set to False")
                 try:
-                    charstrings = self.get_qu2u_charstrings(tolerance=tolerance, all_cubic=False)
+                    charstrings = self.get_qu2u_charstrings(
+                        tolerance=tolerance, all_cubic=False, max_tolerance=max_tolerance
+                    )
                 except Exception as e:
-                    generic_error_message(f"Failed to get charstring with Qu2CuPen ({e})")
-                    return
+                    raise TTLibError(f"Failed to get charstring with Qu2CuPen ({e})")
 
         if charstrings_source == "t2":
             try:
                 charstrings = self.get_t2_charstrings()
             except Exception as e:
-                generic_error_message(f"Failed to get charstrings with T2CharStringPen ({e})")
-                return
+                raise TTLibError(f"Failed to get charstrings with T2CharStringPen ({e})")
 
         cff_font_info = self.get_cff_font_info()
         post_values = self.get_post_values()
@@ -58,13 +96,16 @@ class TrueTypeToCFF(object):
         fb.setupMaxp()
         fb.setupPost(**post_values)
 
+        # The other tables are written as they were in the source font, without compiling them again
+        self.font.release_unmodified_tables(
+            modified_tables=("CFF ", "DSIG", "maxp", "post"), glyph_order_changed=self.glyph_order_changed
+        )
+
         if subroutinize:
-            # cffsubr doesn't work with woff/woff2 fonts
-            flavor = fb.font.flavor
-            if flavor is not None:
-                fb.font.flavor = None
-            cffsubr.subroutinize(fb.font)
-            fb.font.flavor = flavor
+            if subroutinizer is not None:
+                return subroutinizer.submit(fb.font, output_file=self.output_file)
+            # Only the CFF table is passed to the subroutinizer, so this also works with woff/woff2 fonts
+            subroutinize_cff(fb.font)
 
         fb.save(self.output_file)
 
@@ -112,39 +153,107 @@ class TrueTypeToCFF(object):
             except KeyError:
                 pass
 
-        glyph_ids = [i for i in self.font.getReverseGlyphMap().values() if i not in glyph_ids_to_remove]
-        if len(glyph_ids_to_remove) > 0:
-            subsetter = Subsetter()
-            subsetter.options.drop_tables = []
-            subsetter.options.passthrough_tables = True
-            subsetter.options.name_IDs = "*"
-            subsetter.options.name_legacy = True
-            subsetter.options.name_languages = "*"
-            subsetter.options.layout_features = "*"
-            subsetter.options.hinting = False
-            subsetter.glyph_ids_requested = glyph_ids
-            Subsetter.subset(subsetter, self.font)
-
-    def get_qu2u_charstrings(self, tolerance: float = 1, all_cubic: bool = True):
+        if len(glyph_ids_to_remove) == 0:
+            return
+
+        subsetter = Subsetter()
+        subsetter.options.drop_tables = []
+        subsetter.options.passthrough_tables = True
+        subsetter.options.name_IDs = "*"
+        subsetter.options.name_legacy = True
+        subsetter.options.name_languages = "*"
+        subsetter.options.layout_features = "*"
+        subsetter.options.hinting = False
+        # Only NULL and CR are removed: .notdef keeps its outline
+        subsetter.options.notdef_outline = True
+
+        # Try to remove the glyphs only from the structures that reference them, and fall back to the Subsetter when
+        # they are used in lookups that can't be edited locally. Both produce the same font.
+        self.glyph_order_changed = True
+        glyph_order = self.font.getGlyphOrder()
+        if GlyphRemover(self.font, [glyph_order[i] for i in glyph_ids_to_remove], options=subsetter.options).run():
+            return
+
+        subsetter.glyph_ids_requested = [
+            i for i in self.font.getReverseGlyphMap().values() if i not in glyph_ids_to_remove
+        ]
+        Subsetter.subset(subsetter, self.font)
+
+    def get_qu2u_charstrings(self, tolerance: float = 1, all_cubic: bool = True, max_tolerance: float = None):
+        """
+        Get CFF charstrings converting the TrueType outlines with Qu2CuPen
+
+        When max_tolerance is greater than tolerance, each glyph is converted with TOLERANCE_SEARCH_STEPS tolerances
+        evenly spaced between the two, and the smallest charstring is kept (the lowest tolerance wins ties). Since
+        Qu2CuPen never deviates from the quadratic outline by more than its tolerance, every glyph stays within
+        max_tolerance. The bytes saved compared to converting all glyphs with tolerance, before subroutinization, are
+        counted in self.stats["saved_bytes"].
+
+        :param tolerance: Qu2CuPen tolerance, in font units
+        :param all_cubic: If True, all quadratic curves are converted to cubic curves
+        :param max_tolerance: The maximum tolerance of the per glyph search, in font units. If None, tolerance is used
+            for all glyphs
+        :return: CFF charstrings.
+        """
         charstrings = {}
         glyph_set = self.font.getGlyphSet()
+        self.stats.update(simplified_glyphs=0, skipped_glyphs=0, deduplicated_glyphs=0, saved_bytes=0)
+        tolerances = _get_tolerance_steps(tolerance, max_tolerance, self.TOLERANCE_SEARCH_STEPS)
+
+        # Charstring programs without the advance width, and bytes saved by the tolerance search, by outline
+        programs = {}
+        saved_bytes = {}
 
         for k, v in glyph_set.items():
-            # Correct contours direction and remove overlaps with pathops
-            pathops_path = pathops.Path()
-            pathops_pen = pathops_path.getPen(glyphSet=glyph_set)
-            try:
-                glyph_set[k].draw(pathops_pen)
-                pathops_path.simplify()
-            except TypeError:
-                pass
+            with glyph_time_limit(k):
+                recording_pen = RecordingPen()
+                glyph_set[k].draw(recording_pen)
+                outline = tuple(recording_pen.value)
 
-            t2_pen = T2CharStringPen(v.width, glyphSet=glyph_set)
-            qu2cu_pen = Qu2CuPen(t2_pen, max_err=tolerance, all_cubic=all_cubic, reverse_direction=False)
-            pathops_path.draw(qu2cu_pen)
+                # Glyphs with the same outline are converted only once
+                program = programs.get(outline)
+                if program is not None:
+                    charstrings[k] = _get_charstring(program, width=v.width)
+                    self.stats["deduplicated_glyphs"] += 1
+                    self.stats["saved_bytes"] += saved_bytes[outline]
+                    continue
 
-            charstring = t2_pen.getCharString()
-            charstrings[k] = charstring
+                # Correct contours direction and remove overlaps with pathops. Glyphs that have no overlaps and whose
+                # contours direction is consistent are only reversed if needed, which is much cheaper than simplify.
+                pathops_path = pathops.Path()
+                pathops_pen = pathops_path.getPen(glyphSet=glyph_set)
+                try:
+                    recording_pen.replay(pathops_pen)
+                    if needs_overlap_removal(pathops_path):
+                        pathops_path.simplify()
+                        self.stats["simplified_glyphs"] += 1
+                    else:
+                        if pathops_path.clockwise:
+                            pathops_path.reverse()
+                        self.stats["skipped_glyphs"] += 1
+                except TypeError:
+                    pass
+
+                program = None
+                fixed_tolerance_size = size = 0
+                for t in tolerances:
+                    t2_pen = T2CharStringPen(None, glyphSet=glyph_set)
+                    qu2cu_pen = Qu2CuPen(t2_pen, max_err=t, all_cubic=all_cubic, reverse_direction=False)
+                    pathops_path.draw(qu2cu_pen)
+                    candidate = t2_pen.getCharString().program
+                    if len(tolerances) == 1:
+                        program = candidate
+                        break
+                    candidate_size = _get_program_size(candidate)
+                    if program is None:
+                        fixed_tolerance_size = candidate_size
+                    if program is None or candidate_size < size:
+                        program, size = candidate, candidate_size
+
+                programs[outline] = program
+                saved_bytes[outline] = fixed_tolerance_size - size
+                self.stats["saved_bytes"] += saved_bytes[outline]
+                charstrings[k] = _get_charstring(program, width=v.width)
 
         return charstrings
 
@@ -156,12 +265,41 @@ class TrueTypeToCFF(object):
         """
         charstrings = {}
         glyph_set = self.font.getGlyphSet()
+        self.stats.update(deduplicated_glyphs=0)
+
+        # Charstring programs without the advance width, by outline
+        programs = {}
 
         for k, v in glyph_set.items():
-            # Draw the glyph with T2CharStringPen and get the charstring
-            t2_pen = T2CharStringPen(v.width, glyphSet=glyph_set)
-            glyph_set[k].draw(t2_pen)
-            charstring = t2_pen.getCharString()
-            charstrings[k] = charstring
+            recording_pen = RecordingPen()
+            glyph_set[k].draw(recording_pen)
+            outline = tuple(recording_pen.value)
+
+            program = programs.get(outline)
+            if program is not None:
+                self.stats["deduplicated_glyphs"] += 1
+            else:
+                # Draw the glyph with T2CharStringPen and get the charstring
+                t2_pen = T2CharStringPen(None, glyphSet=glyph_set)
+                recording_pen.replay(t2_pen)
+                program = programs[outline] = t2_pen.getCharString().program
+            charstrings[k] = _get_charstring(program, width=v.width)
 
         return charstrings
+
+
+def _get_tolerance_steps(tolerance: float, max_tolerance: Optional[float], steps: int) -> List[float]:
+    if max_tolerance is None or max_tolerance <= tolerance:
+        return [tolerance]
+    return [tolerance + (max_tolerance - tolerance) * i / (steps - 1) for i in range(steps)]
+
+
+def _get_program_size(program: list) -> int:
+    charstring = T2CharString(program=program)
+    charstring.compile()
+    return len(charstring.bytecode)
+
+
+def _get_charstring(program: list, width: float) -> T2CharString:
+    # Same as T2CharStringPen(width).getCharString(), from a program drawn without width
+    return T2CharString(program=[otRound(width)] + program)
@@ -0,0 +1,176 @@
+"""
+Optional NumPy backend for glyph coordinate math: decomposition of composite glyphs and bounding boxes.
+
+The functions here return exactly the same glyphs and bounds as the pen based code they replace, but process all the
+points of a glyph (or of the whole font) as arrays. They are only used when NumPy is installed: HAVE_NUMPY tells
+whether it is.
+"""
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+from fontTools.misc.transform import Identity, Transform
+from fontTools.ttLib.tables import ttProgram
+from fontTools.ttLib.tables._g_l_y_f import Glyph, GlyphCoordinates, flagCubic, flagOnCurve, table__g_l_y_f
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAVE_NUMPY = np is not None
+
+
+def decompose_glyph(glyf_table: table__g_l_y_f, h_metrics: dict, glyph: Glyph) -> Optional[Glyph]:
+    """
+    Decomposes a composite glyph. The result is the same as drawing the glyph with DecomposingRecordingPen and
+    replaying it into a TTGlyphPen: contours start at their first on-curve point, closing points that duplicate the
+    start point and single point contours are dropped, and coordinates are rounded with otRound.
+
+    :param glyf_table: The glyf table
+    :param h_metrics: The hmtx metrics, as a {glyph_name: (advance_width, lsb)} dictionary
+    :param glyph: The composite glyph
+    :return: The decomposed glyph, or None if the glyph uses features not supported here (missing components,
+        components positioned by matching points, cubic curves). Use the pen based path for those.
+    """
+    leaves = _get_leaves(glyf_table, h_metrics, glyph, transform=None, depth=0)
+    if leaves is None:
+        return None
+
+    points = []
+    types = []
+    end_pts = []
+    count = 0
+    for leaf, transform, offset in leaves:
+        leaf.expand(glyf_table)
+        coordinates, leaf_end_pts, leaf_flags = leaf.getCoordinates(glyf_table)
+        leaf_flags = np.frombuffer(bytes(leaf_flags), dtype=np.uint8)
+        if np.any(leaf_flags & flagCubic):
+            return None
+        xy = np.array(coordinates.array, dtype=np.float64).reshape(-1, 2)
+        if offset:
+            xy[:, 0] += offset
+        if transform is not None:
+            xx, xy_, yx, yy, dx, dy = transform
+            x, y = xy[:, 0], xy[:, 1]
+            xy = np.stack((xx * x + yx * y + dx, xy_ * x + yy * y + dy), axis=1)
+        on_curve = (leaf_flags & flagOnCurve).astype(bool)
+
+        start = 0
+        for end in leaf_end_pts:
+            end += 1
+            contour = _get_contour_order(on_curve[start:end])
+            if contour is not None:
+                contour += start
+                # The pen drops the last point if it's the same as the first one
+                if len(contour) > 1 and _ends_with_start_point(xy, on_curve, contour):
+                    contour = contour[:-1]
+                points.append(xy[contour])
+                types.append(on_curve[contour])
+                count += len(contour)
+                end_pts.append(count - 1)
+            start = end
+
+    decomposed = Glyph()
+    if points:
+        rounded = np.floor(np.concatenate(points) + 0.5).astype(np.int64)
+        decomposed.coordinates = GlyphCoordinates(rounded.tolist())
+        decomposed.flags = array("B", np.concatenate(types).astype(np.uint8).tobytes())
+    else:
+        decomposed.coordinates = GlyphCoordinates()
+        decomposed.flags = array("B")
+    decomposed.endPtsOfContours = end_pts
+    decomposed.numberOfContours = len(end_pts)
+    decomposed.program = ttProgram.Program()
+    decomposed.program.fromBytecode(b"")
+    return decomposed
+
+
+def _get_leaves(
+    glyf_table: table__g_l_y_f, h_metrics: dict, glyph: Glyph, transform: Optional[Transform], depth: int
+) -> Optional[List[Tuple[Glyph, Optional[Transform], float]]]:
+    # Returns the simple glyphs drawn by a composite glyph, with their transformation (None when the pen doesn't
+    # transform them) and the horizontal offset applied by the glyph set, composing transformations like TransformPen
+    # and DecomposingPen do.
+    leaves = []
+    for component in glyph.components:
+        if not hasattr(component, "x") or component.glyphName not in glyf_table.glyphs:
+            return None
+        glyph_name, component_transform = component.getComponentInfo()
+        if transform is not None:
+            component_transform = transform.transform(component_transform)
+        component_transform = None if component_transform == Identity else Transform(*component_transform)
+
+        child = glyf_table[glyph_name]
+        if child.isComposite():
+            child_leaves = _get_leaves(glyf_table, h_metrics, child, component_transform, depth + 1)
+            if child_leaves is None:
+                return None
+            leaves.extend(child_leaves)
+        else:
+            # The glyph set shifts the outline by lsb - xMin, only at the top level
+            offset = 0
+            if depth == 0 and hasattr(child, "xMin"):
+                offset = h_metrics[glyph_name][1] - child.xMin
+            leaves.append((child, component_transform, offset))
+    return leaves
+
+
+def _get_contour_order(on_curve) -> Optional["np.ndarray"]:
+    # The indices of the contour points in the order TTGlyphPen receives them from Glyph.draw, or None if the contour
+    # is dropped (single point contours)
+    n = len(on_curve)
+    if n == 1:
+        return None
+    on_curve_indices = np.flatnonzero(on_curve)
+    if len(on_curve_indices) == 0:
+        return np.arange(n)
+    # Glyph.draw starts the contour with its first on-curve point
+    first = on_curve_indices[0]
+    return np.roll(np.arange(n), -first)
+
+
+def _ends_with_start_point(xy: "np.ndarray", on_curve: "np.ndarray", contour: "np.ndarray") -> bool:
+    first, last = contour[0], contour[-1]
+    if not on_curve[contour[0]]:
+        # Only off-curve points: drawn with qCurveTo(..., None)
+        return bool(np.all(xy[first] == xy[last]))
+    if not on_curve[last]:
+        # Closed by a curve: the pen adds the start point again and then drops it
+        return False
+    return bool(np.all(xy[first] == xy[last]))
+
+
+def recalc_bounds(glyf_table: table__g_l_y_f, glyph_names: Iterable[str]) -> None:
+    """
+    Sets the bounding box (xMin, yMin, xMax, yMax) of the given glyphs, like Glyph.recalcBounds does when the glyf
+    table is compiled. Bounds of simple glyphs are computed for all glyphs at once; empty glyphs are skipped (as
+    Glyph.compile does), and composite glyphs are left to Glyph.recalcBounds.
+
+    :param glyf_table: The glyf table
+    :param glyph_names: The glyphs whose bounds are calculated
+    """
+    simple_glyphs = []
+    sizes = []
+    coordinates = []
+    for glyph_name in glyph_names:
+        glyph = glyf_table[glyph_name]
+        if glyph.numberOfContours == 0 and not getattr(glyph, "program", None):
+            continue
+        if glyph.numberOfContours <= 0 or not HAVE_NUMPY:
+            glyph.recalcBounds(glyf_table)
+            continue
+        simple_glyphs.append(glyph)
+        sizes.append(len(glyph.coordinates))
+        coordinates.append(glyph.coordinates.array)
+
+    if not simple_glyphs:
+        return
+
+    xy = np.frombuffer(b"".join(a.tobytes() for a in coordinates), dtype=np.float64).reshape(-1, 2)
+    # Same as GlyphCoordinates.calcIntBounds
+    xy = np.floor(xy + 0.5)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    mins = np.minimum.reduceat(xy, starts, axis=0).astype(np.int64)
+    maxs = np.maximum.reduceat(xy, starts, axis=0).astype(np.int64)
+    for glyph, (x_min, y_min), (x_max, y_max) in zip(simple_glyphs, mins.tolist(), maxs.tolist()):
+        glyph.xMin, glyph.yMin, glyph.xMax, glyph.yMax = x_min, y_min, x_max, y_max
@@ -0,0 +1,150 @@
+"""
+Detection of input files that contain the same font in different containers (e.g. Font.ttf, Font.woff and Font.woff2),
+so that batch commands convert each font once and make the outputs of its duplicates from the same result.
+
+Fonts are identified by a fingerprint of their decoded tables, not of their files: the same tables stored as SFNT, WOFF
+or WOFF2 have the same fingerprint.
+"""
+import hashlib
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fontTools.ttLib import TTFont
+
+from font_converter.Lib.api import get_flavor
+from font_converter.Lib.archives import open_input
+
+# Memory kept for the results of the conversions of a batch, waiting for duplicates
+CACHE_SIZE = 64 << 20
+
+# DSIG is dropped by WOFF2 encoders, loca is derived from glyf
+_IGNORED_TABLES = ("DSIG", "loca")
+
+
+class ResultCache(object):
+    """
+    The results of the conversions of a batch, by fingerprint of the source font, for its duplicates found later in
+    the batch. When the results take more than max_bytes, the least recently used ones are dropped: the duplicates of a
+    dropped result are converted again.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self._results: "OrderedDict[str, Tuple[str, Any, int]]" = OrderedDict()
+        self._size = 0
+
+    def get(self, fingerprint: Optional[str]) -> Optional[Tuple[str, Any]]:
+        """
+        :param fingerprint: The fingerprint of the source font. None is never found
+        :return: The source file and the result of its conversion, or None if no font with this fingerprint was
+            converted (or its result was dropped).
+        """
+        if fingerprint not in self._results:
+            return None
+        self._results.move_to_end(fingerprint)
+        file, result, _ = self._results[fingerprint]
+        return file, result
+
+    def put(self, fingerprint: Optional[str], file: str, result: Any, size: int) -> None:
+        """
+        :param fingerprint: The fingerprint of the source font. If None, nothing is stored
+        :param file: The source file
+        :param result: The result of the conversion
+        :param size: The memory taken by the result, in bytes
+        """
+        if fingerprint is None or size > self.max_bytes:
+            return
+        if fingerprint in self._results:
+            self._size -= self._results.pop(fingerprint)[2]
+        self._results[fingerprint] = file, result, size
+        self._size += size
+        while self._size > self.max_bytes:
+            self._size -= self._results.popitem(last=False)[1][2]
+
+
+def get_fingerprint(file: str) -> Optional[str]:
+    """
+    Returns the SHA-256 of the decoded tables of a font, the same whether the font is stored as SFNT, WOFF or WOFF2. The
+    head fields that depend on the container (checkSumAdjustment, the WOFF2 transform flag and indexToLocFormat) are
+    ignored, and TrueType glyphs are hashed by their decoded contents, since WOFF2 decoders encode them again.
+
+    :param file: The font file
+    :return: The fingerprint, or None if the file can't be read as a font.
+    """
+    try:
+        with open_input(file) as f:
+            font = TTFont(f, lazy=True)
+            digest = hashlib.sha256(font.sfntVersion.encode("latin-1"))
+            for tag in sorted(font.reader.keys()):
+                if tag in _IGNORED_TABLES:
+                    continue
+                if tag == "glyf":
+                    data = _get_glyphs_digest(font)
+                elif tag == "head":
+                    data = bytearray(font.reader[tag])
+                    data[8:12] = bytes(4)
+                    data[16] &= 0xF7
+                    data[50:52] = bytes(2)
+                else:
+                    data = font.reader[tag]
+                digest.update(tag.encode("latin-1") + struct.pack(">L", len(data)))
+                digest.update(data)
+            return digest.hexdigest()
+    except Exception:
+        # The file is converted anyway, and its conversion reports why it can't be read
+        return None
+
+
+def get_file_flavor(file: str) -> Optional[str]:
+    """
+    Returns the flavor of a font file: "woff" or "woff2" for web fonts, None for SFNT fonts.
+    """
+    with open_input(file) as f:
+        return get_flavor(f.read(4))
+
+
+def group_duplicates(files: Iterable[str]) -> List[List[str]]:
+    """
+    Groups the files that contain the same font.
+
+    :param files: The font files
+    :return: The groups of files with the same fingerprint, in the order of their first file. Files whose fingerprint
+        can't be computed are in a group of their own.
+    """
+    groups: Dict[str, List[str]] = {}
+    result = []
+    for file in files:
+        fingerprint = get_fingerprint(file)
+        group = groups.get(fingerprint) if fingerprint is not None else None
+        if group is None:
+            group = [file]
+            result.append(group)
+            if fingerprint is not None:
+                groups[fingerprint] = group
+        else:
+            group.append(file)
+    return result
+
+
+def _get_glyphs_digest(font: TTFont) -> bytes:
+    glyf_table = font["glyf"]
+    digest = hashlib.sha256()
+    for glyph_name in font.getGlyphOrder():
+        glyph = glyf_table[glyph_name]
+        if glyph.isComposite():
+            data = glyph.compile(glyf_table, recalcBBoxes=False)
+        elif glyph.numberOfContours > 0:
+            data = b"".join(
+                (
+                    struct.pack(f">{len(glyph.endPtsOfContours)}H", *glyph.endPtsOfContours),
+                    bytes(glyph.flags),
+                    glyph.coordinates.array.tobytes(),
+                    glyph.program.getBytecode(),
+                )
+            )
+        else:
+            data = glyph.program.getBytecode() if hasattr(glyph, "program") else b""
+        digest.update(struct.pack(">L", len(data)))
+        digest.update(data)
+    return digest.digest()
@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import deque
+from fnmatch import fnmatch
+from typing import Iterable, Iterator
+
+from font_converter.Lib.archives import InMemoryFile, is_archive, iter_archive
+
+
+def iter_files(input_path: str, recursive=False, include: tuple = None, exclude: tuple = None) -> Iterator[str]:
+    """
+    Yields the files in a folder as they are found, using os.scandir. Files are yielded in name order, folder by
+    folder, so that memory usage doesn't depend on the size of the tree.
+
+    Glob patterns are matched against both the file (or folder) name and its path relative to the input folder, using
+    forward slashes: "*.ttf" matches all TrueType files, "drafts/*" all files in the drafts folder.
+
+    Zip and tar archives are read like folders (always recursively): their members are yielded as ArchiveMember paths,
+    in archive order.
+
+    :param input_path: The path to a file, a folder or an archive. If it's a file, only that file is yielded
+    :param recursive: If True, subfolders are searched too
+    :param include: Glob patterns of the files to yield. If None, all files are yielded
+    :param exclude: Glob patterns of the files to skip, and of the subfolders not to search
+    :return: An iterator of file paths.
+    """
+    if is_archive(input_path):
+        yield from iter_archive(input_path, accept=lambda name: _accept_member(name, include, exclude))
+        return
+
+    if os.path.isfile(input_path):
+        yield input_path
+        return
+
+    folders = [input_path]
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+
+        subfolders = []
+        for entry in entries:
+            relative_path = os.path.relpath(entry.path, input_path).replace(os.sep, "/")
+            if exclude and match_globs(entry.name, relative_path, exclude):
+                continue
+            try:
+                if entry.is_dir():
+                    if recursive:
+                        subfolders.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if include and not match_globs(entry.name, relative_path, include):
+                continue
+            yield entry.path
+
+        folders.extend(reversed(subfolders))
+
+
+def prefetch_files(files: Iterable[str], max_bytes: int) -> Iterator[str]:
+    """
+    Reads files ahead in a background thread while the caller processes the previous ones, and yields them in the same
+    order, as InMemoryFile paths: on network storage, the next fonts are read while the current one is converted. The
+    files read ahead and not yet yielded take at most max_bytes of memory.
+
+    The input iterable is consumed by the background thread. Files larger than max_bytes, and files that can't be read,
+    are yielded as they are, without reading them: they are read (or fail) when they are opened. Archive members are
+    already in memory, and count towards max_bytes.
+
+    :param files: The files to read
+    :param max_bytes: The size of the read-ahead buffer, in bytes. If it's 0, files are yielded as they are
+    :return: An iterator of file paths.
+    """
+    if max_bytes <= 0:
+        yield from files
+        return
+
+    condition = threading.Condition()
+    buffer = deque()
+    # Bytes read or being read, and not yet yielded
+    buffered_bytes = 0
+    done = False
+    stopped = False
+    error = None
+
+    def read_ahead():
+        nonlocal buffered_bytes, done, error
+        try:
+            for file in files:
+                if isinstance(file, InMemoryFile):
+                    size = len(file.data)
+                else:
+                    try:
+                        size = os.path.getsize(file)
+                    except OSError:
+                        size = max_bytes + 1
+                    if size > max_bytes:
+                        size = 0
+
+                with condition:
+                    while buffered_bytes and buffered_bytes + size > max_bytes and not stopped:
+                        condition.wait()
+                    if stopped:
+                        return
+                    buffered_bytes += size
+
+                if size and not isinstance(file, InMemoryFile):
+                    try:
+                        with open(file, "rb") as f:
+                            file = InMemoryFile(file, f.read())
+                    except OSError:
+                        pass
+
+                with condition:
+                    buffer.append((file, size))
+                    condition.notify_all()
+        except Exception as e:
+            error = e
+        finally:
+            with condition:
+                done = True
+                condition.notify_all()
+
+    threading.Thread(target=read_ahead, daemon=True).start()
+    try:
+        while True:
+            with condition:
+                while not buffer and not done:
+                    condition.wait()
+                if not buffer:
+                    if error is not None:
+                        raise error
+                    return
+                file, size = buffer.popleft()
+                buffered_bytes -= size
+                condition.notify_all()
+            yield file
+    finally:
+        # The caller stopped iterating: stop reading
+        with condition:
+            stopped = True
+            condition.notify_all()
+
+
+def match_globs(name: str, relative_path: str, patterns: Iterable[str]) -> bool:
+    """
+    Tells whether a file or folder matches any of the glob patterns, by its name or by its path relative to the input
+    folder (with "/" separators).
+    """
+    return any(fnmatch(name, pattern) or fnmatch(relative_path, pattern) for pattern in patterns)
+
+
+def _accept_member(name: str, include: tuple = None, exclude: tuple = None) -> bool:
+    parts = name.split("/")
+    if exclude and any(match_globs(parts[i], "/".join(parts[: i + 1]), exclude) for i in range(len(parts))):
+        return False
+    return not include or match_globs(parts[-1], name, include)
@@ -0,0 +1,391 @@
+from typing import Callable, List, Optional
+
+from fontTools.otlLib.maxContextCalc import maxCtxFont
+from fontTools.subset import Options
+from fontTools.ttLib import TTFont, getTableClass
+from fontTools.ttLib.tables import otTables
+
+# Tables that don't reference glyphs, or whose glyph references are handled by GlyphRemover
+_SUPPORTED_TABLES = {
+    "GlyphOrder",
+    "head",
+    "hhea",
+    "vhea",
+    "maxp",
+    "OS/2",
+    "name",
+    "post",
+    "cvt ",
+    "cvar",
+    "fpgm",
+    "prep",
+    "gasp",
+    "DSIG",
+    "FFTM",
+    "meta",
+    "PCLT",
+    "VDMX",
+    "fvar",
+    "avar",
+    "STAT",
+    "MVAR",
+    "CPAL",
+    "loca",
+    "glyf",
+    "hmtx",
+    "vmtx",
+    "cmap",
+    "kern",
+    "gvar",
+    "hdmx",
+    "LTSH",
+    "VORG",
+    "GDEF",
+    "GSUB",
+    "GPOS",
+}
+
+
+class GlyphRemover(object):
+    """
+    Removes a few glyphs from a font by editing only the structures that reference them: glyph order, cmap, metrics,
+    glyf and the layout subtables where they occur.
+
+    This is much cheaper than a fontTools.subset.Subsetter pass when the glyphs to remove are unused or only appear in
+    coverages and class definitions. When a glyph is referenced in a way that can't be removed locally (a component of
+    a composite glyph, a substitution output, a mark or cursive attachment, a format 1 contextual rule, an unsupported
+    table...), the font is left untouched and run() returns False, so that the caller can fall back to the Subsetter.
+
+    With Subsetter options, the font is also pruned the way a Subsetter pass with these options prunes it before and
+    after subsetting (e.g. the legacy kern table and cmap subtables, the hinting tables and the .notdef outline are
+    dropped, and unused layout lookups and features are removed), so that the output is the same as the Subsetter's.
+    The pruning before subsetting is done even if run() returns False: the Subsetter does it again, to the same result.
+    """
+
+    def __init__(self, font: TTFont, glyph_names: list, options: Optional[Options] = None):
+        self.font = font
+        self.options = options
+        glyph_order = font.getGlyphOrder()
+        self.glyphs = set(glyph_names).intersection(glyph_order)
+        self.new_glyph_order = [g for g in glyph_order if g not in self.glyphs]
+        self._edits: List[Callable] = []
+
+    def run(self) -> bool:
+        """
+        Removes the glyphs from the font.
+
+        :return: True if the glyphs were removed, False if the Subsetter is needed.
+        """
+        if not self.glyphs:
+            return True
+        if ".notdef" in self.glyphs:
+            return False
+
+        # Every table must be decompiled with the current glyph order before it's changed
+        self.font.ensureDecompiled()
+        if self.options is not None:
+            self._prune_pre_subset()
+
+        self._edits = []
+        if not self._plan():
+            return False
+        for edit in self._edits:
+            edit()
+
+        self.font.setGlyphOrder(self.new_glyph_order)
+        if "glyf" in self.font:
+            self.font["glyf"].glyphOrder = self.new_glyph_order
+        if self.options is not None:
+            self._prune_post_subset()
+        return True
+
+    def _prune_pre_subset(self) -> None:
+        # The table pruning of Subsetter._prune_pre_subset, with the public table methods added by fontTools.subset
+        options = self.options
+        for tag in self.font.keys():
+            if tag == "GlyphOrder":
+                continue
+            if (
+                tag.strip() in options.drop_tables
+                or (tag.strip() in options.hinting_tables and not options.hinting)
+                or (tag == "kern" and not options.legacy_kern and "GPOS" in self.font)
+            ):
+                del self.font[tag]
+            elif hasattr(getTableClass(tag), "prune_pre_subset"):
+                if not self.font[tag].prune_pre_subset(self.font, options):
+                    del self.font[tag]
+
+    def _prune_post_subset(self) -> None:
+        # The table pruning of Subsetter._prune_post_subset. The name table is pruned last, since its records are kept
+        # if other tables use them
+        tags = [tag for tag in self.font.keys() if tag not in ("GlyphOrder", "name")]
+        if "name" in self.font:
+            tags.append("name")
+        for tag in tags:
+            if tag == "OS/2":
+                self._prune_os2(self.font[tag])
+            if tag == "name" and self._keeps_all_names():
+                # Skips the search of the whole font for the name IDs it uses, whose result wouldn't be used
+                continue
+            if hasattr(getTableClass(tag), "prune_post_subset"):
+                if not self.font[tag].prune_post_subset(self.font, self.options):
+                    del self.font[tag]
+
+    def _keeps_all_names(self) -> bool:
+        # With these options, the name table pruning only drops unused name IDs of 256 and above
+        options = self.options
+        return (
+            "*" in options.name_IDs
+            and "*" in options.name_languages
+            and options.name_legacy
+            and not options.obfuscate_names
+            and all(n.nameID < 256 for n in self.font["name"].names)
+        )
+
+    def _prune_os2(self, table) -> None:
+        options = self.options
+        if options.prune_unicode_ranges:
+            table.recalcUnicodeRanges(self.font, pruneOnly=True)
+        # recalcCodePageRanges is missing in older fontTools releases
+        if options.prune_codepage_ranges and table.version >= 1 and hasattr(table, "recalcCodePageRanges"):
+            table.recalcCodePageRanges(self.font, pruneOnly=True)
+        if options.recalc_average_width:
+            table.recalcAvgCharWidth(self.font)
+        if options.recalc_max_context:
+            table.usMaxContext = maxCtxFont(self.font)
+
+    def _plan(self) -> bool:
+        if any(tag not in _SUPPORTED_TABLES for tag in self.font.keys()):
+            return False
+
+        for tag, planner in (
+            ("glyf", self._plan_glyf),
+            ("cmap", self._plan_cmap),
+            ("hmtx", self._plan_metrics),
+            ("vmtx", self._plan_metrics),
+            ("kern", self._plan_kern),
+            ("gvar", self._plan_gvar),
+            ("hdmx", self._plan_hdmx),
+            ("LTSH", self._plan_ltsh),
+            ("VORG", self._plan_vorg),
+            ("GDEF", self._plan_gdef),
+            ("GSUB", self._plan_layout),
+            ("GPOS", self._plan_layout),
+        ):
+            if tag in self.font and not planner(self.font[tag]):
+                return False
+        return True
+
+    # Non-layout tables
+
+    def _plan_glyf(self, table) -> bool:
+        for glyph_name in self.new_glyph_order:
+            glyph = table.glyphs.get(glyph_name)
+            if glyph is not None and glyph.isComposite():
+                if any(c.glyphName in self.glyphs for c in glyph.components):
+                    return False
+
+        def edit():
+            for glyph_name in self.glyphs:
+                table.glyphs.pop(glyph_name, None)
+
+        self._edits.append(edit)
+        return True
+
+    def _plan_cmap(self, table) -> bool:
+        for subtable in table.tables:
+            if subtable.format != 14 and not hasattr(subtable, "cmap"):
+                return False
+
+        def edit():
+            for subtable in table.tables:
+                if subtable.format == 14:
+                    for uvs, mappings in subtable.uvsDict.items():
+                        subtable.uvsDict[uvs] = [m for m in mappings if m[1] not in self.glyphs]
+                else:
+                    for code in [c for c, g in subtable.cmap.items() if g in self.glyphs]:
+                        del subtable.cmap[code]
+
+        self._edits.append(edit)
+        return True
+
+    def _plan_metrics(self, table) -> bool:
+        self._edits.append(lambda: self._pop_keys(table.metrics))
+        return True
+
+    def _plan_kern(self, table) -> bool:
+        for subtable in table.kernTables:
+            if not hasattr(subtable, "kernTable"):
+                return False
+
+        def edit():
+            for subtable in table.kernTables:
+                for pair in [p for p in subtable.kernTable if p[0] in self.glyphs or p[1] in self.glyphs]:
+                    del subtable.kernTable[pair]
+
+        self._edits.append(edit)
+        return True
+
+    def _plan_gvar(self, table) -> bool:
+        self._edits.append(lambda: self._pop_keys(table.variations))
+        return True
+
+    def _plan_hdmx(self, table) -> bool:
+        self._edits.append(lambda: [self._pop_keys(widths) for widths in table.hdmx.values()])
+        return True
+
+    def _plan_ltsh(self, table) -> bool:
+        self._edits.append(lambda: self._pop_keys(table.yPels))
+        return True
+
+    def _plan_vorg(self, table) -> bool:
+        self._edits.append(lambda: self._pop_keys(table.VOriginRecords))
+        return True
+
+    # Layout tables
+
+    def _plan_gdef(self, table) -> bool:
+        gdef = table.table
+        for attr in ("AttachList", "LigCaretList"):
+            if self._references(getattr(gdef, attr, None)):
+                return False
+        for attr in ("GlyphClassDef", "MarkAttachClassDef"):
+            self._plan_class_def(getattr(gdef, attr, None))
+        mark_glyph_sets = getattr(gdef, "MarkGlyphSetsDef", None)
+        if mark_glyph_sets is not None:
+            for coverage in mark_glyph_sets.Coverage:
+                self._plan_coverage(coverage)
+        return True
+
+    def _plan_layout(self, table) -> bool:
+        if table.table.LookupList is None:
+            return True
+        for lookup in table.table.LookupList.Lookup:
+            for subtable in lookup.SubTable:
+                if isinstance(subtable, (otTables.ExtensionSubst, otTables.ExtensionPos)):
+                    subtable = subtable.ExtSubTable
+                if not self._references(subtable):
+                    continue
+                if not self._plan_subtable(subtable):
+                    return False
+        return True
+
+    def _plan_subtable(self, subtable) -> bool:
+        if isinstance(subtable, (otTables.SingleSubst, otTables.MultipleSubst)):
+            if any(self._references(v) for v in subtable.mapping.values()):
+                return False
+            self._edits.append(lambda: self._pop_keys(subtable.mapping))
+            return True
+
+        if isinstance(subtable, otTables.AlternateSubst):
+            if any(self._references(v) for v in subtable.alternates.values()):
+                return False
+            self._edits.append(lambda: self._pop_keys(subtable.alternates))
+            return True
+
+        if isinstance(subtable, otTables.LigatureSubst):
+            if any(lig.LigGlyph in self.glyphs for ligs in subtable.ligatures.values() for lig in ligs):
+                return False
+
+            def edit():
+                self._pop_keys(subtable.ligatures)
+                for first_glyph, ligs in subtable.ligatures.items():
+                    subtable.ligatures[first_glyph] = [lig for lig in ligs if not self._references(lig.Component)]
+
+            self._edits.append(edit)
+            return True
+
+        if isinstance(subtable, otTables.SinglePos):
+            if subtable.Format == 1:
+                self._plan_coverage(subtable.Coverage)
+            else:
+                self._plan_coverage(subtable.Coverage, parallel=[(subtable, "Value")])
+            return True
+
+        if isinstance(subtable, otTables.PairPos):
+            if subtable.Format == 1:
+                self._plan_coverage(subtable.Coverage, parallel=[(subtable, "PairSet")])
+
+                def edit():
+                    for pair_set in subtable.PairSet:
+                        pair_set.PairValueRecord = [
+                            r for r in pair_set.PairValueRecord if r.SecondGlyph not in self.glyphs
+                        ]
+
+                self._edits.append(edit)
+            else:
+                self._plan_coverage(subtable.Coverage)
+                self._plan_class_def(subtable.ClassDef1)
+                self._plan_class_def(subtable.ClassDef2)
+            return True
+
+        if isinstance(subtable, (otTables.ContextSubst, otTables.ContextPos)):
+            if subtable.Format == 2:
+                self._plan_coverage(subtable.Coverage)
+                self._plan_class_def(subtable.ClassDef)
+                return True
+            if subtable.Format == 3:
+                for coverage in subtable.Coverage:
+                    self._plan_coverage(coverage)
+                return True
+            return False
+
+        if isinstance(subtable, (otTables.ChainContextSubst, otTables.ChainContextPos)):
+            if subtable.Format == 2:
+                self._plan_coverage(subtable.Coverage)
+                for attr in ("BacktrackClassDef", "InputClassDef", "LookAheadClassDef"):
+                    self._plan_class_def(getattr(subtable, attr))
+                return True
+            if subtable.Format == 3:
+                for attr in ("BacktrackCoverage", "InputCoverage", "LookAheadCoverage"):
+                    for coverage in getattr(subtable, attr):
+                        self._plan_coverage(coverage)
+                return True
+            return False
+
+        # Mark, cursive and reverse chaining subtables, and anything else
+        return False
+
+    def _plan_coverage(self, coverage, parallel: list = None) -> None:
+        """
+        Removes the glyphs from a coverage table, and the records at the same indices from the parallel arrays, given
+        as (table, attribute name) tuples.
+        """
+        if coverage is None:
+            return
+        indices = {i for i, g in enumerate(coverage.glyphs) if g in self.glyphs}
+        if not indices:
+            return
+
+        def edit():
+            coverage.glyphs = [g for i, g in enumerate(coverage.glyphs) if i not in indices]
+            for table, attr in parallel or []:
+                setattr(table, attr, [v for i, v in enumerate(getattr(table, attr)) if i not in indices])
+
+        self._edits.append(edit)
+
+    def _plan_class_def(self, class_def) -> None:
+        if class_def is not None:
+            self._edits.append(lambda: self._pop_keys(class_def.classDefs))
+
+    def _pop_keys(self, d: Optional[dict]) -> None:
+        if d is None:
+            return
+        for glyph_name in self.glyphs:
+            d.pop(glyph_name, None)
+
+    def _references(self, obj) -> bool:
+        """
+        Returns True if any of the glyphs to remove is referenced anywhere in obj.
+        """
+        if obj is None:
+            return False
+        if isinstance(obj, str):
+            return obj in self.glyphs
+        if isinstance(obj, (list, tuple)):
+            return any(self._references(v) for v in obj)
+        if isinstance(obj, dict):
+            return any(self._references(k) or self._references(v) for k, v in obj.items())
+        if isinstance(obj, otTables.BaseTable):
+            return any(self._references(v) for v in vars(obj).values())
+        return False
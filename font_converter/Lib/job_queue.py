@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from typing import Iterator, List, Optional
+
+DONE = "done"
+FAILED = "failed"
+
+_JOBS_DIR = "jobs"
+_PENDING_DIR = "pending"
+_RUNNING_DIR = "running"
+_RESULTS_DIR = "results"
+_WORKERS_DIR = "workers"
+
+# Separates the job ID and the worker ID in the name of a running job
+_OWNER_SEPARATOR = "@"
+
+
+class QueueJob(object):
+    """
+    A job claimed from a JobQueue.
+    """
+
+    def __init__(self, job_id: str, file: str, input_path: str, output_dir: str, token: str):
+        self.job_id = job_id
+        self.file = file
+        self.input_path = input_path
+        self.output_dir = output_dir
+        #: The running job file that proves the job is still owned by this worker
+        self.token = token
+        self.start_time = time.time()
+
+
+class JobQueue(object):
+    """
+    A queue of conversion jobs in a spool directory shared by any number of workers, on one or many hosts (e.g. on an
+    NFS volume). Workers don't talk to each other: all coordination happens through atomic creations and renames of
+    files in the spool directory.
+
+    The spool directory contains:
+
+    - jobs/<job_id>.json: the description of each job (command, input file and path, output directory). It's created
+      once, with O_EXCL, by the first worker that enqueues the file, and never changed
+    - pending/<job_id>: an empty file for each job waiting to be converted
+    - running/<job_id>@<worker_id>: a job claimed by a worker. A worker claims a job by renaming its pending file: if
+      two workers try to claim the same job, only one rename succeeds
+    - results/<job_id>.json: the status record of each finished job (done or failed, output files, error, worker)
+    - workers/<worker_id>: the heartbeat of each worker, whose modification time is updated every lease_timeout / 4
+      seconds while the worker runs
+
+    A running job whose worker didn't update its heartbeat for lease_timeout seconds is considered lost (the worker
+    crashed, or its host went down) and is renamed back to pending by the next worker that looks for a job. Heartbeats
+    are compared with the modification time of the worker's own heartbeat, not with the local clock, since hosts
+    clocks may differ while all file times are set by the file server.
+
+    The job ID depends on the command, the path, the size and the modification time of the input file: running the
+    same batch again only enqueues the files that changed. Remove the result record and the job file of a job to run it
+    again.
+
+    Usage:
+
+    with JobQueue(spool_dir, command="ttf2otf") as queue:
+        for file in files:
+            queue.enqueue(file, input_path, output_dir)
+        for job in queue.iter_jobs():
+            ...
+            queue.set_done(job, output_files)
+    """
+
+    def __init__(self, spool_dir: str, command: str, lease_timeout: float = 60.0, worker_id: str = None):
+        """
+        :param spool_dir: The spool directory. It's created if it doesn't exist
+        :param command: The name of the command. Workers only claim jobs enqueued by the same command
+        :param lease_timeout: Seconds after which the jobs of a worker without heartbeats are claimed by other workers
+        :param worker_id: The ID of this worker. Defaults to <host name>-<process ID>
+        """
+        self.spool_dir = spool_dir
+        self.command = command
+        self.lease_timeout = lease_timeout
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}".replace(_OWNER_SEPARATOR, "-")
+        self._heartbeat_file = os.path.join(spool_dir, _WORKERS_DIR, self.worker_id)
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        for directory in (_JOBS_DIR, _PENDING_DIR, _RUNNING_DIR, _RESULTS_DIR, _WORKERS_DIR):
+            os.makedirs(os.path.join(spool_dir, directory), exist_ok=True)
+
+    def start(self) -> None:
+        """
+        Creates the heartbeat file of this worker and starts updating it in a background thread.
+        """
+        with open(self._heartbeat_file, "w", encoding="utf-8") as f:
+            f.write(json.dumps(dict(worker=self.worker_id, pid=os.getpid(), host=socket.gethostname())))
+        self._stop_heartbeat.clear()
+        self._heartbeat_thread = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the heartbeat and removes the heartbeat file of this worker.
+        """
+        self._stop_heartbeat.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        try:
+            os.remove(self._heartbeat_file)
+        except FileNotFoundError:
+            pass
+
+    def enqueue(self, file: str, input_path: str, output_dir: str) -> bool:
+        """
+        Adds a job for the file, unless the same job was already enqueued by this or another worker. Paths must be the
+        same on all the hosts.
+
+        :param file: The input file
+        :param input_path: The input file or folder where the file was found
+        :param output_dir: The output directory
+        :return: True if the job was added.
+        """
+        file = os.path.abspath(file)
+        job_id = self._get_job_id(file)
+        job = dict(
+            command=self.command,
+            input=file,
+            input_path=os.path.abspath(input_path),
+            output_dir=os.path.abspath(output_dir),
+            enqueued_by=self.worker_id,
+            enqueued_at=time.time(),
+        )
+        try:
+            fd = os.open(self._path(_JOBS_DIR, f"{job_id}.json"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(job, ensure_ascii=False))
+            f.flush()
+            os.fsync(f.fileno())
+        open(self._path(_PENDING_DIR, job_id), "w").close()
+        return True
+
+    def iter_jobs(self, poll_interval: float = None) -> Iterator[QueueJob]:
+        """
+        Claims jobs one at a time and yields them, until no job of this command is pending or running. While the only
+        jobs left are running on other workers, waits for them, so that their jobs can be claimed if they are lost.
+
+        The caller must call set_done or set_failed for each job before getting the next one.
+
+        :param poll_interval: Seconds between checks of the spool directory while waiting. Defaults to a quarter of the
+            lease timeout
+        :return: An iterator of claimed jobs.
+        """
+        if poll_interval is None:
+            poll_interval = self.lease_timeout / 4
+        while True:
+            self.reclaim_lost_jobs()
+            job = self.claim()
+            if job is not None:
+                yield job
+                continue
+            if not self._list_running():
+                return
+            time.sleep(poll_interval)
+
+    def claim(self) -> Optional[QueueJob]:
+        """
+        Claims a pending job of this command.
+
+        :return: The claimed job, or None if no job is pending.
+        """
+        pending = self._list_pending()
+        # Workers started at the same time would all try to claim the same jobs in the same order
+        random.shuffle(pending)
+        for job_id in pending:
+            token = self._path(_RUNNING_DIR, f"{job_id}{_OWNER_SEPARATOR}{self.worker_id}")
+            try:
+                os.rename(self._path(_PENDING_DIR, job_id), token)
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            try:
+                with open(self._path(_JOBS_DIR, f"{job_id}.json"), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                self._write_result(job_id, token, dict(input=None, status=FAILED, error=f"Invalid job: {e}"))
+                continue
+            return QueueJob(job_id, job["input"], job["input_path"], job["output_dir"], token)
+        return None
+
+    def set_done(self, job: QueueJob, output_files: List[str]) -> bool:
+        """
+        Records that a job has been converted.
+
+        :param job: The job
+        :param output_files: The files written for the job
+        :return: False if the job was lost (it was reclaimed by another worker) and nothing was recorded.
+        """
+        return self._finish(job, DONE, outputs=[os.path.abspath(f) for f in output_files])
+
+    def set_failed(self, job: QueueJob, error) -> bool:
+        """
+        Records that a job failed.
+
+        :param job: The job
+        :param error: The exception or error message
+        :return: False if the job was lost (it was reclaimed by another worker) and nothing was recorded.
+        """
+        return self._finish(job, FAILED, error=str(error))
+
+    def reclaim_lost_jobs(self) -> int:
+        """
+        Moves the running jobs of workers whose heartbeat expired back to pending.
+
+        :return: The number of jobs reclaimed.
+        """
+        now = self._get_server_time()
+        reclaimed = 0
+        for name in self._list_running():
+            job_id, _, worker_id = name.partition(_OWNER_SEPARATOR)
+            if worker_id == self.worker_id:
+                continue
+            try:
+                heartbeat = os.stat(self._path(_WORKERS_DIR, worker_id)).st_mtime
+            except FileNotFoundError:
+                heartbeat = None
+            if heartbeat is not None and now - heartbeat <= self.lease_timeout:
+                continue
+            try:
+                os.rename(self._path(_RUNNING_DIR, name), self._path(_PENDING_DIR, job_id))
+            except FileNotFoundError:
+                # Finished, or reclaimed by another worker
+                continue
+            reclaimed += 1
+        return reclaimed
+
+    def get_status(self) -> dict:
+        """
+        Returns the number of jobs of this command by state: pending, running, done and failed.
+        """
+        status = dict(pending=len(self._list_pending()), running=len(self._list_running()), done=0, failed=0)
+        prefix = f"{self.command}-"
+        for name in os.listdir(self._path(_RESULTS_DIR)):
+            if not name.startswith(prefix) or not name.endswith(".json"):
+                continue
+            try:
+                with open(self._path(_RESULTS_DIR, name), encoding="utf-8") as f:
+                    status[json.load(f)["status"]] += 1
+            except (OSError, ValueError, KeyError):
+                continue
+        return status
+
+    def _finish(self, job: QueueJob, status: str, **fields) -> bool:
+        record = dict(input=job.file, status=status, outputs=[], elapsed_time=time.time() - job.start_time)
+        record.update(fields)
+        return self._write_result(job.job_id, job.token, record)
+
+    def _write_result(self, job_id: str, token: str, record: dict) -> bool:
+        record = dict(command=self.command, job_id=job_id, worker=self.worker_id, finished_at=time.time(), **record)
+        # The record is written into the running job file, that is then renamed to the results: the job is either
+        # still running or finished, never both. Opening with "r+" fails if the job was reclaimed in the meantime.
+        try:
+            with open(token, "r+", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(token, self._path(_RESULTS_DIR, f"{job_id}.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _get_job_id(self, file: str) -> str:
+        stat = os.stat(file)
+        key = f"{file}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        return f"{self.command}-{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    def _get_server_time(self) -> float:
+        # The modification time of our own heartbeat, just updated, is the current time of the file server
+        try:
+            os.utime(self._heartbeat_file)
+            return os.stat(self._heartbeat_file).st_mtime
+        except FileNotFoundError:
+            return time.time()
+
+    def _beat(self) -> None:
+        while not self._stop_heartbeat.wait(self.lease_timeout / 4):
+            try:
+                os.utime(self._heartbeat_file)
+            except OSError:
+                # The spool directory may be briefly unavailable: try again on the next beat
+                pass
+
+    def _list_pending(self) -> List[str]:
+        prefix = f"{self.command}-"
+        return [name for name in os.listdir(self._path(_PENDING_DIR)) if name.startswith(prefix)]
+
+    def _list_running(self) -> List[str]:
+        prefix = f"{self.command}-"
+        return [name for name in os.listdir(self._path(_RUNNING_DIR)) if name.startswith(prefix)]
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.spool_dir, *parts)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
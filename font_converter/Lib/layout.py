@@ -0,0 +1,68 @@
+"""
+Lossless size optimizations of the OpenType layout tables (GDEF, GSUB, GPOS).
+"""
+from typing import Dict, Tuple
+
+# Imported for the prune methods it adds to the GSUB and GPOS table classes
+import fontTools.subset  # noqa: F401
+from fontTools.otlLib.optimize.gpos import compact
+from fontTools.ttLib import TTFont, newTable
+
+LAYOUT_TABLES = ("GDEF", "GSUB", "GPOS")
+
+# GPOS PairPos compaction level (1-9): 9 splits class kerning subtables as much as it saves bytes
+GPOS_COMPACTION_LEVEL = 9
+
+
+def optimize_layout(font: TTFont, level: int = GPOS_COMPACTION_LEVEL) -> Dict[str, Tuple[int, int]]:
+    """
+    Reduces the size of the layout tables without changing how text is shaped:
+
+    - lookups that can't be reached from any feature, features not referenced by any language system, duplicate
+      features and language systems identical to the default one of their script are removed from GSUB and GPOS
+    - class kerning subtables (GPOS PairPos format 2) are split into smaller, denser subtables when that saves bytes
+    - tables are compiled again: identical subtables, coverages and class definitions are stored once and shared by
+      all the lookups that use them
+
+    A table is only replaced if it's smaller than the table before optimization: otherwise that table is restored. The
+    tables that were not decompiled yet are restored from the font file, and written as they are. The ones that were
+    already decompiled (and may have been changed, e.g. by subsetting, glyph purging or instancing) are restored from
+    their compiled data.
+
+    :param font: The font
+    :param level: The GPOS PairPos compaction level (0-9). 0 doesn't compact PairPos subtables
+    :return: The size in bytes of each layout table in the font file (or before optimization, for tables that are not
+        in the file) and after optimization, as a {tag: (size_before, size_after)} dictionary.
+    """
+    tags = [tag for tag in LAYOUT_TABLES if tag in font]
+    # Tables that were not decompiled yet are unmodified, and can be restored from the font file
+    restorable_tags = {tag for tag in tags if tag not in font.tables and font.reader is not None}
+    data_before = {tag: font.reader[tag] if tag in restorable_tags else font[tag].compile(font) for tag in tags}
+
+    for tag in ("GSUB", "GPOS"):
+        if tag not in font or font[tag].table is None:
+            continue
+        table = font[tag]
+        table.prune_lookups()
+        if table.table.FeatureList:
+            table.remove_redundant_langsys()
+            table.prune_features()
+    if level > 0 and "GPOS" in font:
+        compact(font, level)
+
+    report = {}
+    for tag in tags:
+        size_after = len(font[tag].compile(font))
+        if size_after >= len(data_before[tag]):
+            # Not worth it
+            if tag in restorable_tags:
+                # The original table is decompiled again if it's accessed
+                del font.tables[tag]
+            else:
+                table = newTable(tag)
+                table.decompile(data_before[tag], font)
+                font[tag] = table
+            size_after = len(data_before[tag])
+        in_file = font.reader is not None and tag in font.reader
+        report[tag] = (len(font.reader[tag]) if in_file else len(data_before[tag]), size_after)
+    return report
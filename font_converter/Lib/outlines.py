@@ -0,0 +1,61 @@
+from typing import List, Tuple
+
+import pathops
+
+BBox = Tuple[float, float, float, float]
+
+
+def needs_overlap_removal(path: pathops.Path) -> bool:
+    """
+    Cheaply checks whether a path must be simplified with pathops to remove overlaps and correct contours direction.
+
+    The check is conservative and only lets through paths whose fill is already what simplify would produce: every
+    contour is convex (so it doesn't intersect itself), two contours are either apart (their bounding boxes don't
+    intersect) or one is nested inside the other (all its control points are inside the outer contour), and contours
+    directions alternate with nesting depth. Any other path is reported as needing overlap removal.
+
+    :param path: The path to check
+    :return: True if the path must be simplified, False if it can be used as is (after reversing it if outer contours
+        are clockwise).
+    """
+    # Most glyphs have a concave contour, so reject them before building the whole list of contours
+    contours: List[pathops.Path] = []
+    for contour in path.contours:
+        if not contour.isConvex or contour.area == 0:
+            return True
+        contours.append(contour)
+    if not contours:
+        return False
+
+    bboxes: List[BBox] = [contour.bounds for contour in contours]
+    depths = [0] * len(contours)
+    for i in range(len(contours)):
+        for j in range(i + 1, len(contours)):
+            if _bboxes_apart(bboxes[i], bboxes[j]):
+                continue
+            if _bbox_contains(bboxes[i], bboxes[j]) and _contains_points(contours[i], contours[j]):
+                depths[j] += 1
+            elif _bbox_contains(bboxes[j], bboxes[i]) and _contains_points(contours[j], contours[i]):
+                depths[i] += 1
+            else:
+                return True
+
+    outer_clockwise = next(contour.clockwise for contour, depth in zip(contours, depths) if depth == 0)
+    for contour, depth in zip(contours, depths):
+        if contour.clockwise != (outer_clockwise != (depth % 2 == 1)):
+            return True
+    return False
+
+
+def _contains_points(outer: pathops.Path, inner: pathops.Path) -> bool:
+    # Curves are inside the convex hull of their control points, so a convex contour that contains all the control
+    # points of another contour contains the whole contour.
+    return all(outer.contains(point) for point in inner.points)
+
+
+def _bboxes_apart(a: BBox, b: BBox) -> bool:
+    return a[0] > b[2] or b[0] > a[2] or a[1] > b[3] or b[1] > a[3]
+
+
+def _bbox_contains(outer: BBox, inner: BBox) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
@@ -0,0 +1,397 @@
+import os
+import re
+import struct
+import time
+import zlib
+from multiprocessing import Pipe, Process, RawArray
+from multiprocessing.connection import Connection, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from fontTools.ttLib.woff2 import woff2KnownTags
+
+from font_converter.Lib.archives import InMemoryFile, open_input
+from font_converter.Lib.timeouts import get_current_glyph, set_glyph_timeout
+
+# Memory model of a conversion job, in bytes. The factors are the memory used by each byte of a decompiled table, and
+# were measured converting and instancing TrueType, CFF and variable fonts. Outline tables expand much more than the
+# others, because every glyph is decompiled, drawn and compiled again.
+_JOB_MEMORY = 8 << 20
+_GLYPH_MEMORY = 4 << 10
+_TABLE_FACTORS = {"glyf": 24, "CFF ": 40, "CFF2": 40, "gvar": 16}
+_DEFAULT_TABLE_FACTOR = 4
+# Used when the table directory can't be read
+_FILE_SIZE_FACTOR = 40
+
+_SFNT_VERSIONS = (b"\x00\x01\x00\x00", b"OTTO", b"true")
+
+# Size of the buffer where workers write the name of the glyph they are converting (longer names are truncated)
+_GLYPH_NAME_SIZE = 256
+
+
+def read_table_directory(file: str) -> Tuple[Dict[str, int], Optional[int]]:
+    """
+    Reads the sizes of the tables of a SFNT, WOFF or WOFF2 font, and its number of glyphs, without loading the font:
+    only the table directory and the 'maxp' table are read.
+
+    :param file: The font file
+    :return: A {tag: uncompressed table size} dictionary, and the number of glyphs (None if it can't be read cheaply, as
+        in WOFF2 fonts, where all tables are compressed in a single stream). The dictionary is empty if the file is not
+        a SFNT, WOFF or WOFF2 font.
+    """
+    with open_input(file) as f:
+        header = f.read(48)
+        signature = header[:4]
+
+        if signature in _SFNT_VERSIONS:
+            num_tables = struct.unpack(">H", header[4:6])[0]
+            f.seek(12)
+            directory = f.read(16 * num_tables)
+            entries = {}
+            for i in range(num_tables):
+                tag, _, offset, length = struct.unpack(">4sLLL", directory[16 * i : 16 * (i + 1)])
+                entries[tag.decode("latin-1")] = (offset, length, length)
+
+        elif signature == b"wOFF":
+            num_tables = struct.unpack(">H", header[12:14])[0]
+            f.seek(44)
+            directory = f.read(20 * num_tables)
+            entries = {}
+            for i in range(num_tables):
+                tag, offset, comp_length, orig_length, _ = struct.unpack(">4sLLLL", directory[20 * i : 20 * (i + 1)])
+                entries[tag.decode("latin-1")] = (offset, comp_length, orig_length)
+
+        elif signature == b"wOF2":
+            num_tables = struct.unpack(">H", header[12:14])[0]
+            f.seek(48)
+            return _read_woff2_directory(f.read(num_tables * 15), num_tables), None
+
+        else:
+            return {}, None
+
+        num_glyphs = None
+        if "maxp" in entries:
+            offset, comp_length, orig_length = entries["maxp"]
+            f.seek(offset)
+            maxp = f.read(comp_length)
+            if comp_length < orig_length:
+                maxp = zlib.decompress(maxp)
+            if len(maxp) >= 6:
+                num_glyphs = struct.unpack(">H", maxp[4:6])[0]
+
+    return {tag: orig_length for tag, (_, _, orig_length) in entries.items()}, num_glyphs
+
+
+def _read_woff2_directory(data: bytes, num_tables: int) -> Dict[str, int]:
+    table_sizes = {}
+    pos = 0
+    for _ in range(num_tables):
+        flags = data[pos]
+        pos += 1
+        if flags & 0x3F == 0x3F:
+            tag = data[pos : pos + 4].decode("latin-1")
+            pos += 4
+        else:
+            tag = woff2KnownTags[flags & 0x3F]
+        orig_length, pos = _read_base128(data, pos)
+        transform_version = (flags >> 6) & 0x03
+        if (tag in ("glyf", "loca")) == (transform_version == 0):
+            _, pos = _read_base128(data, pos)
+        table_sizes[tag] = orig_length
+    return table_sizes
+
+
+def _read_base128(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    for i in range(5):
+        byte = data[pos + i]
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos + i + 1
+    raise ValueError("Invalid UIntBase128 value")
+
+
+def estimate_memory(file: str) -> int:
+    """
+    Estimates the peak memory used to convert a font, from the sizes of its tables and its number of glyphs.
+
+    :param file: The font file
+    :return: The estimated memory, in bytes.
+    """
+    try:
+        table_sizes, num_glyphs = read_table_directory(file)
+    except (OSError, ValueError, IndexError, struct.error, zlib.error):
+        table_sizes, num_glyphs = {}, None
+
+    if not table_sizes:
+        try:
+            size = len(file.data) if isinstance(file, InMemoryFile) else os.path.getsize(file)
+            return _JOB_MEMORY + _FILE_SIZE_FACTOR * size
+        except OSError:
+            return _JOB_MEMORY
+
+    memory = _JOB_MEMORY
+    for tag, size in table_sizes.items():
+        memory += _TABLE_FACTORS.get(tag, _DEFAULT_TABLE_FACTOR) * size
+    if num_glyphs is not None:
+        memory += _GLYPH_MEMORY * num_glyphs
+    return memory
+
+
+def get_available_memory() -> Optional[int]:
+    """
+    Returns the memory available for new processes, in bytes, or None if it can't be determined.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            match = re.search(r"^MemAvailable:\s+(\d+) kB", f.read(), re.MULTILINE)
+        if match:
+            return int(match.group(1)) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class FontTimeoutError(Exception):
+    """
+    Raised when a job takes longer than the time limit of MemoryScheduler, and its worker process is killed.
+    """
+
+    def __init__(self, timeout: float, glyph_name: Optional[str] = None):
+        super().__init__(timeout, glyph_name)
+        self.timeout = timeout
+        #: The glyph that was being converted when the worker was killed, if known
+        self.glyph_name = glyph_name
+
+    def __str__(self):
+        message = f"Timed out after {self.timeout} seconds"
+        if self.glyph_name is not None:
+            message += f" (converting glyph '{self.glyph_name}')"
+        return message
+
+
+class WorkerExitError(Exception):
+    """
+    Raised when the worker process of a job exits without returning a result (e.g. it crashed in a C extension, or was
+    killed by the system).
+    """
+
+    def __init__(self, exit_code: Optional[int], glyph_name: Optional[str] = None):
+        super().__init__(exit_code, glyph_name)
+        self.exit_code = exit_code
+        self.glyph_name = glyph_name
+
+    def __str__(self):
+        message = f"The worker process exited unexpectedly (exit code {self.exit_code})"
+        if self.glyph_name is not None:
+            message += f" converting glyph '{self.glyph_name}'"
+        return message
+
+
+class Job(object):
+    """
+    A file processed by MemoryScheduler.
+    """
+
+    def __init__(self, file: str, estimated_memory: int):
+        self.file = file
+        self.estimated_memory = estimated_memory
+        self.result = None
+        self.error: Optional[BaseException] = None
+        #: The peak memory used by the job, in bytes, or None if it can't be measured on this platform
+        self.peak_memory: Optional[int] = None
+        self.elapsed_time: Optional[float] = None
+
+
+class _RunningJob(object):
+    def __init__(self, process: Process, connection: Connection, glyph_buffer, deadline: Optional[float]):
+        self.process = process
+        self.connection = connection
+        self.glyph_buffer = glyph_buffer
+        self.deadline = deadline
+
+
+class MemoryScheduler(object):
+    """
+    Runs conversion jobs in worker processes, without exceeding a memory budget.
+
+    The memory used by each job is estimated from the table directory of its font (see estimate_memory). Jobs are
+    started largest first, so that the biggest fonts don't end up running alone at the end of the batch, and a job is
+    started only when its estimate fits in the part of the budget not claimed by the running jobs. A job that is larger
+    than the whole budget runs alone.
+
+    Each job runs in a new worker process that measures its actual peak memory (on Linux), so that estimates can be
+    checked against reality. A job that takes longer than the timeout is stopped by killing its worker, and fails with
+    FontTimeoutError; a worker that crashes only fails its own job (WorkerExitError). Either way, the next job starts
+    in a new process and the batch goes on. With a glyph timeout, workers also stop a job as soon as one of its glyphs
+    takes longer than that (see timeouts.glyph_time_limit), and the job fails with GlyphTimeoutError.
+
+    Usage:
+
+    scheduler = MemoryScheduler(max_workers=4, memory_budget=2 << 30, timeout=300)
+    for job in scheduler.run(convert_file, files):
+        print(job.file, job.estimated_memory, job.peak_memory)
+    """
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        memory_budget: int = None,
+        timeout: Optional[float] = None,
+        glyph_timeout: Optional[float] = None,
+    ):
+        """
+        :param max_workers: The number of worker processes. Defaults to the number of CPUs
+        :param memory_budget: The memory budget in bytes. Defaults to the memory currently available, if it can be
+            determined, otherwise memory is not limited
+        :param timeout: The time limit of each job, in seconds. Defaults to no limit
+        :param glyph_timeout: The time limit of each glyph, in seconds. Defaults to no limit
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.memory_budget = memory_budget or get_available_memory()
+        self.timeout = timeout
+        self.glyph_timeout = glyph_timeout
+        #: The highest sum of the estimates of the jobs running at the same time
+        self.peak_scheduled_memory = 0
+
+    def run(self, func: Callable, files: Iterable[str]) -> Iterator[Job]:
+        """
+        Calls func(file) in the worker processes for each file, and yields the jobs as they complete. func must be
+        picklable (a module level function, or a functools.partial of one).
+
+        All files are read from the iterable and estimated before the first job is started, since the largest one must
+        be known first. Exceptions raised by func, timeouts and worker crashes are stored in job.error.
+
+        :param func: The function that converts a file
+        :param files: The files to convert
+        :return: An iterator of completed jobs.
+        """
+        queue = sorted((Job(file, estimate_memory(file)) for file in files), key=lambda j: j.estimated_memory)
+        if not queue:
+            return
+
+        # Each job runs in a new worker process: memory freed by a job is not always returned to the system, so a reused
+        # worker would keep the peak memory of the largest font it converted, and a job that is killed or crashes can't
+        # affect the others.
+        running: Dict[Job, _RunningJob] = {}
+        scheduled_memory = 0
+        try:
+            while queue or running:
+                # queue is sorted by ascending estimate: admit the largest jobs that fit, from the end
+                i = len(queue) - 1
+                while i >= 0 and len(running) < self.max_workers:
+                    job = queue[i]
+                    if not running or self.memory_budget is None or (
+                        scheduled_memory + job.estimated_memory <= self.memory_budget
+                    ):
+                        del queue[i]
+                        running[job] = self._start(func, job)
+                        scheduled_memory += job.estimated_memory
+                        self.peak_scheduled_memory = max(self.peak_scheduled_memory, scheduled_memory)
+                    i -= 1
+
+                job = self._wait(running)
+                scheduled_memory -= job.estimated_memory
+                yield job
+        finally:
+            # The caller stopped iterating, or an error occurred: don't leave workers behind
+            for running_job in running.values():
+                running_job.process.kill()
+                running_job.process.join()
+
+    def _start(self, func: Callable, job: Job) -> _RunningJob:
+        receiver, sender = Pipe(duplex=False)
+        glyph_buffer = RawArray("c", _GLYPH_NAME_SIZE)
+        process = Process(
+            target=_run_job, args=(func, job.file, sender, self.glyph_timeout, glyph_buffer), daemon=True
+        )
+        process.start()
+        # Only the worker writes to the pipe: once it exits, reading from it fails instead of blocking
+        sender.close()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        return _RunningJob(process, receiver, glyph_buffer, deadline)
+
+    def _wait(self, running: Dict[Job, _RunningJob]) -> Job:
+        # Waits until a running job completes, fails or times out, removes it from running and returns it
+        while True:
+            deadlines = [r.deadline for r in running.values() if r.deadline is not None]
+            timeout = None if not deadlines else max(0.0, min(deadlines) - time.monotonic())
+            ready = wait([r.connection for r in running.values()], timeout)
+
+            now = time.monotonic()
+            for job, running_job in running.items():
+                if running_job.connection in ready:
+                    break
+                if running_job.deadline is not None and now >= running_job.deadline:
+                    running_job.process.kill()
+                    job.error = FontTimeoutError(self.timeout, get_current_glyph(running_job.glyph_buffer))
+                    job.elapsed_time = self.timeout
+                    break
+            else:
+                continue
+
+            del running[job]
+            if job.error is None:
+                try:
+                    succeeded, value = running_job.connection.recv()
+                except (EOFError, OSError):
+                    running_job.process.join()
+                    job.error = WorkerExitError(
+                        running_job.process.exitcode, get_current_glyph(running_job.glyph_buffer)
+                    )
+                else:
+                    if succeeded:
+                        job.result, job.peak_memory, job.elapsed_time = value
+                    else:
+                        job.error = value
+            running_job.connection.close()
+            running_job.process.join()
+            return job
+
+
+def _run_job(func: Callable, file: str, connection: Connection, glyph_timeout: Optional[float], glyph_buffer):
+    set_glyph_timeout(glyph_timeout, glyph_buffer)
+    try:
+        message = (True, _measure_job(func, file))
+    except Exception as e:
+        message = (False, e)
+    try:
+        connection.send(message)
+    except Exception as e:
+        # The result or the error can't be pickled
+        what = "result" if message[0] else f"error ({message[1]})"
+        connection.send((False, RuntimeError(f"The {what} of the job can't be sent to the main process: {e}")))
+    connection.close()
+
+
+def _measure_job(func: Callable, file: str) -> tuple:
+    measured = _reset_peak_memory()
+    start_memory = _read_memory_status("VmRSS")
+    t = time.time()
+    result = func(file)
+    elapsed_time = time.time() - t
+    peak_memory = _read_memory_status("VmHWM")
+    if not measured or start_memory is None or peak_memory is None:
+        return result, None, elapsed_time
+    return result, max(peak_memory - start_memory, 0), elapsed_time
+
+
+def _reset_peak_memory() -> bool:
+    # Reset the peak resident set size (VmHWM) inherited from the parent process to the current one (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _read_memory_status(key: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            match = re.search(rf"^{key}:\s+(\d+) kB", f.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) * 1024 if match else None
@@ -0,0 +1,179 @@
+import csv
+import json
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import cffsubr
+import fontTools
+import pathops
+from fontTools.pens.basePen import AbstractPen
+
+from font_converter.Lib.api import load_font, to_otf, to_ttf
+from font_converter.Lib.verifier import verify_fonts
+
+# Default values swept for ttf2otf --tolerance (1/1000 of unitsPerEm) and otf2ttf max_err (font units)
+TOLERANCES = (0.25, 0.5, 1.0, 1.5, 2.0, 2.5)
+MAX_ERRORS = (0.25, 0.5, 1.0, 2.0)
+
+#: The columns of the sweep results, in order
+FIELDS = (
+    "file",
+    "target",
+    "tolerance",
+    "max_err",
+    "subroutinize",
+    "size",
+    "points",
+    "time",
+    "max_deviation",
+    "max_area_ratio",
+    "failed_glyphs",
+    "error",
+)
+
+
+def get_sweep_settings(
+    target: str,
+    tolerances: Iterable[float] = TOLERANCES,
+    max_errors: Iterable[float] = MAX_ERRORS,
+    subroutinize: Iterable[bool] = (True, False),
+) -> List[dict]:
+    """
+    Returns the conversion settings to sweep for a target: every tolerance with and without subroutinization for "otf",
+    every max_err for "ttf".
+
+    :param target: "otf" (ttf2otf) or "ttf" (otf2ttf)
+    :param tolerances: The ttf2otf tolerances, in 1/1000 of unitsPerEm
+    :param max_errors: The otf2ttf maximum approximation errors, in font units
+    :param subroutinize: The ttf2otf subroutinization values
+    :return: A list of settings, as dictionaries with the tolerance, max_err and subroutinize keys.
+    """
+    if target == "otf":
+        return [dict(tolerance=t, max_err=None, subroutinize=s) for t in tolerances for s in subroutinize]
+    if target == "ttf":
+        return [dict(tolerance=None, max_err=max_err, subroutinize=None) for max_err in max_errors]
+    raise ValueError(f"Invalid target: {target} (valid targets: otf, ttf)")
+
+
+def sweep_font(data: bytes, target: str, settings: List[dict], verify=True, workers=1) -> Iterator[dict]:
+    """
+    Converts a font with each setting, and yields the results as they are measured: output size, number of points in
+    the output outlines, conversion time and, if verify is True, the largest difference between the source and the
+    converted outlines (see verifier.verify_fonts).
+
+    Each conversion starts from a new copy of the source font, loaded before the timer starts.
+
+    :param data: The source font data
+    :param target: "otf" (ttf2otf) or "ttf" (otf2ttf)
+    :param settings: The settings to sweep (see get_sweep_settings)
+    :param verify: If True, the outlines of each converted font are compared with the source
+    :param workers: The number of processes that compare glyphs
+    :return: An iterator of result rows, as dictionaries with the FIELDS keys (except "file"). If a conversion fails,
+        the error is recorded and the measurements are None.
+    """
+    for setting in settings:
+        row = dict.fromkeys(FIELDS[1:])
+        row.update(target=target, **setting)
+        font = load_font(data)
+        try:
+            start_time = time.perf_counter()
+            if target == "otf":
+                converted_data = to_otf(font, tolerance=setting["tolerance"], subroutinize=setting["subroutinize"])
+            else:
+                converted_data = to_ttf(font, max_err=setting["max_err"])
+            row["time"] = round(time.perf_counter() - start_time, 4)
+        except Exception as e:
+            row["error"] = str(e)
+            yield row
+            continue
+        finally:
+            font.close()
+
+        row["size"] = len(converted_data)
+        row["points"] = count_points(converted_data)
+        if verify:
+            report = verify_fonts(data, converted_data, workers=workers)
+            worst_deviation = max((d.deviation for d in report.differences), default=0.0)
+            worst_area_ratio = max((d.area_ratio for d in report.differences), default=0.0)
+            row["max_deviation"] = round(worst_deviation, 4)
+            row["max_area_ratio"] = round(worst_area_ratio, 6)
+            row["failed_glyphs"] = len(report.failed_glyphs)
+        yield row
+
+
+def count_points(data: bytes) -> int:
+    """
+    Returns the number of points (on-curve and off-curve) of the outlines of all the glyphs of a font. Components are
+    counted once, in the glyph that defines them.
+    """
+    font = load_font(data)
+    try:
+        glyph_set = font.getGlyphSet()
+        pen = _PointCountingPen()
+        for glyph_name in font.getGlyphOrder():
+            glyph_set[glyph_name].draw(pen)
+        return pen.points
+    finally:
+        font.close()
+
+
+class _PointCountingPen(AbstractPen):
+    def __init__(self):
+        self.points = 0
+
+    def moveTo(self, pt):
+        self.points += 1
+
+    def lineTo(self, pt):
+        self.points += 1
+
+    def curveTo(self, *points):
+        self.points += len(points)
+
+    def qCurveTo(self, *points):
+        # The last point is None for closed contours made only of off-curve points
+        self.points += sum(1 for pt in points if pt is not None)
+
+    def closePath(self):
+        pass
+
+    def endPath(self):
+        pass
+
+    def addComponent(self, glyphName, transformation):
+        pass
+
+
+def get_versions() -> Dict[str, str]:
+    """
+    Returns the versions of the libraries that determine the conversion results, so that sweeps run before and after
+    an upgrade can be told apart.
+    """
+    return {
+        "fonttools": fontTools.version,
+        "skia-pathops": getattr(pathops, "__version__", "unknown"),
+        "cffsubr": getattr(cffsubr, "__version__", "unknown"),
+    }
+
+
+def write_results(rows: List[dict], output_file: str, versions: Optional[Dict[str, str]] = None):
+    """
+    Writes sweep results to a CSV file, or to a JSON file if output_file ends with .json. In CSV files, the library
+    versions are added as columns of every row; in JSON files, they are stored once, next to the rows.
+
+    :param rows: The result rows, with the FIELDS keys
+    :param output_file: The output file
+    :param versions: The library versions. Defaults to the versions of the installed libraries
+    """
+    if versions is None:
+        versions = get_versions()
+    if output_file.lower().endswith(".json"):
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(dict(versions=versions, results=rows), f, indent=2, ensure_ascii=False)
+        return
+
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(FIELDS) + list(versions))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, **versions))
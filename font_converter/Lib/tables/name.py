@@ -24,32 +24,54 @@ class TableName(table__n_a_m_e):
         :param lang_string: The string to search for in the name records
         :return: A list of name records.
         """
-        filtered_names = self.names
-        if name_ids is not None:
-            filtered_names = [name for name in filtered_names if name.nameID in name_ids]
-        if platform_id is not None:
-            filtered_names = [name for name in filtered_names if name.platformID == platform_id]
-        if plat_enc_id is not None:
-            filtered_names = [name for name in filtered_names if name.platEncID == plat_enc_id]
-        if lang_id is not None:
-            filtered_names = [name for name in filtered_names if name.langID == lang_id]
-        if lang_string is not None:
-            mac_lang_id = _MAC_LANGUAGE_CODES.get(lang_string.lower())
-            win_lang_id = _WINDOWS_LANGUAGE_CODES.get(lang_string.lower())
-            filtered_names = [name for name in filtered_names if name.langID in (mac_lang_id, win_lang_id)]
-        return filtered_names
+        matches = _get_namerecord_filter(name_ids, platform_id, plat_enc_id, lang_id, lang_string)
+        return [name for name in self.names if matches(name)]
 
     def del_names(self, name_ids, platform_id=None, language_string=None) -> None:
         """
         Deletes all name records that match the given name_ids, optionally filtering by platform_id and/or
-        language_string.
+        language_string. The name records are scanned once, whatever the number of records to delete.
 
         :param name_ids: A list of name IDs to delete
         :param platform_id: The platform ID of the name records to delete
         :param language_string: The language of the name records to delete
         """
+        matches = _get_namerecord_filter(name_ids=name_ids, platform_id=platform_id, lang_string=language_string)
+        self.names = [name for name in self.names if not matches(name)]
 
-        names = self.filter_namerecords(name_ids=name_ids, platform_id=platform_id, lang_string=language_string)
+    def renumber_names(self, name_ids_map: dict) -> None:
+        """
+        Changes the name IDs of the name records in a single pass. All records are renumbered at once, so name IDs
+        can be swapped or shifted without conflicts between old and new IDs.
+
+        :param name_ids_map: A {old_name_id: new_name_id} dictionary. Name IDs not in the dictionary are unchanged
+        """
+        if not name_ids_map:
+            return
+        for name in self.names:
+            name.nameID = name_ids_map.get(name.nameID, name.nameID)
+
+
+def _get_namerecord_filter(name_ids=None, platform_id=None, plat_enc_id=None, lang_id=None, lang_string=None):
+    # Returns a function that tells whether a name record matches all the given criteria. Name IDs and language IDs
+    # are looked up in sets, so that each record is checked in constant time.
+    name_ids = None if name_ids is None else set(name_ids)
+    lang_ids = None
+    if lang_id is not None:
+        lang_ids = {lang_id}
+    if lang_string is not None:
+        lang_string_ids = {
+            _MAC_LANGUAGE_CODES.get(lang_string.lower()),
+            _WINDOWS_LANGUAGE_CODES.get(lang_string.lower()),
+        }
+        lang_ids = lang_string_ids if lang_ids is None else lang_ids & lang_string_ids
+
+    def matches(name) -> bool:
+        return (
+            (name_ids is None or name.nameID in name_ids)
+            and (platform_id is None or name.platformID == platform_id)
+            and (plat_enc_id is None or name.platEncID == plat_enc_id)
+            and (lang_ids is None or name.langID in lang_ids)
+        )
 
-        for name in names:
-            self.removeNames(name.nameID, name.platformID, name.platEncID, name.langID)
+    return matches
@@ -0,0 +1,94 @@
+"""
+Time limit of the conversion of each glyph, for the worker processes that convert fonts.
+
+The limit is enforced with a SIGALRM timer, armed when a glyph is started and disarmed when it's done: the handler
+raises GlyphTimeoutError in the converting code. Signals are only delivered to the main thread, and only between Python
+bytecodes: a glyph stuck in a single call to a C extension (pathops) is interrupted when the call returns, so the
+per-font timeout of MemoryScheduler, that kills the worker process, is the limit of last resort. The name of the glyph
+being converted can be shared with the parent process, that reports it when it kills the worker.
+"""
+import signal
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# The glyph time limit, in seconds, or None if glyphs are not timed
+_glyph_timeout: Optional[float] = None
+_current_glyph: Optional[str] = None
+# A shared ctypes char array (multiprocessing.RawArray) where the name of the current glyph is written, if any
+_current_glyph_buffer = None
+
+HAVE_TIMER = hasattr(signal, "setitimer")
+
+
+class GlyphTimeoutError(Exception):
+    """
+    Raised when a glyph takes longer than the glyph time limit.
+    """
+
+    def __init__(self, glyph_name: str, timeout: float):
+        # The arguments are passed to Exception, so that the error can be pickled and sent to the parent process
+        super().__init__(glyph_name, timeout)
+        self.glyph_name = glyph_name
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"Glyph '{self.glyph_name}' took more than {self.timeout} seconds"
+
+
+def set_glyph_timeout(timeout: Optional[float], glyph_buffer=None) -> None:
+    """
+    Sets the time limit of each glyph converted in this process. Must be called from the main thread. Not enforced on
+    platforms without setitimer (Windows).
+
+    :param timeout: The time limit, in seconds. None removes the limit
+    :param glyph_buffer: A multiprocessing.RawArray("c", size) where the name of the glyph being converted is written,
+        so that another process can read it
+    """
+    global _glyph_timeout, _current_glyph_buffer
+    _current_glyph_buffer = glyph_buffer
+    if timeout is not None and HAVE_TIMER:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        _glyph_timeout = timeout
+    else:
+        _glyph_timeout = None
+
+
+def get_current_glyph(glyph_buffer) -> Optional[str]:
+    """
+    Returns the name of the glyph written in a buffer passed to set_glyph_timeout, or None if no glyph was started.
+    """
+    value = glyph_buffer.value
+    return value.decode("utf-8", errors="replace") if value else None
+
+
+@contextmanager
+def glyph_time_limit(glyph_name: str) -> Iterator[None]:
+    """
+    Raises GlyphTimeoutError if the code in the with block takes longer than the glyph time limit.
+
+    Usage:
+
+    for glyph_name in glyph_set.keys():
+        with glyph_time_limit(glyph_name):
+            ...
+    """
+    global _current_glyph
+    if _current_glyph_buffer is not None:
+        _current_glyph_buffer.value = glyph_name.encode("utf-8")[: len(_current_glyph_buffer) - 1]
+    if _glyph_timeout is None:
+        yield
+        return
+
+    _current_glyph = glyph_name
+    signal.setitimer(signal.ITIMER_REAL, _glyph_timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        _current_glyph = None
+
+
+def _on_timeout(signum, frame):
+    # The timer may fire just after the glyph is done, before it's disarmed
+    if _current_glyph is not None:
+        raise GlyphTimeoutError(_current_glyph, _glyph_timeout)
@@ -0,0 +1,321 @@
+import math
+from io import BytesIO
+from multiprocessing import Pool
+from typing import List, Optional, Sequence, Tuple
+
+import pathops
+from fontTools.pens.basePen import BasePen
+
+from font_converter.Lib.Font import Font
+from font_converter.Lib.timeouts import glyph_time_limit
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Default quality gate: maximum distance between the outlines, in 1/1000 of unitsPerEm, and maximum XOR area, as a
+# ratio of the area of the source glyph. XOR areas that an outline within the maximum distance can cover are accepted
+# whatever their ratio, see GlyphDifference.exceeds
+MAX_DEVIATION = 5.0
+MAX_AREA_RATIO = 0.02
+
+# Number of line segments each curve is flattened into to measure distances
+_CURVE_STEPS = 16
+
+# XOR areas of the curves larger than this ratio of the glyph area are checked with the XOR of the flattened polygons
+_CROSS_CHECK_AREA_RATIO = 0.002
+
+Point = Tuple[float, float]
+Segment = Tuple[Point, Point]
+
+
+class GlyphDifference(object):
+    """
+    The difference between the source and the converted outline of a glyph.
+    """
+
+    def __init__(
+        self,
+        glyph_name: str,
+        deviation: float,
+        xor_area: float,
+        area: float,
+        length: float = 0.0,
+        units_per_em: int = 1000,
+    ):
+        self.glyph_name = glyph_name
+        #: The largest distance between the two outlines, in 1/1000 of unitsPerEm (inf if only one of them is empty)
+        self.deviation = deviation
+        #: The area covered by only one of the two outlines, in font units
+        self.xor_area = xor_area
+        #: The area of the source glyph, in font units
+        self.area = area
+        #: The length of the outline of the source glyph, in font units
+        self.length = length
+        self.units_per_em = units_per_em
+
+    @property
+    def area_ratio(self) -> float:
+        """
+        The XOR area as a ratio of the area of the source glyph.
+        """
+        if self.area == 0:
+            return 0.0 if self.xor_area == 0 else math.inf
+        return self.xor_area / self.area
+
+    def exceeds(self, max_deviation: float = MAX_DEVIATION, max_area_ratio: float = MAX_AREA_RATIO) -> bool:
+        """
+        Tells whether the glyph differs more than the thresholds. An outline that stays within max_deviation of the
+        source outline covers at most max_deviation times the length of the source outline on either side of it: such
+        XOR areas are accepted even above max_area_ratio, which glyphs made of many small shapes (e.g. shades) exceed
+        with deviations the conversion tolerance allows.
+        """
+        if self.deviation > max_deviation:
+            return True
+        if self.area_ratio <= max_area_ratio:
+            return False
+        return self.xor_area > max_deviation * self.units_per_em / 1000 * self.length
+
+
+class VerificationReport(object):
+    """
+    The result of the comparison of the outlines of two fonts.
+    """
+
+    def __init__(
+        self,
+        differences: List[GlyphDifference],
+        missing_glyphs: List[str],
+        max_deviation: float = MAX_DEVIATION,
+        max_area_ratio: float = MAX_AREA_RATIO,
+    ):
+        #: The compared glyphs, sorted from the most different
+        self.differences = sorted(differences, key=lambda d: (d.deviation, d.area_ratio), reverse=True)
+        #: The source glyphs that are not in the converted font (e.g. removed by subsetting or purged)
+        self.missing_glyphs = missing_glyphs
+        self.max_deviation = max_deviation
+        self.max_area_ratio = max_area_ratio
+
+    @property
+    def failed_glyphs(self) -> List[GlyphDifference]:
+        """
+        The glyphs whose difference exceeds the thresholds, from the most different.
+        """
+        return [d for d in self.differences if d.exceeds(self.max_deviation, self.max_area_ratio)]
+
+    @property
+    def passed(self) -> bool:
+        return not self.failed_glyphs
+
+    def get_worst_glyphs(self, count: int = 10) -> List[GlyphDifference]:
+        return self.differences[:count]
+
+
+def verify_fonts(
+    source_data: bytes,
+    converted_data: bytes,
+    workers: int = 1,
+    max_deviation: float = MAX_DEVIATION,
+    max_area_ratio: float = MAX_AREA_RATIO,
+) -> VerificationReport:
+    """
+    Compares the outlines of a source font and of its conversion, glyph by glyph: glyphs are matched by name, and for
+    each glyph the area of the pathops XOR of the two outlines and the largest distance between them (the Hausdorff
+    distance of the outlines, with curves flattened into line segments) are measured.
+
+    Distances are computed with NumPy arrays when NumPy is installed. Glyphs can be compared in several processes.
+
+    :param source_data: The source font data
+    :param converted_data: The converted font data
+    :param workers: The number of processes that compare glyphs
+    :param max_deviation: The maximum distance between the outlines of a glyph, in 1/1000 of unitsPerEm
+    :param max_area_ratio: The maximum XOR area of a glyph, as a ratio of the area of the source glyph
+    :return: The verification report.
+    """
+    source_font = _load_font(source_data)
+    converted_font = _load_font(converted_data)
+    if source_font["head"].unitsPerEm != converted_font["head"].unitsPerEm:
+        raise ValueError("The fonts have different unitsPerEm")
+
+    converted_glyphs = set(converted_font.getGlyphOrder())
+    glyph_names = [g for g in source_font.getGlyphOrder() if g in converted_glyphs]
+    missing_glyphs = [g for g in source_font.getGlyphOrder() if g not in converted_glyphs]
+
+    workers = max(1, min(workers, len(glyph_names) // 64))
+    if workers == 1:
+        differences = _compare_glyphs(source_font, converted_font, glyph_names)
+    else:
+        # Each worker loads the fonts once, and compares chunks of glyphs
+        chunk_size = math.ceil(len(glyph_names) / (workers * 4))
+        chunks = [glyph_names[i : i + chunk_size] for i in range(0, len(glyph_names), chunk_size)]
+        differences = []
+        with Pool(processes=workers, initializer=_init_worker, initargs=(source_data, converted_data)) as pool:
+            for chunk_differences in pool.imap_unordered(_compare_glyphs_in_worker, chunks):
+                differences.extend(chunk_differences)
+
+    return VerificationReport(differences, missing_glyphs, max_deviation=max_deviation, max_area_ratio=max_area_ratio)
+
+
+_worker_fonts: Optional[Tuple[Font, Font]] = None
+
+
+def _init_worker(source_data: bytes, converted_data: bytes):
+    global _worker_fonts
+    _worker_fonts = _load_font(source_data), _load_font(converted_data)
+
+
+def _compare_glyphs_in_worker(glyph_names: List[str]) -> List[GlyphDifference]:
+    return _compare_glyphs(*_worker_fonts, glyph_names)
+
+
+def _load_font(data: bytes) -> Font:
+    return Font(BytesIO(data))
+
+
+def _compare_glyphs(source_font: Font, converted_font: Font, glyph_names: Sequence[str]) -> List[GlyphDifference]:
+    source_glyph_set = source_font.getGlyphSet()
+    converted_glyph_set = converted_font.getGlyphSet()
+    upem = source_font["head"].unitsPerEm
+    scale = 1000 / upem
+
+    differences = []
+    for glyph_name in glyph_names:
+        with glyph_time_limit(glyph_name):
+            source_path, source_contours = _draw_glyph(source_glyph_set, glyph_name)
+            converted_path, converted_contours = _draw_glyph(converted_glyph_set, glyph_name)
+
+            try:
+                xor_area = pathops.op(source_path, converted_path, pathops.PathOp.XOR).area
+            except pathops.PathOpsError:
+                xor_area = math.inf
+            if xor_area > _CROSS_CHECK_AREA_RATIO * source_path.area:
+                # Skia fails on some nearly coincident quadratic and cubic curves, or silently returns a too large area,
+                # but not on their flattened polygons, whose XOR slightly overestimates the area too: the smaller area
+                # is kept
+                polygon_xor_area = pathops.op(
+                    _get_polygon_path(source_contours), _get_polygon_path(converted_contours), pathops.PathOp.XOR
+                ).area
+                xor_area = min(xor_area, polygon_xor_area)
+            source_segments = [segment for contour in source_contours for segment in contour]
+            length = sum(math.hypot(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in source_segments)
+            converted_segments = [segment for contour in converted_contours for segment in contour]
+            if not source_segments and not converted_segments:
+                deviation = 0.0
+            elif not source_segments or not converted_segments:
+                deviation = math.inf
+            else:
+                deviation = _get_hausdorff_distance(source_segments, converted_segments) * scale
+            differences.append(
+                GlyphDifference(glyph_name, deviation, xor_area, source_path.area, length=length, units_per_em=upem)
+            )
+    return differences
+
+
+def _draw_glyph(glyph_set, glyph_name: str) -> Tuple[pathops.Path, List[List[Segment]]]:
+    # Overlaps are removed first: the edges inside overlapping contours or components are not part of the outline,
+    # and are not drawn by converters that remove overlaps
+    path = pathops.Path()
+    glyph_set[glyph_name].draw(path.getPen(glyphSet=glyph_set))
+    try:
+        path = pathops.simplify(path, clockwise=False)
+    except pathops.PathOpsError:
+        pass
+    pen = _FlatteningPen(None)
+    path.draw(pen)
+    return path, [contour for contour in pen.contours if contour]
+
+
+def _get_polygon_path(contours: List[List[Segment]]) -> pathops.Path:
+    path = pathops.Path()
+    for contour in contours:
+        path.moveTo(*contour[0][0])
+        for _, point in contour:
+            path.lineTo(*point)
+        path.close()
+    return path
+
+
+class _FlatteningPen(BasePen):
+    # Collects the contours of the outline as closed lists of line segments, with curves flattened into _CURVE_STEPS
+    # segments
+
+    def __init__(self, glyph_set):
+        super().__init__(glyph_set)
+        self.contours: List[List[Segment]] = []
+        self._start = None
+
+    def _moveTo(self, pt):
+        self._start = pt
+        self.contours.append([])
+
+    def _lineTo(self, pt):
+        self.contours[-1].append((self._getCurrentPoint(), pt))
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = self._getCurrentPoint(), pt1, pt2, pt3
+        points = []
+        for i in range(_CURVE_STEPS + 1):
+            t = i / _CURVE_STEPS
+            a, b, c, d = (1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t**2, t**3
+            points.append((a * x0 + b * x1 + c * x2 + d * x3, a * y0 + b * y1 + c * y2 + d * y3))
+        self.contours[-1].extend(zip(points, points[1:]))
+
+    def _qCurveToOne(self, pt1, pt2):
+        (x0, y0), (x1, y1), (x2, y2) = self._getCurrentPoint(), pt1, pt2
+        points = []
+        for i in range(_CURVE_STEPS + 1):
+            t = i / _CURVE_STEPS
+            a, b, c = (1 - t) ** 2, 2 * (1 - t) * t, t**2
+            points.append((a * x0 + b * x1 + c * x2, a * y0 + b * y1 + c * y2))
+        self.contours[-1].extend(zip(points, points[1:]))
+
+    def _closePath(self):
+        current_point = self._getCurrentPoint()
+        if self._start is not None and current_point != self._start:
+            self.contours[-1].append((current_point, self._start))
+
+    def _endPath(self):
+        pass
+
+
+def _get_hausdorff_distance(a: List[Segment], b: List[Segment]) -> float:
+    # The largest distance from a vertex of one outline to the other outline, in both directions
+    if np is not None:
+        # Coordinates are at most a few thousand units: float32 is precise to far less than a unit, and twice as fast
+        a = np.array(a, dtype=np.float32)
+        b = np.array(b, dtype=np.float32)
+        return max(_get_max_distance_np(a[:, 0], b), _get_max_distance_np(b[:, 0], a))
+    return max(_get_max_distance([s[0] for s in a], b), _get_max_distance([s[0] for s in b], a))
+
+
+def _get_max_distance_np(points: "np.ndarray", segments: "np.ndarray") -> float:
+    # Distances from each point (n, 2) to each segment (m, 2, 2), in chunks of points that fit in the CPU cache
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    dx, dy = segments[:, 1, 0] - x0, segments[:, 1, 1] - y0
+    length = dx * dx + dy * dy
+    inverse_length = np.divide(1, length, out=np.zeros_like(length), where=length != 0)
+    max_distance = 0.0
+    chunk_size = max(1, (1 << 18) // len(segments))
+    for i in range(0, len(points), chunk_size):
+        x = points[i : i + chunk_size, 0, None] - x0
+        y = points[i : i + chunk_size, 1, None] - y0
+        t = np.clip((x * dx + y * dy) * inverse_length, 0, 1)
+        x -= t * dx
+        y -= t * dy
+        max_distance = max(max_distance, float((x * x + y * y).min(axis=1).max()))
+    return math.sqrt(max_distance)
+
+
+def _get_max_distance(points: List[Point], segments: List[Segment]) -> float:
+    max_distance = 0.0
+    for x, y in points:
+        min_distance = math.inf
+        for (x0, y0), (x1, y1) in segments:
+            dx, dy = x1 - x0, y1 - y0
+            length = dx * dx + dy * dy
+            t = 0 if length == 0 else min(1, max(0, ((x - x0) * dx + (y - y0) * dy) / length))
+            nx, ny = x - x0 - t * dx, y - y0 - t * dy
+            min_distance = min(min_distance, nx * nx + ny * ny)
+        max_distance = max(max_distance, min_distance)
+    return math.sqrt(max_distance)
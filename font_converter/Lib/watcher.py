@@ -0,0 +1,194 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from font_converter.Lib.files import iter_files, match_globs
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+
+class Watcher(object):
+    """
+    Watches a file or the files of a directory (and optionally of its subdirectories), and reports the files that were
+    added or changed.
+
+    On Linux, inotify is used to wake up as soon as something happens in the directory. Elsewhere, or when inotify is
+    not available (or doesn't work, as on most network shares), the directory is polled. Either way, changes are found
+    by comparing the size and modification time of the files, after waiting for bursts of writes to settle down.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        debounce: float = 1.0,
+        poll_interval: float = 1.0,
+        poll: bool = False,
+        recursive: bool = False,
+        include: tuple = None,
+        exclude: tuple = None,
+    ):
+        """
+        :param path: The file or directory to watch
+        :param debounce: Seconds without further writes to wait before reporting changes
+        :param poll_interval: Seconds between two scans of the directory when polling
+        :param poll: If True, the directory is polled even if inotify is available
+        :param recursive: If True, subdirectories are watched too
+        :param include: Glob patterns of the files to watch (see iter_files)
+        :param exclude: Glob patterns of the files and directories not to watch (see iter_files)
+        """
+        self.path = path
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self._snapshot_taken: Optional[Dict[str, Tuple[int, int]]] = None
+        watched_dir = path if os.path.isdir(path) else os.path.dirname(path)
+        self._inotify = None if poll else _Inotify.create()
+        if self._inotify is not None and not self._inotify.add_watch(watched_dir):
+            self.close()
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify is not None
+
+    def start(self) -> None:
+        """
+        Records the current state of the files, and starts watching for changes: the files added or changed from now
+        on are reported by watch(), even if it's called later. Called by watch() if it was not called before.
+        """
+        self._snapshot_taken = self._snapshot()
+
+    def watch(self) -> Iterator[List[str]]:
+        """
+        Yields the lists of files that were added or changed since the previous iteration (the first time, since
+        start() was called). Removed files are not reported. Runs until the generator is closed.
+        """
+        if self._snapshot_taken is None:
+            self.start()
+        snapshot = self._snapshot_taken
+        try:
+            while True:
+                if self.uses_inotify:
+                    self._wait_inotify()
+                    current = self._snapshot()
+                else:
+                    current = self._wait_polling(snapshot)
+
+                changed_files = sorted(f for f, stat in current.items() if snapshot.get(f) != stat)
+                snapshot = current
+                if changed_files:
+                    yield changed_files
+        finally:
+            self.close()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _wait_inotify(self):
+        # Wait for the first event, waking up regularly so that KeyboardInterrupt is handled, then drain the events
+        # until no more arrive for self.debounce seconds.
+        while not select.select([self._inotify.fd], [], [], 1.0)[0]:
+            pass
+        while True:
+            try:
+                while os.read(self._inotify.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+            if not select.select([self._inotify.fd], [], [], self.debounce)[0]:
+                return
+
+    def _wait_polling(self, snapshot: dict) -> dict:
+        current = snapshot
+        while current == snapshot:
+            time.sleep(self.poll_interval)
+            current = self._snapshot()
+        # Wait until two scans in a row find the same files
+        while True:
+            time.sleep(self.debounce)
+            settled = self._snapshot()
+            if settled == current:
+                return current
+            current = settled
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for file in iter_files(self.path, recursive=self.recursive, include=self.include, exclude=self.exclude):
+            try:
+                stat = os.stat(file)
+                snapshot[file] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass
+
+        # inotify watches are not recursive: watch the subdirectories created since the last scan too, except the
+        # excluded ones
+        if self._inotify is not None and self.recursive and os.path.isdir(self.path):
+            for directory, subdirectories, _ in os.walk(self.path):
+                subdirectories[:] = [d for d in subdirectories if not self._is_excluded(os.path.join(directory, d))]
+                self._inotify.add_watch(directory)
+
+        return snapshot
+
+    def _is_excluded(self, directory: str) -> bool:
+        if not self.exclude:
+            return False
+        relative_path = os.path.relpath(directory, self.path).replace(os.sep, "/")
+        return match_globs(os.path.basename(directory), relative_path, self.exclude)
+
+
+class _Inotify(object):
+    """
+    A minimal inotify(7) wrapper, using ctypes so that no extra dependency is needed.
+    """
+
+    def __init__(self, libc, fd: int):
+        self.libc = libc
+        self.fd = fd
+        self._watched = set()
+
+    @classmethod
+    def create(cls) -> Optional["_Inotify"]:
+        """
+        Returns a new inotify instance, or None if inotify is not available.
+        """
+        library = ctypes.util.find_library("c")
+        if library is None:
+            return None
+        try:
+            libc = ctypes.CDLL(library, use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_watch(self, directory: str) -> bool:
+        """
+        Watches a directory, if it's not watched yet.
+
+        :return: False if the directory can't be watched.
+        """
+        if directory in self._watched:
+            return True
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            return False
+        self._watched.add(directory)
+        return True
+
+    def close(self):
+        os.close(self.fd)
@@ -1,27 +1,377 @@
+import logging
 import os
+import sys
 import time
-from io import BytesIO
+from collections import deque
+from functools import partial
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
 import click
+from fontTools import configLogger
 from fontTools.misc.cliTools import makeOutputFileName
 from fontTools.ttLib import TTCollection, TTLibError
 from fontTools.ttLib.tables._f_v_a_r import NamedInstance
-from fontTools.varLib.instancer import instantiateVariableFont, OverlapMode
 from pathvalidate import sanitize_filename
 
 from font_converter.Lib.Font import Font
-from font_converter.Lib.cli_tools import check_input_path, check_output_dir
+from font_converter.Lib.api import (
+    change_flavor,
+    get_extension,
+    get_flavor,
+    get_font_count,
+    load_font,
+    optimize_layout_tables,
+    submit_otf,
+    to_otf,
+    to_sfnt,
+    to_static,
+    to_ttf,
+    to_web,
+)
+from font_converter.Lib.archives import ArchiveMember, open_input
+from font_converter.Lib.checkpoint import Checkpoint
+from font_converter.Lib.cli_tools import (
+    OutputRecord,
+    OutputWriter,
+    check_input_path,
+    check_output_archive,
+    check_output_dir,
+    check_queue_dir,
+    filter_fonts,
+    get_file_output_dir,
+    get_subset_unicodes,
+    map_in_threads,
+    match_converted_fonts,
+    watch_input_path,
+)
 from font_converter.Lib.click_tools import (
     add_file_or_path_argument,
     add_common_options,
+    add_dedup_options,
+    add_layout_options,
+    add_parallel_options,
+    add_queue_options,
+    add_subset_options,
+    add_sweep_options,
+    add_thread_options,
+    add_verify_options,
+    add_watch_options,
     generic_error_message,
     generic_info_message,
+    generic_success_message,
     file_saved_message,
     select_instance_coordinates,
     generic_warning_message,
 )
 from font_converter.Lib.converters import otf_to_ttf
-from font_converter.Lib.converters.ttf_to_otf import TrueTypeToCFF
+from font_converter.Lib.converters.subroutinizer import Subroutinizer
+from font_converter.Lib.dedup import ResultCache, get_file_flavor, get_fingerprint, group_duplicates
+from font_converter.Lib.files import iter_files, prefetch_files
+from font_converter.Lib.job_queue import JobQueue, QueueJob
+from font_converter.Lib.layout import LAYOUT_TABLES
+from font_converter.Lib.scheduler import FontTimeoutError, MemoryScheduler
+from font_converter.Lib.sweep import get_sweep_settings, get_versions, sweep_font, write_results
+from font_converter.Lib.timeouts import GlyphTimeoutError
+from font_converter.Lib.verifier import MAX_AREA_RATIO, MAX_DEVIATION, GlyphDifference, verify_fonts
+
+
+def _convert_file(
+    file: str,
+    target: str,
+    input_path: str,
+    output_dir: str,
+    recalc_timestamp: bool,
+    overwrite: bool,
+    verify: Optional[dict] = None,
+    **options,
+) -> Tuple[str, bytes, dict]:
+    # Runs in the worker processes of MemoryScheduler. The output is saved by the main process, that owns the writer
+    font = Font(file, recalcTimestamp=recalc_timestamp)
+    stats = {}
+    if target == "otf":
+        data = to_otf(font, stats=stats, **options)
+    else:
+        data = to_ttf(font, stats=stats, **options)
+    if verify is not None:
+        _verify_output(file, data, stats, **verify)
+    output_file = _get_output_file(file, target, data, input_path, output_dir, overwrite)
+    return output_file, data, stats
+
+
+def _get_output_file(file: str, target: str, data: bytes, input_path: str, output_dir: str, overwrite: bool) -> str:
+    # Web fonts keep their flavor: the target is added before their extension (Font.otf.woff2)
+    return makeOutputFileName(
+        file,
+        suffix="" if get_flavor(data) is None else f".{target}",
+        extension=get_extension(data),
+        outputDir=get_file_output_dir(file, input_path, output_dir),
+        overWrite=overwrite,
+    )
+
+
+def _save_output(
+    file: Union[str, QueueJob],
+    output_file: str,
+    data: bytes,
+    writer: OutputWriter,
+    checkpoint: Union[Checkpoint, JobQueue],
+    stats: dict,
+    job_stats: Optional[dict] = None,
+    done_message: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Saves the output of a converted file, records the file as done once the output is saved (or as failed, if it can't
+    be saved) and adds the stats of its conversion to stats.
+
+    :param file: The converted file, or its job if checkpoint is a job queue
+    :param output_file: The path of the output file
+    :param data: The converted font
+    :param writer: The writer of the output files
+    :param checkpoint: The checkpoint, or the job queue, where the file is recorded
+    :param stats: The stats of the batch
+    :param job_stats: The stats of the conversion of the file
+    :param done_message: The message printed before the path of the output file
+    :return: The path of the saved file, or None if it couldn't be saved or recorded. With a background writer, the
+        file may still fail to be saved: flush counts those files.
+    """
+    record = OutputRecord(file, checkpoint, writer)
+    try:
+        output_file = record.write(output_file, data)
+    except Exception as e:
+        checkpoint.set_failed(file, e)
+        generic_error_message(e)
+        return None
+    record.close()
+    if record.lost:
+        return None
+    for key, value in (job_stats or {}).items():
+        stats[key] = stats.get(key, 0) + value
+    if done_message is not None:
+        generic_info_message(done_message)
+    file_saved_message(output_file)
+    return output_file
+
+
+def _convert_files_in_parallel(
+    files: Iterable[str],
+    target: str,
+    checkpoint: Checkpoint,
+    writer: OutputWriter,
+    workers: int,
+    memory_budget: Optional[int],
+    stats: dict,
+    input_path: str,
+    output_dir: str,
+    overwrite: bool,
+    font_timeout: Optional[float] = None,
+    glyph_timeout: Optional[float] = None,
+    dedup: bool = False,
+    **kwargs,
+) -> Tuple[int, int, int]:
+    """
+    Converts the files with MemoryScheduler, printing the estimated and the actual peak memory of each file. Files that
+    take longer than font_timeout, or that have a glyph that takes longer than glyph_timeout, fail and are counted in
+    stats["timed_out_files"].
+
+    With dedup, the files are fingerprinted before they are scheduled, and only the first file of each font is
+    converted: the outputs of the files with the same font in other containers are made from its result, and counted
+    in stats["deduplicated_files"].
+
+    :return: The number of files, of converted files and of files skipped because of the checkpoint.
+    """
+    counter = 0
+    converted_files = 0
+    skipped_files = 0
+
+    files_to_convert = []
+    for file in files:
+        counter += 1
+        if checkpoint.is_done(file):
+            skipped_files += 1
+            generic_info_message(f"Skipping {os.path.basename(file)} (already converted)")
+            continue
+        files_to_convert.append(file)
+
+    groups = group_duplicates(files_to_convert) if dedup else [[file] for file in files_to_convert]
+    duplicates = {group[0]: group[1:] for group in groups}
+
+    scheduler = MemoryScheduler(
+        max_workers=workers, memory_budget=memory_budget, timeout=font_timeout, glyph_timeout=glyph_timeout
+    )
+    if scheduler.memory_budget is not None:
+        generic_info_message(f"Memory budget     : {_format_memory(scheduler.memory_budget)}")
+
+    total_estimated_memory = 0
+    total_peak_memory = 0
+    func = partial(
+        _convert_file, target=target, input_path=input_path, output_dir=output_dir, overwrite=overwrite, **kwargs
+    )
+    for job in scheduler.run(func, list(duplicates)):
+        print()
+        if job.error is not None:
+            if _is_timeout(job.error):
+                stats["timed_out_files"] = stats.get("timed_out_files", 0) + 1
+            for file in [job.file] + duplicates[job.file]:
+                checkpoint.set_failed(file, job.error)
+            generic_error_message(job.error)
+            continue
+        generic_info_message(f"Converted {os.path.basename(job.file)}")
+
+        memory_message = f"estimated memory {_format_memory(job.estimated_memory)}"
+        if job.peak_memory is not None:
+            memory_message += f", peak memory {_format_memory(job.peak_memory)}"
+            total_estimated_memory += job.estimated_memory
+            total_peak_memory += job.peak_memory
+        output_file, data, job_stats = job.result
+        done_message = f"Done in {round(job.elapsed_time, 3)} seconds ({memory_message})"
+        if _save_output(job.file, output_file, data, writer, checkpoint, stats, job_stats, done_message) is not None:
+            converted_files += 1
+
+        for file in duplicates[job.file]:
+            generic_info_message(f"{os.path.basename(file)} is the same font")
+            try:
+                duplicate_data = change_flavor(data, get_file_flavor(file))
+                output_file = _get_output_file(file, target, duplicate_data, input_path, output_dir, overwrite)
+            except Exception as e:
+                checkpoint.set_failed(file, e)
+                generic_error_message(e)
+                continue
+            job_stats = {"deduplicated_files": 1}
+            if _save_output(file, output_file, duplicate_data, writer, checkpoint, stats, job_stats) is not None:
+                converted_files += 1
+
+    print()
+    generic_info_message(f"Peak scheduled    : {_format_memory(scheduler.peak_scheduled_memory)}")
+    if total_peak_memory:
+        generic_info_message(f"Estimate/peak     : {round(total_estimated_memory / total_peak_memory, 2)}")
+
+    return counter, converted_files, skipped_files
+
+
+def _convert_files_from_queue(
+    files: Iterable[str],
+    target: str,
+    queue: JobQueue,
+    writer: OutputWriter,
+    stats: dict,
+    input_path: str,
+    output_dir: str,
+    font_timeout: Optional[float] = None,
+    glyph_timeout: Optional[float] = None,
+    **kwargs,
+) -> Tuple[int, int, int]:
+    """
+    Enqueues the files in the job queue, then converts the jobs claimed from the queue until it's empty. Jobs may have
+    been enqueued by other workers: they are converted with the options of this worker.
+
+    With font_timeout or glyph_timeout, each job is converted in a new worker process, that is killed if it takes longer
+    than font_timeout.
+
+    :return: The number of files, of enqueued files and of jobs converted by this worker.
+    """
+    counter = 0
+    enqueued_files = 0
+    for file in files:
+        counter += 1
+        if queue.enqueue(file, input_path, output_dir):
+            enqueued_files += 1
+    generic_info_message(f"Worker {queue.worker_id}: {enqueued_files} of {counter} files enqueued")
+
+    scheduler = None
+    if font_timeout is not None or glyph_timeout is not None:
+        scheduler = MemoryScheduler(max_workers=1, timeout=font_timeout, glyph_timeout=glyph_timeout)
+
+    converted_files = 0
+    for job in queue.iter_jobs():
+        print()
+        generic_info_message(f"Converting {job.file}")
+        func = partial(_convert_file, target=target, input_path=job.input_path, output_dir=job.output_dir, **kwargs)
+        try:
+            if scheduler is None:
+                output_file, data, job_stats = func(job.file)
+            else:
+                scheduled_job = next(scheduler.run(func, [job.file]))
+                if scheduled_job.error is not None:
+                    raise scheduled_job.error
+                output_file, data, job_stats = scheduled_job.result
+        except Exception as e:
+            if _is_timeout(e):
+                stats["timed_out_files"] = stats.get("timed_out_files", 0) + 1
+            queue.set_failed(job, e)
+            generic_error_message(e)
+            continue
+
+        done_message = f"Done in {round(time.time() - job.start_time, 3)} seconds"
+        if _save_output(job, output_file, data, writer, queue, stats, job_stats, done_message) is not None:
+            converted_files += 1
+
+    status = queue.get_status()
+    print()
+    generic_info_message(f"Queue             : {status['done']} done, {status['failed']} failed")
+    return counter, enqueued_files, converted_files
+
+
+def _get_verification(verify: bool, max_deviation: float, max_area_ratio: float, scheduled: bool) -> Optional[dict]:
+    # The options of _verify_output. Glyphs are compared in a process per CPU, unless the fonts are already converted
+    # by scheduler worker processes
+    if not verify:
+        return None
+    workers = 1 if scheduled else os.cpu_count() or 1
+    return dict(max_deviation=max_deviation, max_area_ratio=max_area_ratio, workers=workers)
+
+
+def _verify_output(
+    file: str, data: bytes, stats: dict, max_deviation: float, max_area_ratio: float, workers: int = 1
+):
+    """
+    Compares the outlines of a converted font with the outlines of its source file, with workers processes. Raises an
+    error, so that the conversion is treated as failed, if a glyph differs more than the thresholds.
+    """
+    with open_input(file) as f:
+        source_data = f.read()
+    report = verify_fonts(
+        source_data, data, workers=workers, max_deviation=max_deviation, max_area_ratio=max_area_ratio
+    )
+    stats["verified_files"] = stats.get("verified_files", 0) + 1
+    if not report.passed:
+        failed_glyphs = report.failed_glyphs
+        raise ValueError(
+            f"Verification failed: {len(failed_glyphs)} glyphs differ from the source font (worst: "
+            f"{'; '.join(_format_difference(d) for d in failed_glyphs[:3])})"
+        )
+
+
+def _format_difference(difference: GlyphDifference) -> str:
+    return (
+        f"{difference.glyph_name} {round(difference.deviation, 2)}/1000 em, "
+        f"XOR {round(difference.area_ratio * 100, 2)}%"
+    )
+
+
+def _print_layout_report(stats: dict):
+    # Prints the sizes of the layout tables before and after optimization, added to stats by optimize_layout_tables
+    for tag in LAYOUT_TABLES:
+        size_before = stats.get(f"{tag}_size_before")
+        if size_before is None:
+            continue
+        size_after = stats[f"{tag}_size_after"]
+        saved = 0 if size_before == 0 else round((size_before - size_after) / size_before * 100, 1)
+        generic_info_message(f"{tag} size         : {size_before} -> {size_after} bytes (-{saved}%)")
+
+
+def _get_writer(output_dir: str, output_archive: Optional[str], overwrite: bool, io_buffer: int) -> OutputWriter:
+    # With --no-overwrite, output files are named after checking which files exist: a file still waiting to be saved
+    # would not be seen, so files are saved before the next one is named
+    return OutputWriter(output_dir, output_archive, buffer_size=io_buffer if overwrite else 0)
+
+
+def _is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (FontTimeoutError, GlyphTimeoutError))
+
+
+def _format_memory(size: int) -> str:
+    return f"{round(size / (1 << 20), 1)} MB"
 
 
 @click.group()
@@ -41,6 +391,16 @@ def ttf_2_otf():
     points but may change shape.
     """,
 )
+@click.option(
+    "--max-tolerance",
+    type=click.FloatRange(0, 2.5),
+    default=None,
+    help="""
+    Optimize output size: convert each glyph with the tolerance between --tolerance and this value (0-2.5) that produces
+    the smallest charstring. Outlines never deviate from the source by more than this tolerance. Slower, since each
+    glyph is converted several times.
+    """,
+)
 @click.option(
     "--safe",
     is_flag=True,
@@ -55,6 +415,7 @@ def ttf_2_otf():
     "--keep-glyphs",
     "purge_glyphs",
     is_flag=True,
+    flag_value=False,
     default=True,
     help="""
     Doesn't remove 'NULL' and 'CR' glyphs from the output font.
@@ -64,71 +425,255 @@ def ttf_2_otf():
     "--no-subr",
     "subroutinize",
     is_flag=True,
+    flag_value=False,
     default=True,
     help=""" 
     Turn off subroutinization of converted fonts.
     """,
 )
+@add_subset_options()
+@add_layout_options()
+@add_verify_options()
 @add_common_options()
-def ttf2otf(input_path, tolerance, safe, purge_glyphs, subroutinize, recalcTimestamp, outputDir, overWrite):
+@add_dedup_options()
+@add_parallel_options()
+@add_queue_options()
+@add_watch_options()
+def ttf2otf(
+    input_path,
+    tolerance,
+    max_tolerance,
+    safe,
+    purge_glyphs,
+    subroutinize,
+    unicodes,
+    textFile,
+    layoutFeatures,
+    optimizeLayout,
+    verify,
+    maxDeviation,
+    maxArea,
+    recalcTimestamp,
+    outputDir,
+    outputArchive,
+    overWrite,
+    recursive,
+    include,
+    exclude,
+    checkpointFile,
+    ioBuffer,
+    dedup,
+    workers,
+    memoryBudget,
+    fontTimeout,
+    glyphTimeout,
+    queueDir,
+    leaseTimeout,
+    watch,
+    debounce,
+    poll,
+):
     """
     Converts fonts from TrueType to CFF format.
     """
-    files = check_input_path(input_path, allow_variable=False, allow_cff=False)
+    discovery = dict(recursive=recursive, include=include, exclude=exclude)
+    isolated = workers > 1 or queueDir is not None or fontTimeout is not None or glyphTimeout is not None
+    # Worker processes read their own files: files read ahead would be copied to them
+    files = check_input_path(
+        input_path,
+        allow_variable=False,
+        allow_cff=False,
+        allow_empty=watch or queueDir is not None,
+        prefetch=0 if isolated else ioBuffer,
+        **discovery,
+    )
+    check_output_archive(outputArchive, watch=watch, checkpoint_file=checkpointFile)
+    check_queue_dir(queueDir, input_path, outputArchive, watch=watch, checkpoint_file=checkpointFile, workers=workers)
     output_dir = check_output_dir(input_path=input_path, output_path=outputDir)
-
-    start_time = time.time()
-    converted_files_counter = 0
-    counter = 0
-
-    for file in files:
-        t = time.time()
-        counter += 1
-
-        try:
-            print()
-            generic_info_message(f"Converting file {os.path.basename(file)}: {counter} of {len(files)}")
-            source_font = Font(file, recalcTimestamp=recalcTimestamp)
-
-            # Set tolerance as a ratio of unitsPerEm
-            tolerance = tolerance / 1000 * source_font["head"].unitsPerEm
-
-            ext = ".otf" if source_font.flavor is None else source_font.get_real_extension()
-            suffix = "" if source_font.flavor is None else ".otf"
-            output_file = makeOutputFileName(
-                file, suffix=suffix, extension=ext, outputDir=output_dir, overWrite=overWrite
+    checkpoint = Checkpoint(checkpointFile, command="ttf2otf")
+    # Queue jobs are recorded as done once their output is saved
+    writer = _get_writer(output_dir, outputArchive, overWrite, io_buffer=0 if queueDir is not None else ioBuffer)
+    subset = dict(unicodes=get_subset_unicodes(unicodes, textFile), layout_features=layoutFeatures)
+    scheduled = workers > 1 or fontTimeout is not None or glyphTimeout is not None
+    verification = _get_verification(verify, maxDeviation, maxArea, scheduled)
+
+    def convert_files(files: Iterable[str]):
+        start_time = time.time()
+        converted_files_counter = 0
+        skipped_files_counter = 0
+        counter = 0
+        stats = {}
+        results = ResultCache()
+
+        # Fonts waiting for the background subroutinizer: (input file, output file, start time, future, fingerprint)
+        pending = deque()
+
+        def save_pending_file():
+            nonlocal converted_files_counter
+            file, output_file, t, future, fingerprint = pending.popleft()
+            try:
+                data = future.result()
+                if verification is not None:
+                    _verify_output(file, data, stats, **verification)
+            except Exception as e:
+                checkpoint.set_failed(file, e)
+                generic_error_message(e)
+                return
+            done_message = f"Done in {round(time.time() - t, 3)} seconds"
+            if _save_output(file, output_file, data, writer, checkpoint, stats, done_message=done_message) is not None:
+                results.put(fingerprint, file, data, len(data))
+                converted_files_counter += 1
+
+        enqueued_files_counter = 0
+
+        if queueDir is not None:
+            with JobQueue(queueDir, command="ttf2otf", lease_timeout=leaseTimeout) as queue:
+                counter, enqueued_files_counter, converted_files_counter = _convert_files_from_queue(
+                    files,
+                    target="otf",
+                    queue=queue,
+                    writer=writer,
+                    stats=stats,
+                    input_path=input_path,
+                    output_dir=output_dir,
+                    recalc_timestamp=recalcTimestamp,
+                    overwrite=overWrite,
+                    tolerance=tolerance,
+                    max_tolerance=max_tolerance,
+                    safe=safe,
+                    purge_glyphs=purge_glyphs,
+                    subroutinize=subroutinize,
+                    optimize_layout=optimizeLayout,
+                    verify=verification,
+                    font_timeout=fontTimeout,
+                    glyph_timeout=glyphTimeout,
+                    **subset,
+                )
+        elif isolated:
+            counter, converted_files_counter, skipped_files_counter = _convert_files_in_parallel(
+                files,
+                target="otf",
+                checkpoint=checkpoint,
+                writer=writer,
+                workers=workers,
+                memory_budget=memoryBudget,
+                font_timeout=fontTimeout,
+                glyph_timeout=glyphTimeout,
+                stats=stats,
+                input_path=input_path,
+                output_dir=output_dir,
+                recalc_timestamp=recalcTimestamp,
+                overwrite=overWrite,
+                tolerance=tolerance,
+                max_tolerance=max_tolerance,
+                safe=safe,
+                purge_glyphs=purge_glyphs,
+                subroutinize=subroutinize,
+                optimize_layout=optimizeLayout,
+                verify=verification,
+                dedup=dedup,
+                **subset,
             )
+        else:
+            with Subroutinizer() as subroutinizer:
+                for file in files:
+                    t = time.time()
+                    counter += 1
+
+                    if checkpoint.is_done(file):
+                        skipped_files_counter += 1
+                        generic_info_message(f"Skipping file {counter}: {os.path.basename(file)} (already converted)")
+                        continue
+
+                    try:
+                        print()
+                        generic_info_message(f"Converting file {counter}: {os.path.basename(file)}")
+                        source_font = Font(file, recalcTimestamp=recalcTimestamp)
+
+                        ext = ".otf" if source_font.flavor is None else source_font.get_real_extension()
+                        suffix = "" if source_font.flavor is None else ".otf"
+                        output_file = makeOutputFileName(
+                            file,
+                            suffix=suffix,
+                            extension=ext,
+                            outputDir=get_file_output_dir(file, input_path, output_dir),
+                            overWrite=overWrite,
+                        )
+
+                        fingerprint = get_fingerprint(file) if dedup else None
+                        # The same font may still be waiting for the subroutinizer
+                        while fingerprint is not None and any(p[4] == fingerprint for p in pending):
+                            save_pending_file()
+                        result = results.get(fingerprint)
+                        if result is None:
+                            # Subroutinization runs in background while the next file is converted
+                            future = submit_otf(
+                                source_font,
+                                subroutinizer,
+                                tolerance=tolerance,
+                                max_tolerance=max_tolerance,
+                                safe=safe,
+                                purge_glyphs=purge_glyphs,
+                                subroutinize=subroutinize,
+                                optimize_layout=optimizeLayout,
+                                stats=stats,
+                                **subset,
+                            )
+                            pending.append((file, output_file, t, future, fingerprint))
+                        else:
+                            original_file, data = result
+                            generic_info_message(f"Same font as {os.path.basename(original_file)}")
+                            data = change_flavor(data, source_font.flavor)
+                            job_stats = {"deduplicated_files": 1}
+                            if _save_output(file, output_file, data, writer, checkpoint, stats, job_stats) is not None:
+                                converted_files_counter += 1
+
+                    except Exception as e:
+                        checkpoint.set_failed(file, e)
+                        generic_error_message(e)
+
+                    while pending and (pending[0][3].done() or len(pending) > subroutinizer.max_workers):
+                        save_pending_file()
+
+                while pending:
+                    save_pending_file()
+
+        converted_files_counter -= writer.flush()
 
-            if safe:
-                # Create a temporary OTF file with T2CharStringPen...
-                buf = BytesIO()
-                ttf2otf_converter_temp = TrueTypeToCFF(source_font, output_file=buf)
-                ttf2otf_converter_temp.run(charstrings_source="t2", purge_glyphs=purge_glyphs, subroutinize=False)
-
-                # ... and convert it back to a temporary TTF file that will be used for conversion
-                data = buf.getvalue()
-                temp_otf = Font(BytesIO(data), recalcTimestamp=recalcTimestamp)
-                otf_to_ttf.otf_2_ttf(temp_otf, post_format=2.0, max_err=1.0, reverse_direction=True)
-                input_font = Font(BytesIO(buf.getvalue()), recalcTimestamp=recalcTimestamp)
-            else:
-                input_font = source_font
-
-            ttf2otf_converter = TrueTypeToCFF(font=input_font, output_file=output_file)
-            ttf2otf_converter.run(
-                charstrings_source="qu2cu", tolerance=tolerance, subroutinize=subroutinize, purge_glyphs=purge_glyphs
+        print()
+        generic_info_message(f"Total files       : {counter}")
+        if queueDir is not None:
+            generic_info_message(f"Enqueued files    : {enqueued_files_counter}")
+        generic_info_message(f"Converted files   : {converted_files_counter}")
+        if checkpoint.enabled:
+            generic_info_message(f"Skipped files     : {skipped_files_counter} (checkpoint)")
+        if dedup and queueDir is None:
+            generic_info_message(f"Duplicate files   : {stats.get('deduplicated_files', 0)} (converted once)")
+        generic_info_message(f"Simplified glyphs : {stats.get('simplified_glyphs', 0)}")
+        generic_info_message(f"Skipped glyphs    : {stats.get('skipped_glyphs', 0)} (no overlaps)")
+        generic_info_message(f"Reused outlines   : {stats.get('deduplicated_glyphs', 0)}")
+        if verify:
+            generic_info_message(f"Verified files    : {stats.get('verified_files', 0)}")
+        if fontTimeout is not None or glyphTimeout is not None:
+            generic_info_message(f"Timed out files   : {stats.get('timed_out_files', 0)}")
+        if max_tolerance is not None:
+            generic_info_message(f"Bytes saved       : {stats.get('saved_bytes', 0)} (charstrings, tolerance search)")
+        _print_layout_report(stats)
+        generic_info_message(f"Elapsed time      : {round(time.time() - start_time, 3)} seconds")
+
+    with writer:
+        if watch:
+            watch_input_path(
+                input_path,
+                convert_files,
+                files=files,
+                file_filter=partial(filter_fonts, allow_variable=False, allow_cff=False),
+                debounce=debounce,
+                poll=poll,
+                **discovery,
             )
-
-            converted_files_counter += 1
-            generic_info_message(f"Done in {round(time.time() - t, 3)} seconds")
-            file_saved_message(output_file)
-
-        except Exception as e:
-            generic_error_message(e)
-
-    print()
-    generic_info_message(f"Total files       : {len(files)}")
-    generic_info_message(f"Converted files   : {converted_files_counter}")
-    generic_info_message(f"Elapsed time      : {round(time.time() - start_time, 3)} seconds")
+        else:
+            convert_files(files)
 
 
 @click.group()
@@ -138,41 +683,203 @@ def otf_2_ttf():
 
 @otf_2_ttf.command()
 @add_file_or_path_argument()
+@click.option(
+    "--max-err",
+    "maxErr",
+    type=click.FloatRange(min=0, min_open=True),
+    default=otf_to_ttf.MAX_ERR,
+    show_default=True,
+    help="Maximum distance between the CFF curves and their quadratic approximation, in font units. Low values add "
+    "more points but keep shapes. Use the sweep command to compare values.",
+)
+@add_subset_options()
+@add_layout_options()
+@add_verify_options()
 @add_common_options()
-def otf2ttf(input_path, outputDir=None, recalcTimestamp=False, overWrite=True):
+@add_dedup_options()
+@add_parallel_options()
+@add_queue_options()
+@add_watch_options()
+def otf2ttf(
+    input_path,
+    maxErr=otf_to_ttf.MAX_ERR,
+    unicodes=None,
+    textFile=None,
+    layoutFeatures=None,
+    optimizeLayout=False,
+    verify=False,
+    maxDeviation=MAX_DEVIATION,
+    maxArea=MAX_AREA_RATIO,
+    outputDir=None,
+    outputArchive=None,
+    recalcTimestamp=False,
+    overWrite=True,
+    recursive=False,
+    include=(),
+    exclude=(),
+    checkpointFile=None,
+    ioBuffer=64 << 20,
+    dedup=True,
+    workers=1,
+    memoryBudget=None,
+    fontTimeout=None,
+    glyphTimeout=None,
+    queueDir=None,
+    leaseTimeout=60.0,
+    watch=False,
+    debounce=1.0,
+    poll=False,
+):
     """
     Converts fonts from CFF to TrueType format.
     """
 
-    files = check_input_path(input_path, allow_variable=False, allow_cff=False)
+    discovery = dict(recursive=recursive, include=include, exclude=exclude)
+    isolated = workers > 1 or queueDir is not None or fontTimeout is not None or glyphTimeout is not None
+    # Worker processes read their own files: files read ahead would be copied to them
+    files = check_input_path(
+        input_path,
+        allow_variable=False,
+        allow_ttf=False,
+        allow_empty=watch or queueDir is not None,
+        prefetch=0 if isolated else ioBuffer,
+        **discovery,
+    )
+    check_output_archive(outputArchive, watch=watch, checkpoint_file=checkpointFile)
+    check_queue_dir(queueDir, input_path, outputArchive, watch=watch, checkpoint_file=checkpointFile, workers=workers)
     output_dir = check_output_dir(input_path=input_path, output_path=outputDir)
+    checkpoint = Checkpoint(checkpointFile, command="otf2ttf")
+    # Queue jobs are recorded as done once their output is saved
+    writer = _get_writer(output_dir, outputArchive, overWrite, io_buffer=0 if queueDir is not None else ioBuffer)
+    subset = dict(unicodes=get_subset_unicodes(unicodes, textFile), layout_features=layoutFeatures)
+    scheduled = workers > 1 or fontTimeout is not None or glyphTimeout is not None
+    verification = _get_verification(verify, maxDeviation, maxArea, scheduled)
+
+    def convert_files(files: Iterable[str]):
+        start_time = time.time()
+        counter = 0
+        converted_files = 0
+        skipped_files = 0
+        enqueued_files = 0
+        stats = {}
+        results = ResultCache()
+
+        if queueDir is not None:
+            with JobQueue(queueDir, command="otf2ttf", lease_timeout=leaseTimeout) as queue:
+                counter, enqueued_files, converted_files = _convert_files_from_queue(
+                    files,
+                    target="ttf",
+                    queue=queue,
+                    writer=writer,
+                    stats=stats,
+                    input_path=input_path,
+                    output_dir=output_dir,
+                    recalc_timestamp=recalcTimestamp,
+                    overwrite=overWrite,
+                    max_err=maxErr,
+                    optimize_layout=optimizeLayout,
+                    verify=verification,
+                    font_timeout=fontTimeout,
+                    glyph_timeout=glyphTimeout,
+                    **subset,
+                )
+        elif isolated:
+            counter, converted_files, skipped_files = _convert_files_in_parallel(
+                files,
+                target="ttf",
+                checkpoint=checkpoint,
+                writer=writer,
+                workers=workers,
+                memory_budget=memoryBudget,
+                font_timeout=fontTimeout,
+                glyph_timeout=glyphTimeout,
+                stats=stats,
+                input_path=input_path,
+                output_dir=output_dir,
+                recalc_timestamp=recalcTimestamp,
+                overwrite=overWrite,
+                max_err=maxErr,
+                optimize_layout=optimizeLayout,
+                verify=verification,
+                dedup=dedup,
+                **subset,
+            )
+        else:
+            for file in files:
+                t = time.time()
+                counter += 1
 
-    start_time = time.time()
-    counter = 0
-    converted_files = 0
+                if checkpoint.is_done(file):
+                    skipped_files += 1
+                    generic_info_message(f"Skipping file {counter}: {os.path.basename(file)} (already converted)")
+                    continue
 
-    for file in files:
-        t = time.time()
-        counter += 1
+                generic_info_message(f"Converting file {counter}: {os.path.basename(file)}")
+                try:
+                    font = Font(file, recalcTimestamp=recalcTimestamp)
+                    suffix = "" if font.flavor is None else ".ttf"
+                    fingerprint = get_fingerprint(file) if dedup else None
+                    result = results.get(fingerprint)
+                    if result is None:
+                        data = to_ttf(font, max_err=maxErr, stats=stats, optimize_layout=optimizeLayout, **subset)
+                        if verification is not None:
+                            _verify_output(file, data, stats, **verification)
+                    else:
+                        original_file, data = result
+                        generic_info_message(f"Same font as {os.path.basename(original_file)}")
+                        data = change_flavor(data, font.flavor)
+                    output_file = makeOutputFileName(
+                        file,
+                        suffix=suffix,
+                        extension=get_extension(data),
+                        outputDir=get_file_output_dir(file, input_path, output_dir),
+                        overWrite=overWrite,
+                    )
+                except Exception as e:
+                    checkpoint.set_failed(file, e)
+                    generic_error_message(e)
+                    continue
 
-        generic_info_message(f"Converting file {counter} of {len(files)}")
-        try:
-            output_file = makeOutputFileName(file, outputDir=output_dir, overWrite=overWrite, extension=".ttf")
-            otf_to_ttf.run(
-                input_file=file,
-                output_file=output_file,
-                recalc_timestamp=recalcTimestamp,
-            )
-            converted_files += 1
-            generic_info_message(f"Done in {round(time.time() - t, 3)}")
-            file_saved_message(output_file)
-        except Exception as e:
-            generic_error_message(e)
+                job_stats = None if result is None else {"deduplicated_files": 1}
+                done_message = f"Done in {round(time.time() - t, 3)}"
+                saved_file = _save_output(file, output_file, data, writer, checkpoint, stats, job_stats, done_message)
+                if saved_file is not None:
+                    converted_files += 1
+                    if result is None:
+                        results.put(fingerprint, file, data, len(data))
 
-    print()
-    generic_info_message(f"Total files       : {len(files)}")
-    generic_info_message(f"Converted files   : {converted_files}")
-    generic_info_message(f"Elapsed time      : {round(time.time() - start_time, 3)} seconds")
+        converted_files -= writer.flush()
+
+        print()
+        generic_info_message(f"Total files       : {counter}")
+        if queueDir is not None:
+            generic_info_message(f"Enqueued files    : {enqueued_files}")
+        generic_info_message(f"Converted files   : {converted_files}")
+        if checkpoint.enabled:
+            generic_info_message(f"Skipped files     : {skipped_files} (checkpoint)")
+        if dedup and queueDir is None:
+            generic_info_message(f"Duplicate files   : {stats.get('deduplicated_files', 0)} (converted once)")
+        generic_info_message(f"Reused outlines   : {stats.get('deduplicated_glyphs', 0)}")
+        if verify:
+            generic_info_message(f"Verified files    : {stats.get('verified_files', 0)}")
+        if fontTimeout is not None or glyphTimeout is not None:
+            generic_info_message(f"Timed out files   : {stats.get('timed_out_files', 0)}")
+        _print_layout_report(stats)
+        generic_info_message(f"Elapsed time      : {round(time.time() - start_time, 3)} seconds")
+
+    with writer:
+        if watch:
+            watch_input_path(
+                input_path,
+                convert_files,
+                files=files,
+                file_filter=partial(filter_fonts, allow_variable=False, allow_ttf=False),
+                debounce=debounce,
+                poll=poll,
+                **discovery,
+            )
+        else:
+            convert_files(files)
 
 
 @click.group()
@@ -200,38 +907,95 @@ def web_to_sfnt():
               """,
 )
 @add_common_options()
+@add_thread_options()
+@add_watch_options()
 def wf2ft(
     input_path,
     flavor=None,
     delete_source_file=False,
     outputDir=None,
+    outputArchive=None,
     recalcTimestamp=False,
     overWrite=True,
+    recursive=False,
+    include=(),
+    exclude=(),
+    checkpointFile=None,
+    ioBuffer=64 << 20,
+    threads=1,
+    watch=False,
+    debounce=1.0,
+    poll=False,
 ):
     """
     Converts web fonts (WOFF and WOFF2) to SFNT fonts (TTF or OTF).
     """
 
-    files = check_input_path(input_path, allow_variable=False, allow_cff=False)
+    discovery = dict(recursive=recursive, include=include, exclude=exclude)
+    files = check_input_path(
+        input_path, allow_extensions=[".woff", ".woff2"], allow_empty=watch, prefetch=ioBuffer, **discovery
+    )
+    check_output_archive(outputArchive, watch=watch, checkpoint_file=checkpointFile)
     output_dir = check_output_dir(input_path=input_path, output_path=outputDir)
-
-    for file in files:
-        try:
-            web_font = Font(file, recalcTimestamp=recalcTimestamp)
-            if web_font.flavor is None:
+    checkpoint = Checkpoint(checkpointFile, command="wf2ft")
+    # Source files are only deleted once their output is saved
+    writer = _get_writer(output_dir, outputArchive, overWrite, io_buffer=0 if delete_source_file else ioBuffer)
+
+    def convert_file(file: str) -> Optional[bytes]:
+        # Runs in the worker threads. Returns None if the file was already converted, or b"" if it's skipped
+        if checkpoint.is_done(file):
+            return None
+        web_font = Font(file, recalcTimestamp=recalcTimestamp)
+        if web_font.flavor is None:
+            return b""
+        if flavor is not None:
+            if web_font.flavor != flavor:
+                return b""
+        return to_sfnt(web_font)
+
+    def convert_files(files: Iterable[str]):
+        # Output files are named, saved and recorded here, in input order
+        for file, data, error in map_in_threads(convert_file, files, threads=threads):
+            if data is None and error is None:
+                generic_info_message(f"Skipping {os.path.basename(file)} (already converted)")
                 continue
-            if flavor is not None:
-                if web_font.flavor != flavor:
+            try:
+                if error is not None:
+                    raise error
+                if not data:
                     continue
-            web_font.flavor = None
-            extension = web_font.get_real_extension()
-            desktop_font_file = makeOutputFileName(file, extension=extension, outputDir=output_dir, overWrite=overWrite)
-            web_font.save(desktop_font_file, reorderTables=False)
-            if delete_source_file:
-                os.remove(file)
-            file_saved_message(desktop_font_file)
-        except Exception as e:
-            generic_error_message(e)
+                extension = get_extension(data)
+                desktop_font_file = makeOutputFileName(
+                    file,
+                    extension=extension,
+                    outputDir=get_file_output_dir(file, input_path, output_dir),
+                    overWrite=overWrite,
+                )
+                record = OutputRecord(file, checkpoint, writer)
+                if delete_source_file and not isinstance(file, ArchiveMember):
+                    # The source file is deleted once its conversion is saved
+                    record.on_done = partial(os.remove, file)
+                desktop_font_file = record.write(desktop_font_file, data)
+                record.close()
+                file_saved_message(desktop_font_file)
+            except Exception as e:
+                checkpoint.set_failed(file, e)
+                generic_error_message(e)
+        writer.flush()
+
+    with writer:
+        if watch:
+            watch_input_path(
+                input_path,
+                convert_files,
+                files=files,
+                file_filter=partial(filter_fonts, allow_extensions=[".woff", ".woff2"]),
+                debounce=debounce,
+                poll=poll,
+                **discovery,
+            )
+        else:
+            convert_files(files)
 
 
 @click.group()
@@ -250,32 +1014,101 @@ def sfnt_to_web():
               fonts. Use this option to create only woff (--flavor woff) or woff2 (--flavor woff2) files.
               """,
 )
+@add_layout_options()
 @add_common_options()
-def ft2wf(input_path, flavor=None, outputDir=None, recalcTimestamp=False, overWrite=True):
+@add_thread_options()
+@add_watch_options()
+def ft2wf(
+    input_path,
+    flavor=None,
+    optimizeLayout=False,
+    outputDir=None,
+    outputArchive=None,
+    recalcTimestamp=False,
+    overWrite=True,
+    recursive=False,
+    include=(),
+    exclude=(),
+    checkpointFile=None,
+    ioBuffer=64 << 20,
+    threads=1,
+    watch=False,
+    debounce=1.0,
+    poll=False,
+):
     """
     Converts SFNT fonts (TTF or OTF) to web fonts (WOFF and WOFF2).
     """
 
-    files = check_input_path(input_path, allow_variable=False, allow_cff=False)
+    discovery = dict(recursive=recursive, include=include, exclude=exclude)
+    files = check_input_path(
+        input_path, allow_extensions=[".ttf", ".otf"], allow_empty=watch, prefetch=ioBuffer, **discovery
+    )
+    check_output_archive(outputArchive, watch=watch, checkpoint_file=checkpointFile)
     output_dir = check_output_dir(input_path=input_path, output_path=outputDir)
+    checkpoint = Checkpoint(checkpointFile, command="ft2wf")
+    writer = _get_writer(output_dir, outputArchive, overWrite, ioBuffer)
 
     output_flavors = ["woff", "woff2"]
     if flavor is not None:
         output_flavors = [flavor]
 
-    for file in files:
-        try:
-            font = Font(file, recalcTimestamp=recalcTimestamp)
-            if font.flavor is not None:
+    def convert_file(file: str) -> Optional[Tuple[List[bytes], dict]]:
+        # Runs in the worker threads. Returns None if the file was already converted
+        if checkpoint.is_done(file):
+            return None
+        font = Font(file, recalcTimestamp=recalcTimestamp)
+        stats = {}
+        if font.flavor is not None:
+            return [], stats
+        if optimizeLayout:
+            # Once for all the flavors
+            optimize_layout_tables(font, stats=stats)
+        return [to_web(font, flavor=flavor) for flavor in output_flavors], stats
+
+    def convert_files(files: Iterable[str]):
+        # Output files are named, saved and recorded here, in input order
+        for file, result, error in map_in_threads(convert_file, files, threads=threads):
+            if result is None and error is None:
+                generic_info_message(f"Skipping {os.path.basename(file)} (already converted)")
                 continue
-            for flavor in output_flavors:
-                font.flavor = flavor
-                extension = font.get_real_extension()
-                web_font_file = makeOutputFileName(file, extension=extension, outputDir=output_dir, overWrite=overWrite)
-                font.save(web_font_file, reorderTables=False)
-                file_saved_message(web_font_file)
-        except Exception as e:
-            generic_error_message(e)
+            try:
+                if error is not None:
+                    raise error
+                web_fonts_data, stats = result
+                if not web_fonts_data:
+                    continue
+                _print_layout_report(stats)
+                record = OutputRecord(file, checkpoint, writer)
+                for data in web_fonts_data:
+                    extension = get_extension(data)
+                    web_font_file = makeOutputFileName(
+                        file,
+                        extension=extension,
+                        outputDir=get_file_output_dir(file, input_path, output_dir),
+                        overWrite=overWrite,
+                    )
+                    web_font_file = record.write(web_font_file, data)
+                    file_saved_message(web_font_file)
+                record.close()
+            except Exception as e:
+                checkpoint.set_failed(file, e)
+                generic_error_message(e)
+        writer.flush()
+
+    with writer:
+        if watch:
+            watch_input_path(
+                input_path,
+                convert_files,
+                files=files,
+                file_filter=partial(filter_fonts, allow_extensions=[".ttf", ".otf"]),
+                debounce=debounce,
+                poll=poll,
+                **discovery,
+            )
+        else:
+            convert_files(files)
 
 
 @click.group()
@@ -286,51 +1119,104 @@ def ttc_to_sfnt():
 @ttc_to_sfnt.command()
 @add_file_or_path_argument()
 @add_common_options()
-def ttc2sfnt(input_path, outputDir=None, recalcTimestamp=False, overWrite=True):
+@add_thread_options()
+@add_watch_options()
+def ttc2sfnt(
+    input_path,
+    outputDir=None,
+    outputArchive=None,
+    recalcTimestamp=False,
+    overWrite=True,
+    recursive=False,
+    include=(),
+    exclude=(),
+    checkpointFile=None,
+    ioBuffer=64 << 20,
+    threads=1,
+    watch=False,
+    debounce=1.0,
+    poll=False,
+):
     """
     Extracts each font from a TTC file, and saves it as a TTF or OTF file.
     """
 
-    if os.path.isfile(input_path):
-        files = [input_path]
-    elif os.path.isdir(input_path):
-        files = [os.path.join(input_path, file) for file in os.listdir(input_path)]
-    else:
-        generic_error_message(f"Invalid path: {input_path}")
-        return
+    discovery = dict(recursive=recursive, include=include, exclude=exclude)
 
-    ttc_files = []
-    for file in files:
-        try:
-            ttc_font = TTCollection(file)
-            ttc_files.append(file)
-            ttc_font.close()
-        except TTLibError:
-            pass
+    def get_ttc_files(files: Iterable[str]) -> Iterator[str]:
+        for file in files:
+            try:
+                ttc_font = TTCollection(open_input(file))
+                ttc_font.close()
+            except TTLibError:
+                continue
+            yield file
 
-    if len(ttc_files) == 0:
+    ttc_files = get_ttc_files(prefetch_files(iter_files(input_path, **discovery), ioBuffer))
+    first_ttc_file = next(ttc_files, None)
+    if first_ttc_file is None:
         generic_error_message(f"No valid .ttc font files found in {input_path}.")
-        return
+        if not watch:
+            return
+    else:
+        ttc_files = chain([first_ttc_file], ttc_files)
 
+    check_output_archive(outputArchive, watch=watch, checkpoint_file=checkpointFile)
     output_dir = check_output_dir(input_path=input_path, output_path=outputDir)
-
-    for ttc_file in ttc_files:
-        try:
-            ttc_font = TTCollection(ttc_file)
-            for font in ttc_font.fonts:
-                font.recalcTimestamp = recalcTimestamp
-                file_name = font.name_table.getDebugName(6)
-                extension = ".otf" if font.sfntVersion == "OTTO" else ".ttf"
-                output_file = makeOutputFileName(
-                    file_name,
-                    extension=extension,
-                    outputDir=output_dir,
-                    overWrite=overWrite,
-                )
-                font.save(output_file)
-                file_saved_message(output_file)
-        except Exception as e:
-            generic_error_message(e)
+    checkpoint = Checkpoint(checkpointFile, command="ttc2sfnt")
+    writer = _get_writer(output_dir, outputArchive, overWrite, ioBuffer)
+
+    def convert_file(ttc_file: str) -> Optional[List[Tuple[str, bytes]]]:
+        # Runs in the worker threads. Returns the (file name, data) of each font, or None if the collection was already
+        # converted
+        if checkpoint.is_done(ttc_file):
+            return None
+        with open_input(ttc_file) as f:
+            ttc_data = f.read()
+        fonts = []
+        for font_number in range(get_font_count(ttc_data)):
+            font = load_font(ttc_data, font_number=font_number, recalc_timestamp=recalcTimestamp)
+            fonts.append((sanitize_filename(font.name_table.getDebugName(6)), to_sfnt(font)))
+        return fonts
+
+    def convert_files(ttc_files: Iterable[str]):
+        # Output files are named, saved and recorded here, in input order
+        for ttc_file, fonts, error in map_in_threads(convert_file, ttc_files, threads=threads):
+            if fonts is None and error is None:
+                generic_info_message(f"Skipping {os.path.basename(ttc_file)} (already converted)")
+                continue
+            try:
+                if error is not None:
+                    raise error
+                record = OutputRecord(ttc_file, checkpoint, writer)
+                for file_name, data in fonts:
+                    output_file = makeOutputFileName(
+                        file_name,
+                        extension=get_extension(data),
+                        outputDir=get_file_output_dir(ttc_file, input_path, output_dir),
+                        overWrite=overWrite,
+                    )
+                    output_file = record.write(output_file, data)
+                    file_saved_message(output_file)
+                record.close()
+            except Exception as e:
+                checkpoint.set_failed(ttc_file, e)
+                generic_error_message(e)
+        writer.flush()
+
+    with writer:
+        if watch:
+            watch_input_path(
+                input_path,
+                convert_files,
+                files=ttc_files,
+                file_filter=get_ttc_files,
+                debounce=debounce,
+                poll=poll,
+                **discovery,
+            )
+        else:
+            convert_files(ttc_files)
 
 
 @click.group()
@@ -354,6 +1240,7 @@ def variable_to_static():
     "--no-cleanup",
     "cleanup",
     is_flag=True,
+    flag_value=False,
     default=True,
     help="""
               By default, STAT table is dropped and axis nameIDs are deleted from name table. Use --no-cleanup to keep
@@ -368,115 +1255,403 @@ def variable_to_static():
               Tables.
               """,
 )
+@add_subset_options()
+@add_layout_options()
 @add_common_options()
+@add_dedup_options()
+@add_watch_options()
 def var2static(
     input_path,
     select_instance=False,
     cleanup=True,
     update_name_table=False,
+    unicodes=None,
+    textFile=None,
+    layoutFeatures=None,
+    optimizeLayout=False,
     outputDir=None,
+    outputArchive=None,
     recalcTimestamp=False,
     overWrite=True,
+    recursive=False,
+    include=(),
+    exclude=(),
+    checkpointFile=None,
+    ioBuffer=64 << 20,
+    dedup=True,
+    watch=False,
+    debounce=1.0,
+    poll=False,
 ):
     """
     Exports static instances from variable fonts.
     """
 
-    files = check_input_path(input_path, allow_variable=False, allow_cff=False)
+    discovery = dict(recursive=recursive, include=include, exclude=exclude)
+    files = check_input_path(input_path, allow_static=False, allow_empty=watch, prefetch=ioBuffer, **discovery)
+    check_output_archive(outputArchive, watch=watch, checkpoint_file=checkpointFile)
     output_dir = check_output_dir(input_path=input_path, output_path=outputDir)
+    checkpoint = Checkpoint(checkpointFile, command="var2static")
+    writer = _get_writer(output_dir, outputArchive, overWrite, ioBuffer)
+    subset_unicodes = get_subset_unicodes(unicodes, textFile)
+
+    def convert_files(files: Iterable[str]):
+        start_time = time.time()
+        # The instances exported from each font: (file, [(instance file name, data), ...]). Instances selected
+        # interactively are chosen again for each file
+        results = ResultCache()
+        deduplicated_files = 0
+        for file in files:
+            print()
+            if checkpoint.is_done(file):
+                generic_info_message(f"Skipping file {os.path.basename(file)} (already converted)")
+                continue
+            generic_info_message(f"Converting file {os.path.basename(file)}")
+            try:
+                fingerprint = get_fingerprint(file) if dedup and not select_instance else None
+                result = results.get(fingerprint)
+                if result is not None:
+                    original_file, exported_instances = result
+                    generic_info_message(f"Same font as {os.path.basename(original_file)}")
+                    flavor = get_file_flavor(file)
+                    record = OutputRecord(file, checkpoint, writer)
+                    for static_font_file_name, data in exported_instances:
+                        data = change_flavor(data, flavor)
+                        output_file = makeOutputFileName(
+                            static_font_file_name,
+                            outputDir=get_file_output_dir(file, input_path, output_dir),
+                            extension=get_extension(data),
+                            overWrite=overWrite,
+                        )
+                        output_file = record.write(output_file, data)
+                        file_saved_message(output_file)
+                    record.close()
+                    deduplicated_files += 1
+                    continue
 
-    start_time = time.time()
-    for file in files:
-        print()
-        generic_info_message(f"Converting file {os.path.basename(file)}")
-        try:
-            variable_font = Font(file, recalcTimestamp=recalcTimestamp)
-            axes = variable_font.get_axes()
-            instances = variable_font.get_instances()
-
-            update_this_font_name_table = update_name_table
+                variable_font = Font(file, recalcTimestamp=recalcTimestamp)
+                if subset_unicodes is not None or layoutFeatures is not None:
+                    # Subset once, before all the instances are exported
+                    removed_glyphs = variable_font.subset(unicodes=subset_unicodes, layout_features=layoutFeatures)
+                    generic_info_message(f"Removed {removed_glyphs} glyphs (subset)")
+                axes = variable_font.get_axes()
+                instances = variable_font.get_instances()
+
+                update_this_font_name_table = update_name_table
+
+                if select_instance:
+                    selected_coordinates = select_instance_coordinates(axes)
+                    is_named_instance = selected_coordinates in [i.coordinates for i in instances]
+                    if not is_named_instance:
+                        # Set update_name_table value to False because we won't find this Axis Value in the STAT table.
+                        update_this_font_name_table = False
+                        selected_instance = NamedInstance()
+                        selected_instance.coordinates = selected_coordinates
+                    else:
+                        # In case there are several instances with the same coordinates, return only the first one.
+                        #
+                        # From https://learn.microsoft.com/en-us/typography/opentype/spec/fvar#instancerecord:
+                        #
+                        # All the instance records in a font should have distinct coordinates and distinct
+                        # subfamilyNameID and postScriptName ID values. If two or more records share the same
+                        # coordinates, the same nameID values or the same postScriptNameID values, then all but the
+                        # first can be ignored.
+                        selected_instance = [i for i in instances if i.coordinates == selected_coordinates][0]
+
+                    instances = [selected_instance]
+
+                if len(instances) == 0:
+                    generic_error_message("No instances found")
+                    continue
 
-            if select_instance:
-                selected_coordinates = select_instance_coordinates(axes)
-                is_named_instance = selected_coordinates in [i.coordinates for i in instances]
-                if not is_named_instance:
-                    # Set update_name_table value to False because we won't find this Axis Value in the STAT table.
+                # Cannot update name table if there is no STAT table.
+                if "STAT" not in variable_font:
                     update_this_font_name_table = False
-                    selected_instance = NamedInstance()
-                    selected_instance.coordinates = selected_coordinates
-                else:
-                    # In case there are several instances with the same coordinates, return only the first one.
-                    #
-                    # From https://learn.microsoft.com/en-us/typography/opentype/spec/fvar#instancerecord:
-                    #
-                    # All the instance records in a font should have distinct coordinates and distinct
-                    # subfamilyNameID and postScriptName ID values. If two or more records share the same coordinates,
-                    # the same nameID values or the same postScriptNameID values, then all but the first can be ignored.
-                    selected_instance = [i for i in instances if i.coordinates == selected_coordinates][0]
-
-                instances = [selected_instance]
-
-            if len(instances) == 0:
-                generic_error_message("No instances found")
-                return
+                    generic_warning_message("Cannot update name table if there is no STAT table.")
+
+                # Cannot update name table if there are no STAT Axis Values.
+                if update_this_font_name_table:
+                    if not hasattr(variable_font["STAT"].table, "AxisValueArray"):
+                        update_this_font_name_table = False
+                        generic_warning_message("Cannot update name table if there are no STAT Axis Values.")
+
+                instance_count = 0
+                record = OutputRecord(file, checkpoint, writer)
+                exported_instances = []
+
+                for instance in instances:
+                    t = time.time()
+                    instance_count += 1
+
+                    print()
+                    generic_info_message(f"Exporting instance {instance_count} of {len(instances)}")
+                    stats = {}
+                    data = to_static(
+                        variable_font,
+                        coordinates=instance.coordinates,
+                        cleanup=cleanup,
+                        update_name_table=update_this_font_name_table,
+                        optimize_layout=optimizeLayout,
+                        stats=stats,
+                    )
+
+                    static_font_file_name = sanitize_filename(variable_font.get_static_instance_file_name(instance))
+                    output_file = makeOutputFileName(
+                        static_font_file_name,
+                        outputDir=get_file_output_dir(file, input_path, output_dir),
+                        extension=get_extension(data),
+                        overWrite=overWrite,
+                    )
+
+                    output_file = record.write(output_file, data)
+                    exported_instances.append((static_font_file_name, data))
+                    _print_layout_report(stats)
+                    generic_info_message(f"Done in {round(time.time() - t, 3)} seconds")
+                    file_saved_message(output_file)
+
+                record.close()
+                results.put(fingerprint, file, exported_instances, sum(len(data) for _, data in exported_instances))
 
-            name_ids_to_delete = []
-            if cleanup:
-                name_ids_to_delete = variable_font.get_var_name_ids_to_delete()
+                print()
+                generic_info_message(f"Total instances : {len(instances)}")
+                generic_info_message(f"Elapsed time    : {round(time.time() - start_time)} seconds")
 
-            instance_count = 0
+            except Exception as e:
+                checkpoint.set_failed(file, e)
+                generic_error_message(e)
+        writer.flush()
 
-            # Cannot update name table if there is no STAT table.
-            if "STAT" not in variable_font:
-                update_this_font_name_table = False
-                generic_warning_message("Cannot update name table if there is no STAT table.")
+        if dedup and not select_instance:
+            print()
+            generic_info_message(f"Duplicate files : {deduplicated_files} (converted once)")
+
+    with writer:
+        if watch:
+            watch_input_path(
+                input_path,
+                convert_files,
+                files=files,
+                file_filter=partial(filter_fonts, allow_static=False),
+                debounce=debounce,
+                poll=poll,
+                **discovery,
+            )
+        else:
+            convert_files(files)
 
-            # Cannot update name table if there are no STAT Axis Values.
-            if update_this_font_name_table:
-                if not hasattr(variable_font["STAT"], "AxisValueArray"):
-                    update_this_font_name_table = False
-                    generic_warning_message("Cannot update name table if there are no STAT Axis Values.")
 
-            for instance in instances:
-                t = time.time()
-                instance_count += 1
+@click.group()
+def verify_outlines():
+    pass
 
-                print()
-                generic_info_message(f"Exporting instance {instance_count} of {len(instances)}")
-                static_font: Font = instantiateVariableFont(
-                    varfont=variable_font,
-                    axisLimits=instance.coordinates,
-                    inplace=False,
-                    optimize=True,
-                    overlap=OverlapMode.REMOVE_AND_IGNORE_ERRORS,
-                    updateFontNames=update_this_font_name_table,
-                )
 
-                if cleanup:
-                    static_font.name_table.del_names(name_ids=name_ids_to_delete)
-                    if "STAT" in static_font:
-                        del static_font["STAT"]
-                    static_font.reorder_ui_name_ids()
-
-                static_font_file_name = sanitize_filename(variable_font.get_static_instance_file_name(instance))
-                static_font_ext = static_font.get_real_extension()
-                output_file = makeOutputFileName(
-                    static_font_file_name,
-                    outputDir=output_dir,
-                    extension=static_font_ext,
-                    overWrite=overWrite,
-                )
+@verify_outlines.command()
+@click.argument("source_path", type=click.Path(exists=True, resolve_path=True))
+@click.argument("converted_path", type=click.Path(exists=True, resolve_path=True))
+@add_verify_options(verify_flag=False)
+@click.option(
+    "-j",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes that compare the glyphs of each font.",
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    default=5,
+    show_default=True,
+    help="Number of glyphs with the largest differences printed for each font.",
+)
+@click.option(
+    "-r",
+    "--recursive",
+    is_flag=True,
+    default=False,
+    help="Also compare the fonts in the subfolders of SOURCE_PATH and CONVERTED_PATH.",
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Only compare source files whose name or relative path matches this glob pattern (e.g. '*.ttf'). Can be "
+    "repeated.",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip source files and folders whose name or relative path matches this glob pattern. Can be repeated.",
+)
+def verify(source_path, converted_path, maxDeviation, maxArea, workers, top, recursive, include, exclude):
+    """
+    Compares the outlines of converted fonts with their source fonts, glyph by glyph.
 
-                static_font.save(output_file)
-                generic_info_message(f"Done in {round(time.time() - t, 3)} seconds")
-                file_saved_message(output_file)
+    SOURCE_PATH and CONVERTED_PATH can be two font files, or two folders or zip/tar archives: fonts are then matched by
+    their relative path and their name without extension. Exits with status 1 if a glyph differs more than the
+    thresholds.
+    """
+    start_time = time.time()
+    counter = 0
+    failed_files = 0
+    missing_files = 0
 
-            print()
-            generic_info_message(f"Total instances : {len(instances)}")
-            generic_info_message(f"Elapsed time    : {round(time.time() - start_time)} seconds")
+    for source_file, converted_file in match_converted_fonts(
+        source_path, converted_path, recursive=recursive, include=include, exclude=exclude
+    ):
+        counter += 1
+        print()
+        if converted_file is None:
+            missing_files += 1
+            generic_warning_message(f"{os.path.basename(source_file)}: converted font not found")
+            continue
 
+        generic_info_message(f"Verifying {os.path.basename(source_file)} -> {os.path.basename(converted_file)}")
+        t = time.time()
+        try:
+            with open_input(source_file) as f:
+                source_data = f.read()
+            with open_input(converted_file) as f:
+                converted_data = f.read()
+            report = verify_fonts(
+                source_data, converted_data, workers=workers, max_deviation=maxDeviation, max_area_ratio=maxArea
+            )
         except Exception as e:
+            failed_files += 1
             generic_error_message(e)
+            continue
+
+        for difference in report.get_worst_glyphs(top):
+            generic_info_message(f"  {_format_difference(difference)}")
+        if report.missing_glyphs:
+            generic_info_message(f"Missing glyphs    : {len(report.missing_glyphs)}")
+        if report.passed:
+            generic_success_message(f"{len(report.differences)} glyphs verified in {round(time.time() - t, 3)} seconds")
+        else:
+            failed_files += 1
+            generic_error_message(f"{len(report.failed_glyphs)} of {len(report.differences)} glyphs differ")
+
+    print()
+    generic_info_message(f"Total files       : {counter}")
+    generic_info_message(f"Failed files      : {failed_files}")
+    if missing_files:
+        generic_info_message(f"Missing files     : {missing_files}")
+    generic_info_message(f"Elapsed time      : {round(time.time() - start_time, 3)} seconds")
+    if failed_files:
+        sys.exit(1)
+
+
+@click.group()
+def sweep_parameters():
+    pass
+
 
+@sweep_parameters.command()
+@add_file_or_path_argument()
+@click.option(
+    "-o",
+    "--output-file",
+    "outputFile",
+    type=click.Path(dir_okay=False, resolve_path=True),
+    required=True,
+    help="The file where the results are written: a CSV file, or a JSON file if its extension is .json.",
+)
+@add_sweep_options()
+@click.option(
+    "-j",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes that compare the glyphs of each converted font.",
+)
+@click.option(
+    "-r",
+    "--recursive",
+    is_flag=True,
+    default=False,
+    help="Also process the fonts in the subfolders of INPUT_PATH.",
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Only process files whose name or relative path matches this glob pattern (e.g. '*.ttf'). Can be repeated.",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip files and folders whose name or relative path matches this glob pattern. Can be repeated.",
+)
+def sweep(input_path, outputFile, tolerances, maxErrors, subroutinize, verify, workers, recursive, include, exclude):
+    """
+    Converts fonts with a range of settings, and records the output size, the number of points, the conversion time
+    and the deviation from the source outlines of each setting.
 
-cli = click.CommandCollection(sources=[otf_2_ttf, ttf_2_otf, web_to_sfnt, sfnt_to_web, ttc_to_sfnt, variable_to_static])
+    TrueType fonts are converted to CFF with each of --tolerances, with and without subroutinization. CFF fonts are
+    converted to TrueType with each of --max-errors. The results are written to a CSV or JSON table, with the versions
+    of fontTools, skia-pathops and cffsubr, so that sweeps run before and after an upgrade can be compared.
+    """
+    files = check_input_path(
+        input_path, allow_variable=False, recursive=recursive, include=include, exclude=exclude
+    )
+    subroutinize_values = dict(both=(True, False), on=(True,), off=(False,))[subroutinize]
+    versions = get_versions()
+    generic_info_message(", ".join(f"{name} {version}" for name, version in versions.items()))
+
+    start_time = time.time()
+    rows = []
+    for file in files:
+        print()
+        generic_info_message(f"Sweeping {os.path.basename(file)}")
+        try:
+            with open_input(file) as f:
+                data = f.read()
+            target = "otf" if Font(file).is_true_type else "ttf"
+        except Exception as e:
+            generic_error_message(e)
+            continue
+
+        settings = get_sweep_settings(
+            target, tolerances=tolerances, max_errors=maxErrors, subroutinize=subroutinize_values
+        )
+        for row in sweep_font(data, target, settings, verify=verify, workers=workers):
+            rows.append(dict(file=file, **row))
+            if target == "otf":
+                setting = f"tolerance {row['tolerance']}, subr {'on' if row['subroutinize'] else 'off'}"
+            else:
+                setting = f"max_err {row['max_err']}"
+            if row["error"] is not None:
+                generic_error_message(f"{setting}: {row['error']}")
+                continue
+            message = f"{setting}: {row['size']} bytes, {row['points']} points, {row['time']} seconds"
+            if verify:
+                message += (
+                    f", max deviation {row['max_deviation']}/1000 em, max XOR {round(row['max_area_ratio'] * 100, 2)}%"
+                )
+            generic_info_message(message)
+
+    write_results(rows, outputFile, versions=versions)
+    print()
+    generic_info_message(f"Settings tried    : {len(rows)}")
+    generic_info_message(f"Elapsed time      : {round(time.time() - start_time, 3)} seconds")
+    file_saved_message(outputFile)
+
+
+def _configure_logging():
+    # Runs once, before the command. The root logger is configured, so that the warnings of the converters are printed
+    # as well as those of fontTools
+    configLogger(logger=logging.getLogger())
+
+
+cli = click.CommandCollection(
+    callback=_configure_logging,
+    sources=[
+        otf_2_ttf,
+        ttf_2_otf,
+        web_to_sfnt,
+        sfnt_to_web,
+        ttc_to_sfnt,
+        variable_to_static,
+        verify_outlines,
+        sweep_parameters,
+    ]
+)
@@ -24,6 +24,7 @@ setuptools.setup(
         "click>=8.1.3",
         "pathvalidate>=2.5.2",
     ],
+    extras_require={"numpy": ["numpy"]},
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
@@ -0,0 +1,118 @@
+from array import array
+from io import BytesIO
+
+import pytest
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib.tables import ttProgram
+from fontTools.ttLib.tables._g_l_y_f import Glyph, GlyphCoordinates
+
+from font_converter.Lib import Font as font_module
+from font_converter.Lib.Font import Font
+from font_converter.Lib.coordinates import HAVE_NUMPY, decompose_glyph, recalc_bounds
+
+pytestmark = pytest.mark.skipif(not HAVE_NUMPY, reason="NumPy is not installed")
+
+# Nested composites come first, so that their components aren't decomposed before them
+COMPOSITES = ["nested_scaled", "nested", "offset", "scaled", "flipped"]
+BOUNDS = ("xMin", "yMin", "xMax", "yMax")
+
+
+def _simple_glyph(coordinates, flags, end_pts) -> Glyph:
+    glyph = Glyph()
+    glyph.coordinates = GlyphCoordinates(coordinates)
+    glyph.flags = array("B", flags)
+    glyph.endPtsOfContours = end_pts
+    glyph.numberOfContours = len(end_pts)
+    glyph.program = ttProgram.Program()
+    glyph.program.fromBytecode(b"")
+    return glyph
+
+
+def _composite_glyph(components) -> Glyph:
+    pen = TTGlyphPen({glyph_name: None for glyph_name, _ in components})
+    for glyph_name, transform in components:
+        pen.addComponent(glyph_name, transform)
+    return pen.glyph()
+
+
+def _build_font() -> bytes:
+    glyph_order = [".notdef", "square", "curve"] + COMPOSITES
+    glyphs = {
+        ".notdef": TTGlyphPen(None).glyph(),
+        # A closing point that duplicates the start point, and a single point contour
+        "square": _simple_glyph(
+            [(50, 0), (50, 500), (450, 500), (450, 0), (50, 0), (250, 250)], [1, 1, 1, 1, 1, 1], [4, 5]
+        ),
+        # Contours starting with an off-curve point, and with only off-curve points
+        "curve": _simple_glyph(
+            [(100, 100), (300, 100), (300, 300), (100, 300), (500, 0), (700, 200), (500, 400), (300, 200)],
+            [0, 1, 0, 1, 0, 0, 0, 0],
+            [3, 7],
+        ),
+        "offset": _composite_glyph([("square", (1, 0, 0, 1, 30, -20)), ("curve", (1, 0, 0, 1, 0, 0))]),
+        "scaled": _composite_glyph([("curve", (1.5, 0, 0, 0.5, 10, 0)), ("square", (0.75, 0.25, -0.25, 0.75, 0, 0))]),
+        "flipped": _composite_glyph([("curve", (-1, 0, 0, 1, 800, 0))]),
+        "nested": _composite_glyph([("offset", (1, 0, 0, 1, 15, 5)), ("square", (1, 0, 0, 1, 0, 600))]),
+        "nested_scaled": _composite_glyph([("scaled", (0.5, 0, 0, 1.25, 7, 3)), ("nested", (1, 0, 0, 1, -3, 0))]),
+    }
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({})
+    fb.setupGlyf(glyphs)
+    # lsb different from xMin: the glyph set shifts the outlines of top level components by lsb - xMin
+    metrics = {glyph_name: (800, 0) for glyph_name in glyph_order}
+    metrics["square"] = (800, 20)
+    metrics["curve"] = (800, 130)
+    fb.setupHorizontalMetrics(metrics)
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable(dict(familyName="Test", styleName="Regular", psName="Test-Regular"))
+    fb.setupOS2()
+    fb.setupPost()
+    buf = BytesIO()
+    fb.font.save(buf)
+    return buf.getvalue()
+
+
+def _decomponentize(monkeypatch, numpy: bool) -> dict:
+    monkeypatch.setattr(font_module, "HAVE_NUMPY", numpy)
+    font = Font(BytesIO(_build_font()))
+    font.decomponentize()
+    glyf_table = font["glyf"]
+    return {
+        glyph_name: (
+            list(glyf_table[glyph_name].coordinates),
+            list(glyf_table[glyph_name].flags),
+            list(glyf_table[glyph_name].endPtsOfContours),
+        )
+        for glyph_name in COMPOSITES
+    }
+
+
+def test_decompose_glyph_matches_pens(monkeypatch):
+    font = Font(BytesIO(_build_font()))
+    for glyph_name in COMPOSITES:
+        # Not left to the pens
+        assert decompose_glyph(font["glyf"], font["hmtx"].metrics, font["glyf"][glyph_name]) is not None
+
+    decomposed = _decomponentize(monkeypatch, numpy=True)
+    assert decomposed == _decomponentize(monkeypatch, numpy=False)
+    assert all(coordinates for coordinates, _, _ in decomposed.values())
+
+
+def test_recalc_bounds_matches_glyph(monkeypatch):
+    monkeypatch.setattr(font_module, "HAVE_NUMPY", False)
+    font = Font(BytesIO(_build_font()))
+    font.decomponentize()
+    glyf_table = font["glyf"]
+    # Empty glyphs have no bounds
+    glyph_names = [g for g in font.getGlyphOrder() if glyf_table[g].numberOfContours != 0]
+    for glyph_name in glyph_names:
+        glyf_table[glyph_name].recalcBounds(glyf_table)
+    expected = {g: tuple(getattr(glyf_table[g], attr) for attr in BOUNDS) for g in glyph_names}
+
+    for glyph_name in glyph_names:
+        for attr in BOUNDS:
+            delattr(glyf_table[glyph_name], attr)
+    recalc_bounds(glyf_table, glyph_names)
+    assert {g: tuple(getattr(glyf_table[g], attr) for attr in BOUNDS) for g in glyph_names} == expected
@@ -0,0 +1,83 @@
+from io import BytesIO
+
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables._c_m_a_p import CmapSubtable
+from fontTools.ttLib.tables._k_e_r_n import KernTable_format_0
+
+from font_converter.Lib import glyph_remover
+from font_converter.Lib.api import convert
+from font_converter.Lib.verifier import verify_fonts
+
+
+def _build_font() -> bytes:
+    # A TrueType font with NULL and CR glyphs, a legacy kern table, a Macintosh cmap subtable and GPOS kerning
+    glyph_order = [".notdef", "NULL", "CR", "space", "A", "V"]
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({0x00: "NULL", 0x0D: "CR", 0x20: "space", 0x41: "A", 0x56: "V"})
+    glyphs = {}
+    for glyph_name in glyph_order:
+        pen = TTGlyphPen(None)
+        if glyph_name in (".notdef", "A", "V"):
+            pen.moveTo((100, 0))
+            pen.lineTo((100, 700))
+            pen.lineTo((500, 700))
+            pen.lineTo((500, 0))
+            pen.closePath()
+        glyphs[glyph_name] = pen.glyph()
+    fb.setupGlyf(glyphs)
+    fb.setupHorizontalMetrics({g: (600, 100) for g in glyph_order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable(dict(familyName="Test", styleName="Regular", psName="Test-Regular"))
+    fb.setupOS2()
+    fb.setupPost()
+    fb.addOpenTypeFeatures("feature kern { pos A V -80; pos V A -80; } kern;")
+
+    mac_subtable = CmapSubtable.newSubtable(6)
+    mac_subtable.platformID, mac_subtable.platEncID, mac_subtable.language = 1, 0, 0
+    mac_subtable.cmap = {0x20: "space", 0x41: "A", 0x56: "V"}
+    fb.font["cmap"].tables.append(mac_subtable)
+
+    kern = newTable("kern")
+    kern.version = 0
+    kern_subtable = KernTable_format_0()
+    kern_subtable.version, kern_subtable.coverage, kern_subtable.format = 0, 1, 0
+    kern_subtable.kernTable = {("A", "V"): -80, ("V", "A"): -80, ("A", "NULL"): 10}
+    kern.kernTables = [kern_subtable]
+    fb.font["kern"] = kern
+
+    buf = BytesIO()
+    fb.font.save(buf)
+    return buf.getvalue()
+
+
+def _get_table_sizes(data: bytes) -> dict:
+    font = TTFont(BytesIO(data))
+    return {tag: len(font.reader[tag]) for tag in font.reader.keys()}
+
+
+def test_purge_matches_subsetter(monkeypatch):
+    data = _build_font()
+    fast = _get_table_sizes(convert(data, "otf", subroutinize=False))
+
+    # Forces the Subsetter fallback
+    monkeypatch.setattr(glyph_remover.GlyphRemover, "_plan", lambda self: False)
+    slow = _get_table_sizes(convert(data, "otf", subroutinize=False))
+
+    assert fast == slow
+    assert "kern" not in fast
+
+
+def test_purge_keeps_notdef_outline(monkeypatch):
+    data = _build_font()
+    fast = convert(data, "otf", subroutinize=False)
+
+    monkeypatch.setattr(glyph_remover.GlyphRemover, "_plan", lambda self: False)
+    slow = convert(data, "otf", subroutinize=False)
+
+    for converted in (fast, slow):
+        report = verify_fonts(data, converted)
+        assert report.passed
+        assert report.missing_glyphs == ["NULL", "CR"]
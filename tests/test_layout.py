@@ -0,0 +1,58 @@
+from io import BytesIO
+
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
+
+from font_converter.Lib import layout
+
+
+def _build_font() -> TTFont:
+    # A TrueType font with GPOS kerning, loaded from its compiled data
+    glyph_order = [".notdef", "A", "V", "W"]
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({0x41: "A", 0x56: "V", 0x57: "W"})
+    fb.setupGlyf({glyph_name: TTGlyphPen(None).glyph() for glyph_name in glyph_order})
+    fb.setupHorizontalMetrics({g: (600, 0) for g in glyph_order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable(dict(familyName="Test", styleName="Regular", psName="Test-Regular"))
+    fb.setupOS2()
+    fb.setupPost()
+    fb.addOpenTypeFeatures("feature kern { pos A V -80; pos A W -60; pos V A -80; } kern;")
+    buf = BytesIO()
+    fb.font.save(buf)
+    buf.seek(0)
+    return TTFont(buf)
+
+
+def _add_unused_lookup(font: TTFont, level: int):
+    # Makes GPOS larger instead of compacting it
+    lookups = font["GPOS"].table.LookupList
+    lookups.Lookup.append(lookups.Lookup[0])
+    lookups.LookupCount += 1
+
+
+def test_decompiled_table_restored_if_not_smaller(monkeypatch):
+    font = _build_font()
+    # Decompiled before optimization, like after subsetting
+    font["GPOS"].ensureDecompiled()
+    data_before = font["GPOS"].compile(font)
+
+    monkeypatch.setattr(layout, "compact", _add_unused_lookup)
+    report = layout.optimize_layout(font)
+
+    assert font["GPOS"].compile(font) == data_before
+    assert report["GPOS"] == (len(font.reader["GPOS"]), len(data_before))
+
+
+def test_size_before_is_file_size():
+    font = _build_font()
+    # Changed before optimization, like after subsetting: the A W pair is removed
+    font["GPOS"].ensureDecompiled()
+    pair_set = font["GPOS"].table.LookupList.Lookup[0].SubTable[0].PairSet[0]
+    pair_set.PairValueRecord = pair_set.PairValueRecord[:1]
+    pair_set.PairValueCount = 1
+    report = layout.optimize_layout(font)
+    assert report["GPOS"][0] == len(font.reader["GPOS"])
+    assert report["GPOS"][1] == len(font["GPOS"].compile(font)) < len(font.reader["GPOS"])
@@ -0,0 +1,113 @@
+from io import BytesIO
+
+import pathops
+import pytest
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
+
+from font_converter.Lib.Font import Font
+from font_converter.Lib.api import convert
+from font_converter.Lib.converters.ttf_to_otf import TrueTypeToCFF
+from font_converter.Lib.outlines import needs_overlap_removal
+
+# Rectangles: (xMin, yMin, xMax, yMax)
+OUTER = (0, 0, 400, 400)
+INNER = (100, 100, 300, 300)
+
+# Contours as (rectangle, clockwise), by glyph name
+SKIPPED = {
+    "square": [(OUTER, True)],
+    "square_ccw": [(OUTER, False)],
+    "ring": [(OUTER, True), (INNER, False)],
+    "ring_ccw": [(OUTER, False), (INNER, True)],
+    "apart": [((0, 0, 100, 100), True), ((200, 0, 300, 100), True)],
+    "nested_rings": [(OUTER, True), (INNER, False), ((150, 150, 250, 250), True)],
+}
+SIMPLIFIED = {
+    "ring_wrong_winding": [(OUTER, True), (INNER, True)],
+    "nested_rings_wrong_winding": [(OUTER, True), (INNER, False), ((150, 150, 250, 250), False)],
+    "overlap": [((0, 0, 200, 200), True), ((100, 100, 300, 300), True)],
+    "overlap_opposite_winding": [((0, 0, 200, 200), False), ((100, 100, 300, 300), True)],
+    "touch_edge": [((0, 0, 100, 100), True), ((100, 0, 200, 100), True)],
+    "touch_corner": [((0, 0, 100, 100), True), ((100, 100, 200, 200), True)],
+}
+
+
+def _draw(pen, contours):
+    for (x_min, y_min, x_max, y_max), clockwise in contours:
+        points = [(x_min, y_min), (x_min, y_max), (x_max, y_max), (x_max, y_min)]
+        if not clockwise:
+            points.reverse()
+        pen.moveTo(points[0])
+        for point in points[1:]:
+            pen.lineTo(point)
+        pen.closePath()
+
+
+def _path(contours) -> pathops.Path:
+    path = pathops.Path()
+    _draw(path.getPen(), contours)
+    return path
+
+
+def _build_font() -> bytes:
+    glyph_order = [".notdef"] + list(SKIPPED) + list(SIMPLIFIED)
+    glyphs = {}
+    for glyph_name in glyph_order:
+        pen = TTGlyphPen(None)
+        _draw(pen, SKIPPED.get(glyph_name) or SIMPLIFIED.get(glyph_name) or [(OUTER, True)])
+        glyphs[glyph_name] = pen.glyph()
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({})
+    fb.setupGlyf(glyphs)
+    fb.setupHorizontalMetrics({g: (600, 0) for g in glyph_order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable(dict(familyName="Test", styleName="Regular", psName="Test-Regular"))
+    fb.setupOS2()
+    fb.setupPost()
+    buf = BytesIO()
+    fb.font.save(buf)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("glyph_name", SKIPPED)
+def test_no_overlap_removal_needed(glyph_name):
+    assert not needs_overlap_removal(_path(SKIPPED[glyph_name]))
+
+
+@pytest.mark.parametrize("glyph_name", SIMPLIFIED)
+def test_overlap_removal_needed(glyph_name):
+    assert needs_overlap_removal(_path(SIMPLIFIED[glyph_name]))
+
+
+def test_concave_contour_needs_overlap_removal():
+    path = pathops.Path()
+    pen = path.getPen()
+    pen.moveTo((0, 0))
+    pen.lineTo((0, 400))
+    pen.lineTo((200, 100))
+    pen.lineTo((400, 400))
+    pen.lineTo((400, 0))
+    pen.closePath()
+    assert needs_overlap_removal(path)
+
+
+def test_skipped_glyphs_match_simplify():
+    data = _build_font()
+    converter = TrueTypeToCFF(Font(BytesIO(data)), None)
+    converter.get_qu2u_charstrings()
+    # .notdef is a duplicate of "square"
+    assert converter.stats["skipped_glyphs"] == len(SKIPPED)
+    assert converter.stats["simplified_glyphs"] == len(SIMPLIFIED)
+
+    glyph_set = TTFont(BytesIO(convert(data, "otf", subroutinize=False))).getGlyphSet()
+    for glyph_name in glyph_set.keys():
+        converted = pathops.Path()
+        glyph_set[glyph_name].draw(converted.getPen())
+        expected = _path(SKIPPED.get(glyph_name) or SIMPLIFIED.get(glyph_name) or [(OUTER, True)])
+        expected.simplify()
+        assert converted.area == expected.area
+        assert converted.clockwise == expected.clockwise
+        assert pathops.op(converted, expected, pathops.PathOp.XOR).area == 0
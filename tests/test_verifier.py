@@ -0,0 +1,49 @@
+from io import BytesIO
+
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+from font_converter.Lib.verifier import GlyphDifference, verify_fonts
+
+
+def _build_font(offset: int) -> bytes:
+    # A TrueType font whose "shade" glyph is a grid of small squares, moved diagonally by offset units
+    glyph_order = [".notdef", "shade"]
+    pen = TTGlyphPen(None)
+    for i in range(6):
+        for j in range(6):
+            x, y = 40 * i + offset, 40 * j + offset
+            pen.moveTo((x, y))
+            pen.lineTo((x, y + 20))
+            pen.lineTo((x + 20, y + 20))
+            pen.lineTo((x + 20, y))
+            pen.closePath()
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({0x2592: "shade"})
+    fb.setupGlyf({".notdef": TTGlyphPen(None).glyph(), "shade": pen.glyph()})
+    fb.setupHorizontalMetrics({g: (600, 0) for g in glyph_order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable(dict(familyName="Test", styleName="Regular", psName="Test-Regular"))
+    fb.setupOS2()
+    fb.setupPost()
+    buf = BytesIO()
+    fb.font.save(buf)
+    return buf.getvalue()
+
+
+def test_small_shapes_within_deviation_pass():
+    report = verify_fonts(_build_font(0), _build_font(2))
+    (difference,) = [d for d in report.differences if d.glyph_name == "shade"]
+    assert round(difference.deviation, 3) == 2.0
+    # Far above the area ratio, but within what a 2/1000 em deviation can cover
+    assert difference.area_ratio > 0.1
+    assert report.passed
+
+
+def test_xor_area_beyond_deviation_fails():
+    # 20x20 square: an outline within 5 units of it covers at most 5 * 80 units on either side
+    assert not GlyphDifference("a", 1.0, xor_area=400, area=400, length=80).exceeds()
+    assert GlyphDifference("a", 1.0, xor_area=401, area=400, length=80).exceeds()
+    assert GlyphDifference("a", 1.0, xor_area=401, area=400, length=40, units_per_em=2000).exceeds()
+    assert not GlyphDifference("a", 1.0, xor_area=8, area=400).exceeds()